@@ -1,7 +1,17 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from accounts.models import CustomUser
+from .models import OutboundEmail
 
 # Register your models here.
 
 admin.site.register(CustomUser, UserAdmin)
+
+
+class OutboundEmailModel(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
+
+admin.site.register(OutboundEmail, OutboundEmailModel)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RscmsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'RSCMS_app'
+
+    def ready(self):
+        import RSCMS_app.signals
@@ -0,0 +1,117 @@
+"""
+Helpers shared by the benchmark management commands
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+
+
+@contextmanager
+def scratch_database(alias="default"):
+    """
+    Run a benchmark against a freshly migrated throwaway database so it never
+    touches real data. SQLite gets a temp file (not :memory:) so worker
+    threads can open their own connections. Default storage moves to a temp
+    dir too: scratch orders reuse real order ids, and the receipts they
+    pre-render would otherwise land on (and be served as) the real ones.
+    """
+    connection = connections[alias]
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    real_db_existed = connection.vendor == "sqlite" and os.path.exists(old_name)
+    tmpdir = tempfile.mkdtemp(prefix="rscms-bench-")
+    media = os.path.join(tmpdir, "media")
+    storage = override_settings(MEDIA_ROOT=media, STORAGES={
+        **settings.STORAGES,
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage", "OPTIONS": {"location": media}},
+    })
+
+    if connection.vendor == "sqlite":
+        test_settings["NAME"] = os.path.join(tmpdir, "benchmark.sqlite3")
+
+    storage.enable()
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings["NAME"] = old_test_name
+    finally:
+        storage.disable()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        # reconnecting after the swap back creates an empty file where there was no database
+        if connection.vendor == "sqlite" and not real_db_existed and os.path.exists(old_name) \
+                and not os.path.getsize(old_name):
+            connection.close()
+            os.remove(old_name)
+
+
+def seed_supply_chain(orders=20, dealers=2, managers=2, customers=2, successful=0):
+    """
+    Populate a scratch database with users of every role, listings, rice posts
+    and `orders` purchases of each kind, the first `successful` of them marked
+    Successful (with update(), so no stock or receipt signals run). Returns
+    the users keyed by role.
+    """
+    from accounts.models import CustomUser
+    from customer.models import CustomerProfile, Purchase_Rice
+    from dealer.models import DealerProfile, Marketplace, PaddyStock
+    from manager.models import ManagerProfile, Purchase_paddy, PurchaseRice, RicePost
+
+    users = {"admin": [CustomUser.objects.create_user(username="seed_admin", password="seed", role="admin")]}
+
+    users["dealer"] = []
+    listings = []
+    for i in range(dealers):
+        user = CustomUser.objects.create_user(username=f"seed_dealer_{i}", password="seed", role="dealer")
+        dealer = DealerProfile.objects.create(user=user, license_number=f"SEED-{i}", storage_capacity=10**7, district="Guntur")
+        stock = PaddyStock.objects.create(
+            dealer=dealer, name=f"Swarna {i}", quantity=10**6, available_quantity=10**6,
+            moisture_content=Decimal("14.0"), price_per_kg=Decimal("25.00"),
+        )
+        listings.append(Marketplace.objects.create(paddy_stock=stock, dealer=dealer, quantity=10**5, status="Published"))
+        users["dealer"].append(user)
+
+    users["manager"] = []
+    rice_posts = []
+    for i in range(managers):
+        user = CustomUser.objects.create_user(username=f"seed_manager_{i}", password="seed", role="manager")
+        ManagerProfile.objects.create(
+            user=user, full_name=f"Manager {i}", phone_number="01700000000", transaction_password="seed",
+            address="Seed", mill_name=f"Mill {i}", mill_location="Seed",
+        )
+        rice_posts.append(RicePost.objects.create(
+            manager=user, rice_name=f"Sona Masuri {i}", quality="Premium", quantity_kg=10**6,
+            price_per_kg=Decimal("50.00"), description="Seeded",
+        ))
+        users["manager"].append(user)
+
+    users["customer"] = []
+    for i in range(customers):
+        user = CustomUser.objects.create_user(username=f"seed_customer_{i}", password="seed", role="customer")
+        CustomerProfile.objects.create(user=user, full_name=f"Customer {i}", phone_number="01800000000", address="Seed")
+        users["customer"].append(user)
+
+    for n in range(orders):
+        manager = users["manager"][n % managers]
+        other_post = rice_posts[(n + 1) % managers]
+        Purchase_paddy.objects.create(
+            manager=manager, paddy=listings[n % dealers], quantity_purchased=10, total_price=Decimal("250.00"),
+        )
+        PurchaseRice.objects.create(manager=manager, rice=other_post, quantity_purchased=5, total_price=Decimal("250.00"))
+        Purchase_Rice.objects.create(
+            customer=users["customer"][n % customers], rice=rice_posts[n % managers],
+            quantity_purchased=2, total_price=Decimal("100.00"),
+        )
+    for model in (Purchase_paddy, PurchaseRice, Purchase_Rice):
+        first = model.objects.order_by("id").values_list("id", flat=True)[:successful]
+        model.objects.filter(id__in=list(first)).update(status="Successful")
+    return users
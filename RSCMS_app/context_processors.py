@@ -0,0 +1,77 @@
+"""
+Makes the logged in user's profile available in all templates, as `manager`,
+`admin` or `customer` depending on their role.
+
+The profile is a lazy object: pages that never touch it run no query. Once
+loaded it is kept in the session, together with the profile version from the
+shared cache, and reused until RSCMS_app.signals bumps that version on a save
+or delete of the profile.
+"""
+import uuid
+
+from django.conf import settings
+from django.core import serializers
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+from admin_panel.models import AdminProfile
+from customer.models import CustomerProfile
+from manager.models import ManagerProfile
+
+# role: (template variable, profile model)
+ROLE_PROFILES = {
+    "manager": ("manager", ManagerProfile),
+    "admin": ("admin", AdminProfile),
+    "customer": ("customer", CustomerProfile),
+}
+
+# never copied into the session
+SECRET_FIELDS = {"transaction_password", "Transaction_password"}
+
+SESSION_KEY = "_role_profile"
+
+
+def _version_key(user_id):
+    return f"profile_version:{user_id}"
+
+
+def profile_version(user_id):
+    cache = caches[settings.PROFILE_CACHE]
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate_profile(user_id):
+    """Make every session of the user load their profile again."""
+    caches[settings.PROFILE_CACHE].set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def _load_profile(request, model):
+    user = request.user
+    version = profile_version(user.pk)
+    cached = request.session.get(SESSION_KEY)
+    if cached and cached["user"] == user.pk and cached["model"] == model._meta.label and cached["version"] == version:
+        if cached["data"] is None:
+            return None
+        return next(serializers.deserialize("json", cached["data"])).object
+
+    profile = model.objects.filter(user=user).first()
+    data = None
+    if profile is not None:
+        fields = [field.name for field in model._meta.concrete_fields if field.name not in SECRET_FIELDS]
+        data = serializers.serialize("json", [profile], fields=fields)
+    request.session[SESSION_KEY] = {
+        "user": user.pk, "model": model._meta.label, "version": version, "data": data,
+    }
+    return profile
+
+
+def role_profile(request):
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated or user.role not in ROLE_PROFILES:
+        return {}
+    name, model = ROLE_PROFILES[user.role]
+    return {name: SimpleLazyObject(lambda: _load_profile(request, model))}
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from RSCMS_app.models import DailySales
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup from Successful paddy and rice orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date on (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"--since must be a YYYY-MM-DD date, got {options['since']!r}")
+
+        rows = DailySales.rebuild(since=since)
+        scope = f"since {since}" if since else "for all days"
+        self.stdout.write(self.style.SUCCESS(f"✔ Done! {rows} daily sales rows rebuilt {scope}."))
+
+
+# python manage.py backfill_daily_sales [--since 2025-01-01]
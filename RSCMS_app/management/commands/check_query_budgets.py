@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from RSCMS_app.benchmark import scratch_database, seed_supply_chain
+from RSCMS_app.queries import assert_within_budget, budgeted_views
+
+
+class Command(BaseCommand):
+    help = 'Open every @query_budget view against seeded data and fail if one exceeds its query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=60, help='Purchases of each kind to seed (half of them Successful)')
+
+    def handle(self, *args, **options):
+        views = budgeted_views()
+        failures = []
+        setup_test_environment()
+        try:
+            with scratch_database():
+                users = seed_supply_chain(orders=options['orders'], successful=options['orders'] // 2)
+                for role, name in views:
+                    client = Client()
+                    client.force_login(users[role][0])
+                    try:
+                        assert_within_budget(client, reverse(name))
+                    except AssertionError as e:
+                        failures.append(name)
+                        self.stdout.write(self.style.WARNING(f"⚠️ {e}"))
+        finally:
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError(f"{len(failures)} views exceeded their query budget")
+        self.stdout.write(self.style.SUCCESS(f"✔ {len(views)} views within budget."))
+
+
+# python manage.py check_query_budgets [--orders 60]
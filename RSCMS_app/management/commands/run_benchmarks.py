@@ -0,0 +1,346 @@
+import json
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from RSCMS_app.benchmark import scratch_database, seed_supply_chain
+from RSCMS_app.queries import QueryRecorder
+from customer.models import Purchase_Rice
+from dealer.models import DealerProfile, Marketplace, MarketplaceSummary, PaddyPurchaseFromFarmer, PaddyStock
+from manager import search
+from manager.models import PaddyStockOfManager, Purchase_paddy, PurchaseRice, RicePost, RiceStock
+
+BATCH = 5000
+RICE_NAMES = 50
+
+
+class Command(BaseCommand):
+    help = 'Time the model-layer hot paths at several table sizes and save the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Background rows per benchmark')
+        parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Run only these benchmarks')
+        parser.add_argument('--repeat', type=int, default=50, help='Operations timed per benchmark and size')
+        parser.add_argument('--time-budget', type=float, default=20.0, help='Stop repeating an operation after this many seconds')
+        parser.add_argument('--output', help='Result file (default benchmarks/<commit>.json)')
+        parser.add_argument('--compare', help='Earlier result file to compare against')
+
+    def handle(self, *args, **options):
+        commit = _git_commit()
+        results = []
+        setup_test_environment()
+        try:
+            for name in options['only'] or BENCHMARKS:
+                for rows in options['sizes']:
+                    result = self._run(name, rows, options['repeat'], options['time_budget'])
+                    results.append(result)
+                    self.stdout.write(
+                        f"{name:<28} {rows:>7} rows  {result['mean_ms']:>10.2f} ms/op  "
+                        f"p95 {result['p95_ms']:>10.2f} ms  {result['queries_per_op']:>8.1f} queries/op  ({result['ops']} ops)"
+                    )
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'commit': commit,
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'results': results,
+        }
+        output = Path(options['output'] or Path(settings.BASE_DIR) / 'benchmarks' / f'{commit}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"✔ Results saved to {output}"))
+
+        if options['compare']:
+            self._compare(Path(options['compare']), results)
+
+    def _run(self, name, rows, repeat, time_budget):
+        with scratch_database():
+            users = seed_supply_chain(orders=0)
+            benchmark = BENCHMARKS[name](rows, users)
+            repeat = min(repeat, benchmark.get('repeat', repeat))
+
+            timings = []
+            queries = 0
+            started = time.perf_counter()
+            for i in range(repeat):
+                with QueryRecorder() as recorder:
+                    op_started = time.perf_counter()
+                    benchmark['op'](i)
+                    timings.append(time.perf_counter() - op_started)
+                queries += recorder.count
+                if time.perf_counter() - started > time_budget:
+                    break
+
+        total = sum(timings)
+        return {
+            'benchmark': name,
+            'rows': rows,
+            'ops': len(timings),
+            'mean_ms': round(total / len(timings) * 1000, 3),
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(_percentile(timings, 95) * 1000, 3),
+            'queries_per_op': round(queries / len(timings), 1),
+            'rows_per_s': round(benchmark['rows_per_op'] * len(timings) / total) if benchmark.get('rows_per_op') else None,
+        }
+
+    def _compare(self, path, results):
+        if not path.exists():
+            raise CommandError(f"No result file at {path}")
+        baseline = json.loads(path.read_text())
+        before = {(r['benchmark'], r['rows']): r for r in baseline['results']}
+        self.stdout.write(f"\nCompared with {baseline['commit']}:")
+        for result in results:
+            old = before.get((result['benchmark'], result['rows']))
+            # result files from before every benchmark scaled mark the sizes they skipped
+            if not old or old.get('skipped'):
+                continue
+            change = (result['mean_ms'] - old['mean_ms']) / old['mean_ms'] * 100 if old['mean_ms'] else 0
+            line = f"{result['benchmark']:<28} {result['rows']:>7} rows  {old['mean_ms']:>10.2f} -> {result['mean_ms']:>10.2f} ms/op  ({change:+.0f}%)"
+            self.stdout.write(self.style.WARNING(line) if change > 10 else line)
+
+
+# Each benchmark builds `rows` rows of background data and returns the timed operation
+
+def farmer_purchase_save(rows, users):
+    """PaddyPurchaseFromFarmer.save() on a stock that already holds `rows` lots (_sync_stock deltas)."""
+    dealer = DealerProfile.objects.get(user=users['dealer'][0])
+    stock = PaddyStock.objects.create(dealer=dealer, name='Swarna', moisture_category='Medium', moisture_content=Decimal('14.0'))
+    codes = PaddyPurchaseFromFarmer.reserve_reference_codes(dealer, rows)
+    _bulk(PaddyPurchaseFromFarmer, (
+        PaddyPurchaseFromFarmer(
+            dealer=dealer, paddy_stock=stock, farmer_name=f'Farmer {n}', paddy_type='Swarna', quantity=100,
+            purchase_price_per_kg=Decimal('22.00'), moisture_content=Decimal('14.0'), total_cost=Decimal('2200.00'),
+            reference_code=code,
+        ) for n, code in enumerate(codes)
+    ))
+    stock.recalculate()
+    stock.save()
+
+    def op(i):
+        purchase = PaddyPurchaseFromFarmer(
+            dealer=dealer, farmer_name='Bench', paddy_type='Swarna', quantity=100,
+            purchase_price_per_kg=Decimal('23.00'), moisture_content=Decimal('14.0'),
+        )
+        purchase.save()
+        purchase.quantity = 120
+        purchase.save()
+    return {'op': op}
+
+
+def marketplace_save(rows, users):
+    """Listing a new Marketplace post while `rows` listings exist (stock hold, summary and search signals)."""
+    dealer = DealerProfile.objects.get(user=users['dealer'][0])
+    stock = dealer.paddystock_set.get()
+    stock.available_quantity = stock.quantity = 10**9
+    stock.save()
+    _bulk(Marketplace, (
+        Marketplace(paddy_stock=stock, dealer=dealer, name=f'Swarna {n}', quantity=10, moisture_content=Decimal('14.0'),
+                    price_per_kg=Decimal('25.00'), status='Published')
+        for n in range(rows)
+    ))
+    MarketplaceSummary.rebuild()
+    search.rebuild()
+
+    def op(i):
+        Marketplace(paddy_stock=stock, dealer=dealer, quantity=10, status='Published').save()
+    return {'op': op}
+
+
+def signal_paddy_purchase(rows, users):
+    """Purchase_paddy turning Successful: update_paddy_stock_of_manager with `rows` past purchases."""
+    manager = users['manager'][0]
+    listing = Marketplace.objects.first()
+    _bulk(PaddyStockOfManager, (
+        PaddyStockOfManager(manager=manager, paddy_name=f'Paddy {n}', moisture_content=Decimal('14.0'),
+                            total_quantity=100, total_price=Decimal('2500.00'), average_price_per_kg=Decimal('25.00'))
+        for n in range(rows // 100)
+    ))
+    _bulk(Purchase_paddy, (
+        Purchase_paddy(manager=manager, paddy=listing, quantity_purchased=10, total_price=Decimal('250.00'), status='Successful')
+        for _ in range(rows)
+    ))
+    pending = list(Purchase_paddy.objects.bulk_create(
+        Purchase_paddy(manager=manager, paddy=listing, quantity_purchased=10, total_price=Decimal('250.00'))
+        for _ in range(200)
+    ))
+
+    def op(i):
+        order = pending[i]
+        order.status = 'Successful'
+        order.save()
+    return {'op': op, 'repeat': len(pending)}
+
+
+def signal_rice_purchase(rows, users):
+    """PurchaseRice turning Successful: buyer stock update and seller profit with `rows` past sales."""
+    buyer, seller = users['manager']
+    post = RicePost.objects.get(manager=seller)
+    _rice_stocks(seller, post.rice_name)
+    _bulk(PurchaseRice, (
+        PurchaseRice(manager=buyer, rice=post, quantity_purchased=5, total_price=Decimal('250.00'),
+                     status='Successful', profit_or_loss=0)
+        for _ in range(rows)
+    ))
+    pending = list(PurchaseRice.objects.bulk_create(
+        PurchaseRice(manager=buyer, rice=post, quantity_purchased=5, total_price=Decimal('250.00'))
+        for _ in range(200)
+    ))
+
+    def op(i):
+        order = pending[i]
+        order.status = 'Successful'
+        order.save()
+    return {'op': op, 'repeat': len(pending)}
+
+
+def signal_customer_sale(rows, users):
+    """Purchase_Rice turning Successful: profit against the seller's RiceStock with `rows` past sales."""
+    seller = users['manager'][0]
+    post = RicePost.objects.get(manager=seller)
+    _rice_stocks(seller, post.rice_name)
+    customer = users['customer'][0]
+    _bulk(Purchase_Rice, (
+        Purchase_Rice(customer=customer, rice=post, quantity_purchased=2, total_price=Decimal('100.00'), status='Successful')
+        for _ in range(rows)
+    ))
+    pending = list(Purchase_Rice.objects.bulk_create(
+        Purchase_Rice(customer=customer, rice=post, quantity_purchased=2, total_price=Decimal('100.00'))
+        for _ in range(200)
+    ))
+
+    def op(i):
+        order = pending[i]
+        order.status = 'Successful'
+        order.save()
+    return {'op': op, 'repeat': len(pending)}
+
+
+def process_paddy_to_rice(rows, users):
+    """The process_paddy_to_rice view while the manager holds `rows` rice stock rows."""
+    manager = users['manager'][0]
+    _bulk(RiceStock, (
+        RiceStock(manager=manager, rice_name=f'Stock {n}', stock_quantity=100, total_price=Decimal('5000.00'),
+                  average_price_per_kg=Decimal('50.00'))
+        for n in range(rows)
+    ))
+    paddy = PaddyStockOfManager.objects.create(
+        manager=manager, paddy_name='Swarna', total_quantity=10**9, total_price=Decimal('99999999.00'), average_price_per_kg=Decimal('0.10'),
+    )
+    client = _client(manager)
+    url = reverse('process_paddy_to_rice', args=[paddy.pk])
+
+    def op(i):
+        client.post(url, {'process_quantity': 10, 'rice_name': f'Rice {i % RICE_NAMES}'})
+    return {'op': op}
+
+
+def calculate_profit_or_loss(rows, users):
+    """One run of the calculate_profit_or_loss command over `rows` unpriced sales."""
+    buyer, seller = users['manager']
+    post = RicePost.objects.get(manager=seller)
+    _rice_stocks(seller, post.rice_name)
+    _bulk(PurchaseRice, (
+        PurchaseRice(manager=buyer, rice=post, quantity_purchased=5, total_price=Decimal('250.00'), status='Successful')
+        for _ in range(rows)
+    ))
+
+    def op(i):
+        call_command('calculate_profit_or_loss', stdout=StringIO())
+    return {'op': op, 'repeat': 1, 'rows_per_op': rows}
+
+
+def profit_loss_report_for_rice_to_manager(rows, users):
+    """The manager-to-manager P&L report view over `rows` successful sales."""
+    buyer, seller = users['manager']
+    post = RicePost.objects.get(manager=seller)
+    _rice_stocks(seller, post.rice_name)
+    _rice_stocks(buyer, post.rice_name)
+    _bulk(PurchaseRice, (
+        PurchaseRice(manager=buyer, rice=post, quantity_purchased=5, total_price=Decimal('250.00'),
+                     status='Successful', profit_or_loss=10.0)
+        for _ in range(rows)
+    ))
+    client = _client(seller)
+    url = reverse('profit_loss_report_for_rice_to_manager')
+
+    def op(i):
+        client.get(url)
+    return {'op': op, 'repeat': 5, 'rows_per_op': rows}
+
+
+def profit_loss_report_for_rice_to_customer(rows, users):
+    """The manager-to-customer P&L report view over `rows` successful sales."""
+    seller = users['manager'][0]
+    post = RicePost.objects.get(manager=seller)
+    _rice_stocks(seller, post.rice_name)
+    _bulk(Purchase_Rice, (
+        Purchase_Rice(customer=users['customer'][0], rice=post, quantity_purchased=2, total_price=Decimal('100.00'),
+                      status='Successful', profit_or_loss=Decimal('10.00'))
+        for _ in range(rows)
+    ))
+    client = _client(seller)
+    url = reverse('profit_loss_report_for_rice_to_customer')
+
+    def op(i):
+        client.get(url)
+    return {'op': op, 'repeat': 5, 'rows_per_op': rows}
+
+
+BENCHMARKS = {
+    'farmer_purchase_save': farmer_purchase_save,
+    'marketplace_save': marketplace_save,
+    'signal_paddy_purchase': signal_paddy_purchase,
+    'signal_rice_purchase': signal_rice_purchase,
+    'signal_customer_sale': signal_customer_sale,
+    'process_paddy_to_rice': process_paddy_to_rice,
+    'calculate_profit_or_loss': calculate_profit_or_loss,
+    'profit_loss_report_for_rice_to_manager': profit_loss_report_for_rice_to_manager,
+    'profit_loss_report_for_rice_to_customer': profit_loss_report_for_rice_to_customer,
+}
+
+def _bulk(model, objects):
+    model.objects.bulk_create(objects, batch_size=BATCH)
+
+
+def _rice_stocks(manager, rice_name):
+    RiceStock.objects.get_or_create(
+        manager=manager, rice_name=rice_name,
+        defaults={'stock_quantity': 10**6, 'total_price': Decimal('40000000.00'), 'average_price_per_kg': Decimal('40.00')},
+    )
+
+
+def _client(user):
+    client = Client(raise_request_exception=True)
+    client.force_login(user)
+    return client
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# python manage.py run_benchmarks [--sizes 1000 10000 100000] [--only marketplace_save] [--compare benchmarks/<commit>.json]
@@ -0,0 +1,52 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from RSCMS_app.models import OutboundEmail
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails over one SMTP connection, retrying failures and dead-lettering the hopeless'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages claimed and sent per batch')
+        parser.add_argument('--max-attempts', type=int, default=OutboundEmail.MAX_ATTEMPTS,
+                            help='Attempts before a message is marked Dead')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no message is due instead of polling')
+        parser.add_argument('--retry-dead', action='store_true', help='Queue the Dead messages again first')
+
+    def handle(self, *args, **options):
+        if options['retry_dead']:
+            requeued = OutboundEmail.retry_dead()
+            self.stdout.write(self.style.WARNING(f"⚠️ {requeued} dead messages queued again."))
+
+        connection = get_connection()
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = OutboundEmail.deliver_batch(
+                    options['batch_size'], connection=connection, max_attempts=options['max_attempts'],
+                )
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"Batch: {sent} sent, {failed} failed")
+                if sent + failed < options['batch_size']:
+                    # drained: don't hold the SMTP connection open while idle
+                    connection.close()
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+        style = self.style.SUCCESS if not total_failed else self.style.WARNING
+        mark = "✔" if not total_failed else "⚠️"
+        dead = OutboundEmail.objects.filter(status="Dead").count()
+        self.stdout.write(style(f"{mark} Done! {total_sent} sent, {total_failed} failed, {dead} dead in the outbox."))
+
+
+# python manage.py send_outbox [--once] [--batch-size 100] [--retry-dead]
@@ -0,0 +1,42 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .queries import QueryRecorder, budget_for
+
+logger = logging.getLogger("rscms.queries")
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the SQL queries of every request and log views that go over their
+    declared budget (see queries.query_budget) or repeat one statement per row.
+    Enabled with QUERY_INSTRUMENTATION (on with DEBUG).
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        if match is None:
+            return response
+
+        budget = budget_for(match.func)
+        repeated = recorder.repeated()
+        if recorder.count > budget or repeated:
+            logger.warning(
+                "%s (%s) ran %d queries in %.0f ms, budget %d%s",
+                match.view_name, request.path, recorder.count, elapsed * 1000, budget,
+                "".join(f"\n  N+1? {n}x {sql[:200]}" for sql, n in repeated[:3]),
+            )
+        return response
@@ -0,0 +1,68 @@
+# Generated by Django 5.2 on 2026-10-17 03:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def build_rollup(apps, schema_editor):
+    DailySales = apps.get_model('RSCMS_app', 'DailySales')
+    sources = (
+        (apps.get_model('manager', 'Purchase_paddy'), 'paddy__dealer__user', 'manager', 'paddy__name'),
+        (apps.get_model('manager', 'PurchaseRice'), 'rice__manager', 'manager', 'rice__rice_name'),
+        (apps.get_model('customer', 'Purchase_Rice'), 'rice__manager', 'customer', 'rice__rice_name'),
+    )
+    totals = {}
+    for model, seller, buyer_role, variety in sources:
+        grouped = model.objects.filter(status='Successful', **{f'{seller}__isnull': False}).annotate(
+            day=TruncDate('purchase_date'), seller_id=F(seller), name=Coalesce(variety, Value('')),
+        ).values('day', 'seller_id', 'name').annotate(
+            kg=Sum('quantity_purchased'), revenue=Sum('total_price'), orders=Count('id'),
+        ).order_by()
+        for row in grouped:
+            key = (row['day'], row['seller_id'], buyer_role, row['name'])
+            kg, revenue, count = totals.get(key, (0, 0, 0))
+            totals[key] = (kg + row['kg'], revenue + row['revenue'], count + row['orders'])
+
+    DailySales.objects.bulk_create(
+        (
+            DailySales(day=day, seller_id=seller_id, buyer_role=buyer_role, variety=name,
+                       kg=kg, revenue=revenue, orders=count)
+            for (day, seller_id, buyer_role, name), (kg, revenue, count) in totals.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('customer', '0002_purchase_rice_custrice_customer_date_idx_and_more'),
+        ('manager', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('buyer_role', models.CharField(choices=[('manager', 'Manager'), ('customer', 'Customer')], max_length=10)),
+                ('variety', models.CharField(blank=True, max_length=200)),
+                ('kg', models.FloatField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('orders', models.IntegerField(default=0)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['seller', 'day'], name='dailysales_seller_day_idx'), models.Index(fields=['day', 'buyer_role'], name='dailysales_day_role_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'seller', 'buyer_role', 'variety'), name='dailysales_unique_key')],
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2 on 2026-10-17 03:45
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+# (handler, order model) pairs whose receivers ran on orders before there were markers
+HANDLED = (
+    ('paddy_stock_receipt', 'manager', 'Purchase_paddy'),
+    ('rice_stock_receipt', 'manager', 'PurchaseRice'),
+    ('daily_sales', 'manager', 'Purchase_paddy'),
+    ('daily_sales', 'manager', 'PurchaseRice'),
+    ('daily_sales', 'customer', 'Purchase_Rice'),
+)
+
+# stock receipts: (stock model, {stock field: order lookup}) of the row an order was added to
+RECEIVED_INTO = {
+    'paddy_stock_receipt': ('PaddyStockOfManager', {
+        'paddy_name': 'paddy__name', 'moisture_content': 'paddy__moisture_content',
+    }),
+    'rice_stock_receipt': ('RiceStock', {'rice_name': 'rice__rice_name', 'quality': 'rice__quality'}),
+}
+
+
+def received(apps, handler, orders):
+    """
+    The orders that can have been added to stock: the receiver saved the
+    matching stock row when it ran, so that row exists and was updated no
+    earlier than the order was placed. The rest were never received and are
+    left unmarked for `python manage.py update_old_paddy_stock` /
+    `update_old_rice_stock` to add.
+    """
+    model_name, key_lookups = RECEIVED_INTO[handler]
+    stocks = apps.get_model('manager', model_name).objects.filter(
+        manager=OuterRef('manager'), updated_at__gte=OuterRef('purchase_date'),
+        **{field: OuterRef(lookup) for field, lookup in key_lookups.items()},
+    )
+    return orders.filter(Exists(stocks))
+
+
+def mark_successful_orders(apps, schema_editor):
+    """
+    Mark the Successful orders the receivers had already applied. DailySales
+    is rebuilt from every Successful order by `python manage.py
+    backfill_daily_sales`, so all of them count as handled there.
+    """
+    ProcessedEvent = apps.get_model('RSCMS_app', 'ProcessedEvent')
+    now = timezone.now()
+    for handler, app_label, model_name in HANDLED:
+        orders = apps.get_model(app_label, model_name).objects.filter(status='Successful')
+        if handler in RECEIVED_INTO:
+            orders = received(apps, handler, orders)
+        ProcessedEvent.objects.bulk_create(
+            (
+                ProcessedEvent(handler=handler, order_type=f'{app_label}.{model_name}', order_id=pk, created_at=now)
+                for pk in orders.values_list('pk', flat=True).iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RSCMS_app', '0002_outboundemail'),
+        ('customer', '0002_purchase_rice_custrice_customer_date_idx_and_more'),
+        ('manager', '0004_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('handler', models.CharField(max_length=50)),
+                ('order_type', models.CharField(help_text='app_label.Model of the order', max_length=50)),
+                ('order_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('handler', 'order_type', 'order_id'), name='processedevent_unique_key')],
+            },
+        ),
+        migrations.RunPython(mark_successful_orders, migrations.RunPython.noop),
+    ]
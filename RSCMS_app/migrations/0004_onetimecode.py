@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RSCMS_app', '0003_processedevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OneTimeCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(max_length=50)),
+                ('email_digest', models.CharField(help_text='sha256 of the normalised email', max_length=64)),
+                ('code_hash', models.CharField(max_length=64)),
+                ('attempts', models.IntegerField(default=0)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('purpose', 'email_digest'), name='onetimecode_unique_key')],
+            },
+        ),
+    ]
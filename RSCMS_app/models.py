@@ -0,0 +1,341 @@
+import logging
+import smtplib
+from datetime import datetime, time, timedelta
+
+from django.apps import apps
+from django.core.exceptions import EmptyResultSet
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from accounts.models import CustomUser
+
+logger = logging.getLogger("rscms.outbox")
+
+# SMTP replies that reject one message but leave the connection usable
+REFUSED = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class DailySales(models.Model):
+    """
+    Successful sales rolled up per day, seller, buyer role and variety, so
+    dashboards chart a few hundred rows instead of scanning every order.
+    Bumped by RSCMS_app.signals when an order reaches Successful; rebuilt by
+    `python manage.py backfill_daily_sales`.
+    """
+    BUYER_ROLES = [
+        ('manager', 'Manager'),
+        ('customer', 'Customer'),
+    ]
+
+    # (order model, seller, buyer role, variety) with seller/variety as lookups from the order
+    SOURCES = (
+        ("manager.Purchase_paddy", "paddy__dealer__user", "manager", "paddy__name"),
+        ("manager.PurchaseRice", "rice__manager", "manager", "rice__rice_name"),
+        ("customer.Purchase_Rice", "rice__manager", "customer", "rice__rice_name"),
+    )
+
+    day = models.DateField()
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="daily_sales")
+    buyer_role = models.CharField(max_length=10, choices=BUYER_ROLES)
+    variety = models.CharField(max_length=200, blank=True)
+    kg = models.FloatField(default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "seller", "buyer_role", "variety"], name="dailysales_unique_key"),
+        ]
+        indexes = [
+            models.Index(fields=["seller", "day"], name="dailysales_seller_day_idx"),
+            models.Index(fields=["day", "buyer_role"], name="dailysales_day_role_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.seller} → {self.buyer_role}: {self.variety} {self.kg} Kg"
+
+    @classmethod
+    def source_for(cls, model):
+        label = model._meta.label
+        return next((source for source in cls.SOURCES if source[0] == label), None)
+
+    @classmethod
+    def record(cls, order, sign=1):
+        """Add (or with sign=-1 take back) one Successful order."""
+        _, seller, buyer_role, variety = cls.source_for(type(order))
+        key = type(order).objects.filter(pk=order.pk).values(
+            seller_id=F(seller), name=Coalesce(variety, Value("")),
+        ).first()
+        if key is None or key["seller_id"] is None:
+            return
+
+        lookup = {
+            "day": timezone.localdate(order.purchase_date),
+            "seller_id": key["seller_id"],
+            "buyer_role": buyer_role,
+            "variety": key["name"],
+        }
+        changes = {
+            "kg": F("kg") + sign * (order.quantity_purchased or 0),
+            "revenue": F("revenue") + sign * (order.total_price or 0),
+            "orders": F("orders") + sign,
+        }
+        if not cls.objects.filter(**lookup).update(**changes):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        **lookup, kg=sign * (order.quantity_purchased or 0),
+                        revenue=sign * (order.total_price or 0), orders=sign,
+                    )
+            except IntegrityError:
+                cls.objects.filter(**lookup).update(**changes)
+
+    @classmethod
+    def rebuild(cls, since=None, batch_size=1000):
+        """
+        Recompute the rollup from the order tables with one grouped query per
+        source, from the `since` date onwards (everything when None).
+        Returns the number of rows written.
+        """
+        totals = {}
+        for label, seller, buyer_role, variety in cls.SOURCES:
+            orders = apps.get_model(label).objects.filter(status="Successful", **{f"{seller}__isnull": False})
+            if since:
+                start = timezone.make_aware(datetime.combine(since, time.min))
+                orders = orders.filter(purchase_date__gte=start)
+            grouped = orders.annotate(
+                day=TruncDate("purchase_date"), seller_id=F(seller), name=Coalesce(variety, Value("")),
+            ).values("day", "seller_id", "name").annotate(
+                kg=Sum("quantity_purchased"), revenue=Sum("total_price"), orders=Count("id"),
+            ).order_by()
+            for row in grouped.iterator():
+                key = (row["day"], row["seller_id"], buyer_role, row["name"])
+                kg, revenue, count = totals.get(key, (0, 0, 0))
+                totals[key] = (kg + row["kg"], revenue + row["revenue"], count + row["orders"])
+
+        with transaction.atomic():
+            stale = cls.objects.all()
+            if since:
+                stale = stale.filter(day__gte=since)
+            stale.delete()
+            cls.objects.bulk_create(
+                (
+                    cls(day=day, seller_id=seller_id, buyer_role=buyer_role, variety=name,
+                        kg=kg, revenue=revenue, orders=count)
+                    for (day, seller_id, buyer_role, name), (kg, revenue, count) in totals.items()
+                ),
+                batch_size=batch_size,
+            )
+        return len(totals)
+
+    @classmethod
+    def daily(cls, since, **filters):
+        """Per-day totals from `since`, oldest first."""
+        return cls.objects.filter(day__gte=since, **filters).values("day").annotate(
+            total_kg=Sum("kg"), total_revenue=Sum("revenue"), order_count=Sum("orders"),
+        ).order_by("day")
+
+    @classmethod
+    def by_variety(cls, limit=None, **filters):
+        """Totals per variety, best selling (by revenue) first."""
+        rows = cls.objects.filter(**filters).values("variety").annotate(
+            total_kg=Sum("kg"), total_revenue=Sum("revenue"), order_count=Sum("orders"),
+        ).order_by("-total_revenue", "variety")
+        return rows[:limit] if limit else rows
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox for mail sent from a request. Views enqueue() instead of talking
+    to SMTP themselves; `python manage.py send_outbox` delivers the queue in
+    batches over one SMTP connection, retrying failures with a growing delay
+    until MAX_ATTEMPTS, after which the message stays behind as Dead.
+    """
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Sent', 'Sent'),
+        ('Dead', 'Dead'),
+    ]
+    MAX_ATTEMPTS = 8  # about two hours of retries
+    RETRY_DELAY = timedelta(minutes=1)  # doubled after every failed attempt
+    # how long a worker owns the messages it claimed before another may take them
+    LEASE = timedelta(minutes=5)
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, subject, message, from_email, recipient_list):
+        """Queue a message; same arguments as django.core.mail.send_mail."""
+        return cls.objects.create(subject=subject, body=message, from_email=from_email or "", to=list(recipient_list))
+
+    @classmethod
+    def claim(cls, batch_size):
+        """
+        Lease up to `batch_size` due messages to the caller by pushing their
+        next attempt past the lease, so a concurrent worker skips them and a
+        crashed one's messages come due again. Returns the claimed messages.
+        """
+        now = timezone.now()
+        due = cls.objects.filter(status="Pending", next_attempt_at__lte=now)
+        ids = list(due.order_by("next_attempt_at", "id").values_list("id", flat=True)[:batch_size])
+        lease_until = now + cls.LEASE
+        due.filter(id__in=ids).update(next_attempt_at=lease_until)
+        return list(cls.objects.filter(id__in=ids, next_attempt_at=lease_until).order_by("id"))
+
+    @classmethod
+    def deliver_batch(cls, batch_size=100, connection=None, max_attempts=None):
+        """
+        Send one claimed batch over `connection` (opened from the EMAIL_*
+        settings when None) and record each outcome. Returns (sent, failed).
+        """
+        max_attempts = max_attempts or cls.MAX_ATTEMPTS
+        messages = cls.claim(batch_size)
+        if not messages:
+            return 0, 0
+
+        own_connection = connection is None
+        connection = connection or get_connection()
+        sent = failed = 0
+        try:
+            for position, outgoing in enumerate(messages):
+                try:
+                    connection.open()
+                except Exception as e:
+                    # the server is unreachable: the rest of the batch waits for the next attempt
+                    for waiting in messages[position:]:
+                        waiting.failed(e, max_attempts)
+                    failed += len(messages) - position
+                    break
+                try:
+                    EmailMessage(
+                        outgoing.subject, outgoing.body, outgoing.from_email or None, outgoing.to,
+                        connection=connection,
+                    ).send()
+                except Exception as e:
+                    failed += 1
+                    outgoing.failed(e, max_attempts)
+                    if not isinstance(e, REFUSED):
+                        # not just this message: reconnect for the next one
+                        connection.close()
+                else:
+                    sent += 1
+                    outgoing.status = "Sent"
+                    outgoing.attempts += 1
+                    outgoing.sent_at = timezone.now()
+                    outgoing.last_error = ""
+        finally:
+            if own_connection:
+                connection.close()
+
+        cls.objects.bulk_update(messages, ["status", "attempts", "last_error", "next_attempt_at", "sent_at"])
+        return sent, failed
+
+    def failed(self, error, max_attempts):
+        self.attempts += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.attempts >= max_attempts:
+            self.status = "Dead"
+            logger.error("Giving up on email %s to %s after %s attempts: %s", self.pk, self.to, self.attempts, error)
+        else:
+            self.next_attempt_at = timezone.now() + self.RETRY_DELAY * 2 ** (self.attempts - 1)
+            logger.warning("Email %s to %s failed (attempt %s), retrying: %s", self.pk, self.to, self.attempts, error)
+
+    @classmethod
+    def retry_dead(cls):
+        """Put every Dead message back in the queue. Returns how many."""
+        return cls.objects.filter(status="Dead").update(status="Pending", attempts=0, next_attempt_at=timezone.now())
+
+
+class ProcessedEvent(models.Model):
+    """Marks an order as handled by one @handle_once transition receiver (RSCMS_app.transitions)."""
+    handler = models.CharField(max_length=50)
+    order_type = models.CharField(max_length=50, help_text="app_label.Model of the order")
+    order_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["handler", "order_type", "order_id"], name="processedevent_unique_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.handler}: {self.order_type} #{self.order_id}"
+
+    @classmethod
+    def claim(cls, handler, order):
+        """Record `order` as handled by `handler`. False when it already was."""
+        try:
+            with transaction.atomic():
+                cls.objects.create(handler=handler, order_type=order._meta.label, order_id=order.pk)
+        except IntegrityError:
+            return False
+        return True
+
+    @classmethod
+    def mark_all(cls, handler, orders):
+        """Record every order in the `orders` queryset as handled, in one INSERT ... SELECT."""
+        select = orders.order_by().annotate(
+            marker_handler=Value(handler, output_field=models.CharField()),
+            marker_type=Value(orders.model._meta.label, output_field=models.CharField()),
+            marker_time=Value(timezone.now(), output_field=models.DateTimeField()),
+        ).values_list("marker_handler", "marker_type", "pk", "marker_time")
+        connection = connections[orders.db]
+        try:
+            sql, params = select.query.get_compiler(connection=connection).as_sql()
+        except EmptyResultSet:
+            return 0
+        quote = connection.ops.quote_name
+        columns = ", ".join(
+            quote(cls._meta.get_field(name).column) for name in ("handler", "order_type", "order_id", "created_at")
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {quote(cls._meta.db_table)} ({columns}) {sql}", params)
+            return cursor.rowcount
+
+    @classmethod
+    def release(cls, handler, order):
+        """Forget that `order` was handled. False when it never was."""
+        deleted, _ = cls.objects.filter(handler=handler, order_type=order._meta.label, order_id=order.pk).delete()
+        return bool(deleted)
+
+
+class OneTimeCode(models.Model):
+    """
+    A code issued by RSCMS_app.otp.OTPService: only its keyed hash, when it
+    expires and how many guesses it has taken. Kept in the database so the
+    guess count can be taken with a conditional UPDATE, which every worker
+    sees and no two guesses can share.
+    """
+    purpose = models.CharField(max_length=50)
+    email_digest = models.CharField(max_length=64, help_text="sha256 of the normalised email")
+    code_hash = models.CharField(max_length=64)
+    attempts = models.IntegerField(default=0)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["purpose", "email_digest"], name="onetimecode_unique_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.purpose} code, expires {self.expires_at}"
@@ -0,0 +1,86 @@
+"""
+One-time codes for payments and password resets.
+
+Codes live in the database (RSCMS_app.models.OneTimeCode) rather than in
+process memory, so every worker process sees the same codes. Only a keyed
+hash of the code is stored. Each code allows max_attempts guesses: a guess
+takes an attempt with a conditional UPDATE before it is compared, so workers
+checking codes at the same moment cannot share one and let extra guesses
+through.
+"""
+import hashlib
+import hmac
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OneTimeCode
+
+VERIFIED = "verified"
+INVALID = "invalid"
+EXPIRED = "expired"
+LOCKED = "locked"
+MISSING = "missing"
+
+
+class OTPService:
+    def __init__(self, purpose, ttl=300, max_attempts=5):
+        self.purpose = purpose
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+    def _lookup(self, email):
+        digest = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        return {"purpose": self.purpose, "email_digest": digest}
+
+    def _hash(self, email, code):
+        message = f"{self.purpose}:{email.strip().lower()}:{code}".encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+    def issue(self, email):
+        """A new 6 digit code for `email`, replacing any earlier one."""
+        code = str(secrets.randbelow(900000) + 100000)
+        now = timezone.now()
+        # kept past their expiry for a while, so a late try reads "expired" rather than "missing"
+        OneTimeCode.objects.filter(purpose=self.purpose, expires_at__lt=now - timedelta(seconds=self.ttl)).delete()
+        OneTimeCode.objects.update_or_create(
+            **self._lookup(email),
+            defaults={
+                "code_hash": self._hash(email, code),
+                "attempts": 0,
+                "expires_at": now + timedelta(seconds=self.ttl),
+            },
+        )
+        return code
+
+    def verify(self, email, code):
+        """
+        Check `code` for `email`. Returns VERIFIED (and uses the code up),
+        INVALID, EXPIRED, LOCKED (too many wrong codes) or MISSING.
+        """
+        entry = OneTimeCode.objects.filter(**self._lookup(email)).first()
+        if entry is None:
+            return MISSING
+        if timezone.now() > entry.expires_at:
+            entry.delete()
+            return EXPIRED
+
+        codes = OneTimeCode.objects.filter(pk=entry.pk)
+        if not codes.filter(attempts__lt=self.max_attempts).update(attempts=F("attempts") + 1):
+            deleted, _ = codes.delete()
+            return LOCKED if deleted else MISSING
+        if hmac.compare_digest(entry.code_hash, self._hash(email, str(code).strip())):
+            # only one of two requests verifying the same code at once gets to use it
+            deleted, _ = codes.delete()
+            return VERIFIED if deleted else MISSING
+
+        if entry.attempts + 1 >= self.max_attempts:
+            codes.delete()
+            return LOCKED
+        return INVALID
+
+    def discard(self, email):
+        OneTimeCode.objects.filter(**self._lookup(email)).delete()
@@ -0,0 +1,155 @@
+"""
+SQL query instrumentation: count the statements a block of code runs and
+group them by fingerprint so N+1 patterns (one query per row) stand out.
+"""
+import re
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import URLResolver, get_resolver, resolve, reverse
+
+from .benchmark import seed_supply_chain
+
+# literals and placeholder lists collapse so "same query, different id" groups together
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(...)", sql.replace("%s", "?"))
+    return _SPACE.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    """Context manager recording every SQL statement run on any connection."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._record))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _record(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, threshold=None):
+        """Fingerprints run at least `threshold` times, most frequent first."""
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        counts = Counter(fingerprint(sql) for sql in self.statements)
+        return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+    def report(self, limit=3):
+        lines = [f"{self.count} queries"]
+        for sql, n in self.repeated()[:limit]:
+            lines.append(f"  {n}x {sql[:200]}")
+        return "\n".join(lines)
+
+
+# A bare "SCAN <table>" is a full table scan; "SCAN <table> USING [COVERING] INDEX" is not
+FULL_SCAN = re.compile(r"\bSCAN (\w+)(?!\w| USING)")
+
+
+class QueryPlanAssertions:
+    """TestCase mixin checking SQLite's EXPLAIN QUERY PLAN for full table scans."""
+
+    def assertServedByIndex(self, queryset):
+        plan = queryset.explain()
+        scanned = FULL_SCAN.findall(plan)
+        if scanned:
+            self.fail(f"full scan of {', '.join(scanned)}:\n{plan}")
+
+
+def query_budget(max_queries, role):
+    """
+    Declare how many queries a view may run per request, and the role of the
+    user who opens it when budgets are checked (QueryBudgetChecks and
+    `python manage.py check_query_budgets`). Put it anywhere in the
+    decorator stack: functools.wraps carries the attributes outwards.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        view.query_budget_role = role
+        return view
+    return decorator
+
+
+def budget_for(view):
+    return getattr(view, "query_budget", settings.QUERY_BUDGET_DEFAULT)
+
+
+def budgeted_views(app_label=None):
+    """
+    (role, url name) of every named, argument-free URL whose view declares
+    a @query_budget, read from the URLconf; only `app_label`'s views when given.
+    """
+    found = []
+    for pattern in _url_patterns(get_resolver().url_patterns):
+        view = pattern.callback
+        if not hasattr(view, "query_budget_role") or not pattern.name or pattern.pattern.regex.groups:
+            continue
+        if app_label is None or view.__module__.split(".")[0] == app_label:
+            found.append((view.query_budget_role, pattern.name))
+    return found
+
+
+def _url_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _url_patterns(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def assert_within_budget(client, path, budget=None, **kwargs):
+    """
+    Test helper: GET `path` with a (logged in) test client and fail when the
+    view runs more queries than its declared budget, or repeats one statement
+    enough to look like an N+1.
+    """
+    budget = budget if budget is not None else budget_for(resolve(path).func)
+    with QueryRecorder() as recorder:
+        response = client.get(path, **kwargs)
+    if recorder.count > budget or recorder.repeated():
+        raise AssertionError(f"{path} exceeded its budget of {budget} queries: {recorder.report()}")
+    return response
+
+
+class QueryBudgetChecks:
+    """
+    TestCase mixin opening every budgeted view of `app_label` (see
+    budgeted_views()) as its role. The seeded orders alternate between two
+    users of each role, half of them Successful, so every user's pending and
+    successful lists have enough rows for a query run once per row to pass
+    QUERY_REPEAT_THRESHOLD.
+    """
+    app_label = None
+    ROWS = settings.QUERY_REPEAT_THRESHOLD + 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=4 * cls.ROWS, successful=2 * cls.ROWS)
+
+    def test_views_stay_within_their_query_budget(self):
+        views = budgeted_views(self.app_label)
+        self.assertTrue(views, f"no @query_budget views in {self.app_label}")
+        for role, name in views:
+            with self.subTest(name):
+                self.client.force_login(self.users[role][0])
+                assert_within_budget(self.client, reverse(name))
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from customer.models import Purchase_Rice
+from manager.models import Purchase_paddy, PurchaseRice
+from .context_processors import ROLE_PROFILES, invalidate_profile
+from .models import DailySales, ProcessedEvent
+from .transitions import handle_once, order_became_successful
+
+
+@handle_once("daily_sales")
+def record_successful_sale(sender, order, **kwargs):
+    DailySales.record(order)
+
+
+def forget_successful_sale(sender, instance, **kwargs):
+    # pre_delete, so the seller and variety can still be read through the order
+    if instance.status == "Successful" and ProcessedEvent.release("daily_sales", instance):
+        DailySales.record(instance, sign=-1)
+
+
+for model in (Purchase_paddy, PurchaseRice, Purchase_Rice):
+    order_became_successful.connect(record_successful_sale, sender=model, dispatch_uid=f"daily_sales_{model.__name__}")
+    pre_delete.connect(forget_successful_sale, sender=model, dispatch_uid=f"daily_sales_delete_{model.__name__}")
+
+
+def forget_cached_profile(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
+
+
+for _, model in ROLE_PROFILES.values():
+    post_save.connect(forget_cached_profile, sender=model, dispatch_uid=f"cached_profile_save_{model.__name__}")
+    post_delete.connect(forget_cached_profile, sender=model, dispatch_uid=f"cached_profile_delete_{model.__name__}")
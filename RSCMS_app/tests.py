@@ -1,3 +1,538 @@
-from django.test import TestCase
+import csv
+import io
+import smtplib
+import zipfile
+from importlib import import_module
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from customer.models import Purchase_Rice
+from dealer.models import Marketplace
+from manager.models import ManagerProfile, PaddyStockOfManager, Purchase_paddy, RicePost
+from manager.stock_backfill import backfill_receipts
+from . import context_processors, exports, otp
+from .benchmark import seed_supply_chain
+from .models import DailySales, OneTimeCode, OutboundEmail, ProcessedEvent
+from .transitions import handle_once
+
+
+class StubConnection:
+    """Stands in for the SMTP backend: records what it sends, or fails the way it's told to."""
+
+    def __init__(self, refuse=(), down=False):
+        self.refuse = set(refuse)
+        self.down = down
+        self.sent = []
+        self.opened = self.closed = 0
+
+    def open(self):
+        if self.down:
+            raise ConnectionRefusedError("Connection refused")
+        self.opened += 1
+
+    def close(self):
+        self.closed += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            refused = self.refuse.intersection(message.to)
+            if refused:
+                raise smtplib.SMTPRecipientsRefused({to: (550, b"no such user") for to in refused})
+            self.sent.append(message)
+        return len(messages)
+
+
+class OutboxTests(TestCase):
+    def enqueue(self, *recipients):
+        return [OutboundEmail.enqueue("Order update", "Your order shipped", "", [to]) for to in recipients]
+
+    def test_sends_the_queued_messages(self):
+        queued = self.enqueue("a@example.com", "b@example.com")
+        connection = StubConnection()
+
+        self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (2, 0))
+
+        self.assertEqual([message.to for message in connection.sent], [["a@example.com"], ["b@example.com"]])
+        for outgoing in queued:
+            outgoing.refresh_from_db()
+            self.assertEqual(outgoing.status, "Sent")
+            self.assertEqual(outgoing.attempts, 1)
+            self.assertIsNotNone(outgoing.sent_at)
+        self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (0, 0))
+
+    def test_refused_recipient_does_not_hold_up_the_batch(self):
+        refused, delivered = self.enqueue("gone@example.com", "b@example.com")
+        connection = StubConnection(refuse={"gone@example.com"})
+
+        with self.assertLogs("rscms.outbox", "WARNING"):
+            self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (1, 1))
+
+        refused.refresh_from_db()
+        delivered.refresh_from_db()
+        self.assertEqual(refused.status, "Pending")
+        self.assertEqual(refused.attempts, 1)
+        self.assertIn("SMTPRecipientsRefused", refused.last_error)
+        self.assertEqual(delivered.status, "Sent")
+        # a refusal leaves the connection usable
+        self.assertEqual(connection.closed, 0)
+
+    def test_lost_connection_retries_with_a_growing_delay(self):
+        outgoing, = self.enqueue("a@example.com")
+        connection = StubConnection(down=True)
+
+        for attempt in range(1, 4):
+            OutboundEmail.objects.filter(pk=outgoing.pk).update(next_attempt_at=timezone.now())
+            before = timezone.now()
+            with self.assertLogs("rscms.outbox", "WARNING"):
+                self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (0, 1))
+
+            outgoing.refresh_from_db()
+            self.assertEqual(outgoing.status, "Pending")
+            self.assertEqual(outgoing.attempts, attempt)
+            self.assertIn("ConnectionRefusedError", outgoing.last_error)
+            delay = OutboundEmail.RETRY_DELAY * 2 ** (attempt - 1)
+            self.assertGreaterEqual(outgoing.next_attempt_at, before + delay)
+            self.assertLess(outgoing.next_attempt_at, before + delay + timedelta(seconds=30))
+            # not due again until the delay has passed
+            self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (0, 0))
+
+        connection.down = False
+        OutboundEmail.objects.filter(pk=outgoing.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (1, 0))
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, "Sent")
+        self.assertEqual(outgoing.attempts, 4)
+
+    def test_gives_up_after_max_attempts(self):
+        outgoing, = self.enqueue("a@example.com")
+        connection = StubConnection(down=True)
+
+        for _ in range(3):
+            OutboundEmail.objects.filter(pk=outgoing.pk).update(next_attempt_at=timezone.now())
+            with self.assertLogs("rscms.outbox", "WARNING") as logs:
+                OutboundEmail.deliver_batch(connection=connection, max_attempts=3)
+
+        self.assertIn("Giving up", logs.output[0])
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, "Dead")
+        self.assertEqual(outgoing.attempts, 3)
+        OutboundEmail.objects.filter(pk=outgoing.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (0, 0))
+
+        self.assertEqual(OutboundEmail.retry_dead(), 1)
+        connection.down = False
+        self.assertEqual(OutboundEmail.deliver_batch(connection=connection), (1, 0))
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, "Sent")
+
+
+class DailySalesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.listing = Marketplace.objects.order_by("id").first()
+        cls.post = RicePost.objects.order_by("id").first()
+
+    def paddy_order(self, kg=40, price="1000.00", days_ago=0):
+        order = Purchase_paddy.objects.create(
+            manager=self.users["manager"][0], paddy=self.listing, quantity_purchased=kg, total_price=Decimal(price),
+        )
+        if days_ago:
+            Purchase_paddy.objects.filter(pk=order.pk).update(purchase_date=timezone.now() - timedelta(days=days_ago))
+            order.refresh_from_db()
+        return order
+
+    def rice_order(self, kg=5, price="250.00"):
+        return Purchase_Rice.objects.create(
+            customer=self.users["customer"][0], rice=self.post, quantity_purchased=kg, total_price=Decimal(price),
+        )
+
+    def succeed(self, order):
+        order.status = "Successful"
+        order.save()
+        return order
+
+    def rollup(self):
+        return list(DailySales.objects.order_by("day", "seller", "buyer_role", "variety").values_list(
+            "day", "seller_id", "buyer_role", "variety", "kg", "revenue", "orders",
+        ))
+
+    def test_recorded_sales_match_a_rebuild(self):
+        self.succeed(self.paddy_order(40, "1000.00"))
+        self.succeed(self.paddy_order(60, "1500.00"))
+        self.succeed(self.paddy_order(20, "500.00", days_ago=3))
+        self.succeed(self.rice_order(5, "250.00"))
+        self.paddy_order(80, "2000.00")  # still Pending
+
+        recorded = self.rollup()
+        self.assertEqual(len(recorded), 3)
+        today = [row for row in recorded if row[0] == timezone.localdate() and row[2] == "manager"]
+        self.assertEqual(today, [
+            (timezone.localdate(), self.listing.dealer.user_id, "manager", self.listing.name, 100.0, Decimal("2500.00"), 2),
+        ])
+
+        self.assertEqual(DailySales.rebuild(), 3)
+        self.assertEqual(self.rollup(), recorded)
+
+    def test_repeated_transition_is_counted_once(self):
+        order = self.succeed(self.paddy_order())
+        stale = Purchase_paddy.objects.get(pk=order.pk)
+        stale.status = "Pending"
+        stale.save()
+
+        order.status = "Delivered"
+        order.save()
+        self.succeed(order)
+        self.succeed(stale)
+
+        row, = DailySales.objects.all()
+        self.assertEqual((row.kg, row.revenue, row.orders), (40.0, Decimal("1000.00"), 1))
+
+    def test_deleting_a_successful_order_takes_it_back(self):
+        kept = self.succeed(self.paddy_order(40, "1000.00"))
+        self.succeed(self.paddy_order(60, "1500.00")).delete()
+        self.paddy_order(80, "2000.00").delete()
+
+        row, = DailySales.objects.all()
+        self.assertEqual((row.kg, row.revenue, row.orders), (40.0, Decimal("1000.00"), 1))
+        kept.delete()
+        row.refresh_from_db()
+        self.assertEqual((row.kg, row.revenue, row.orders), (0.0, Decimal("0.00"), 0))
+
+    def test_rebuild_since_leaves_older_days_alone(self):
+        self.succeed(self.paddy_order(40, "1000.00"))
+        self.succeed(self.paddy_order(20, "500.00", days_ago=10))
+        DailySales.objects.update(kg=0, revenue=0, orders=0)
+
+        self.assertEqual(DailySales.rebuild(since=timezone.localdate() - timedelta(days=1)), 1)
+
+        old, new = DailySales.objects.order_by("day")
+        self.assertEqual((old.kg, old.orders), (0.0, 0))
+        self.assertEqual((new.kg, new.revenue, new.orders), (40.0, Decimal("1000.00"), 1))
+
+
+SHEET = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def read_csv(stream):
+    data = b"".join(stream)
+    return list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+
+
+def read_xlsx(stream):
+    """The cell values of the workbook's only sheet, after checking the zip opens cleanly."""
+    with zipfile.ZipFile(io.BytesIO(b"".join(stream))) as workbook:
+        if workbook.testzip() is not None:
+            raise zipfile.BadZipFile("corrupt member")
+        for name in exports.XLSX_PARTS:
+            ElementTree.fromstring(workbook.read(name))
+        sheet = ElementTree.fromstring(workbook.read("xl/worksheets/sheet1.xml"))
+    return [
+        [cell.findtext(f"{SHEET}is/{SHEET}t") if cell.get("t") == "inlineStr" else cell.findtext(f"{SHEET}v")
+         for cell in row]
+        for row in sheet.iter(f"{SHEET}row")
+    ]
+
+
+class ExportStreamTests(TestCase):
+    headers = ["Name", "Quantity (kg)", "Total Price", "Date", "Paid"]
+    rows = [
+        ("Sona Masuri", 12.5, Decimal("625.00"), date(2024, 3, 1), True),
+        ("Basmati & <Brown>", -3, Decimal("-150.00"), None, False),
+    ]
+
+    def test_csv(self):
+        self.assertEqual(read_csv(exports.stream_csv(self.headers, iter(self.rows))), [
+            self.headers,
+            ["Sona Masuri", "12.5", "625.00", "2024-03-01", "True"],
+            ["Basmati & <Brown>", "-3", "-150.00", "", "False"],
+        ])
+
+    def test_csv_quotes_text_that_would_run_as_a_formula(self):
+        rows = [(text,) for text in ("=HYPERLINK(\"http://x\")", "+1", "-2+3", "@SUM(A1)", "\tcmd", "plain")]
+        self.assertEqual(read_csv(exports.stream_csv(["Name"], iter(rows)))[1:], [
+            ["'=HYPERLINK(\"http://x\")"], ["'+1"], ["'-2+3"], ["'@SUM(A1)"], ["'\tcmd"], ["plain"],
+        ])
+
+    def test_xlsx_is_a_valid_workbook(self):
+        rows = self.rows + [("bell\x07 in name", 1, Decimal("1.00"), datetime(2024, 3, 1, 9, 30), True)]
+        self.assertEqual(read_xlsx(exports.stream_xlsx(self.headers, iter(rows))), [
+            self.headers,
+            ["Sona Masuri", "12.5", "625.00", "2024-03-01", "True"],
+            ["Basmati & <Brown>", "-3", "-150.00", "", "False"],
+            ["bell in name", "1", "1.00", "2024-03-01 09:30", "True"],
+        ])
+
+    def test_streams_in_chunks(self):
+        rows = [("Swarna", i, Decimal(i), None, False) for i in range(2 * exports.CHUNK_SIZE + 1)]
+        # header, then one part per chunk of rows
+        self.assertEqual(len(list(exports.stream_csv(self.headers, iter(rows)))), 4)
+        self.assertEqual(len(read_xlsx(exports.stream_xlsx(self.headers, iter(rows)))), len(rows) + 1)
+
+
+class OTPTests(TestCase):
+    email = "Buyer@Example.com"
+    wrong = "000000"  # issued codes start at 100000
+
+    def setUp(self):
+        self.service = otp.OTPService("payment", ttl=300, max_attempts=3)
+
+    def test_issued_code_verifies_once(self):
+        code = self.service.issue(self.email)
+
+        self.assertRegex(code, r"^\d{6}$")
+        entry = OneTimeCode.objects.get()
+        self.assertNotIn(code, entry.code_hash)
+        self.assertEqual(self.service.verify(" buyer@example.com ", f" {code} "), otp.VERIFIED)
+        self.assertEqual(self.service.verify(self.email, code), otp.MISSING)
+
+    def test_codes_are_kept_per_purpose_and_replaced_on_reissue(self):
+        first = self.service.issue(self.email)
+        other = otp.OTPService("password_reset").issue(self.email)
+        second = self.service.issue(self.email)
+
+        self.assertEqual(OneTimeCode.objects.count(), 2)
+        if first != second:
+            self.assertEqual(self.service.verify(self.email, first), otp.INVALID)
+        self.assertEqual(self.service.verify(self.email, second), otp.VERIFIED)
+        self.assertEqual(otp.OTPService("password_reset").verify(self.email, other), otp.VERIFIED)
+
+    def test_expired_code(self):
+        code = self.service.issue(self.email)
+        OneTimeCode.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.service.verify(self.email, code), otp.EXPIRED)
+        self.assertEqual(self.service.verify(self.email, code), otp.MISSING)
+
+    def test_long_expired_codes_are_dropped_on_issue(self):
+        self.service.issue("old@example.com")
+        OneTimeCode.objects.update(expires_at=timezone.now() - timedelta(seconds=301))
+
+        self.service.issue(self.email)
+        self.assertEqual(OneTimeCode.objects.count(), 1)
+        self.assertEqual(self.service.verify("old@example.com", "123456"), otp.MISSING)
+
+    def test_locked_after_max_attempts(self):
+        code = self.service.issue(self.email)
+
+        self.assertEqual(self.service.verify(self.email, self.wrong), otp.INVALID)
+        self.assertEqual(self.service.verify(self.email, self.wrong), otp.INVALID)
+        self.assertEqual(self.service.verify(self.email, self.wrong), otp.LOCKED)
+        self.assertEqual(self.service.verify(self.email, code), otp.MISSING)
+
+    def test_right_code_on_the_last_attempt(self):
+        code = self.service.issue(self.email)
+
+        for _ in range(2):
+            self.service.verify(self.email, self.wrong)
+        self.assertEqual(self.service.verify(self.email, code), otp.VERIFIED)
+
+    def test_no_guess_is_checked_once_the_attempts_are_taken(self):
+        # another worker's wrong guess took the last attempt and has not thrown the code away yet
+        code = self.service.issue(self.email)
+        OneTimeCode.objects.update(attempts=3)
+
+        self.assertEqual(self.service.verify(self.email, code), otp.LOCKED)
+        self.assertFalse(OneTimeCode.objects.exists())
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "role-profile-tests"},
+})
+class RoleProfileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.manager = cls.users["manager"][0]
+
+    def setUp(self):
+        self.session = import_module(settings.SESSION_ENGINE).SessionStore()
+
+    def profile(self, user, session=None):
+        """The role profile as a template would see it, for one request on `session`."""
+        request = RequestFactory().get("/")
+        request.user = user
+        request.session = session or self.session
+        context = context_processors.role_profile(request)
+        name, _ = context_processors.ROLE_PROFILES[user.role]
+        return context[name]
+
+    def test_loaded_lazily_and_then_from_the_session(self):
+        with self.assertNumQueries(0):
+            profile = self.profile(self.manager)
+        with self.assertNumQueries(1):
+            self.assertEqual(profile.full_name, "Manager 0")
+
+        with self.assertNumQueries(0):
+            cached = self.profile(self.manager)
+            self.assertEqual(cached.pk, profile.pk)
+            self.assertEqual(cached.mill_name, profile.mill_name)
+
+    def test_secret_fields_stay_out_of_the_session(self):
+        ManagerProfile.objects.filter(user=self.manager).update(transaction_password="hashed-secret")
+        self.assertEqual(self.profile(self.manager).transaction_password, "hashed-secret")
+
+        self.assertNotIn("hashed-secret", str(self.session[context_processors.SESSION_KEY]))
+        self.assertEqual(self.profile(self.manager).transaction_password, "")
+
+    def test_saving_the_profile_reloads_it_in_every_session(self):
+        other_session = import_module(settings.SESSION_ENGINE).SessionStore()
+        self.profile(self.manager).full_name
+        self.profile(self.manager, other_session).full_name
+
+        profile = ManagerProfile.objects.get(user=self.manager)
+        profile.full_name = "Renamed Manager"
+        profile.save()
+
+        for session in (self.session, other_session):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.profile(self.manager, session).full_name, "Renamed Manager")
+
+    def test_deleting_the_profile(self):
+        self.profile(self.manager).full_name
+        ManagerProfile.objects.get(user=self.manager).delete()
+
+        with self.assertNumQueries(1):
+            self.assertFalse(self.profile(self.manager))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.profile(self.manager))
+
+    def test_missing_profile_is_cached_too(self):
+        admin = self.users["admin"][0]
+        with self.assertNumQueries(1):
+            self.assertFalse(self.profile(admin))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.profile(admin))
+
+    def test_not_reused_for_another_user(self):
+        self.profile(self.manager).full_name
+        other = self.users["manager"][1]
+        name = ManagerProfile.objects.get(user=other).full_name
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile(other).full_name, name)
+
+    def test_nothing_for_anonymous_users(self):
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        request.session = self.session
+        self.assertEqual(context_processors.role_profile(request), {})
+
+
+class ProcessedEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_supply_chain(orders=3)
+        cls.paddy_orders = list(Purchase_paddy.objects.order_by("id"))
+        cls.rice_order = Purchase_Rice.objects.order_by("id").first()
+
+    def test_claim_once_per_handler_and_order(self):
+        order, other = self.paddy_orders[:2]
+
+        self.assertTrue(ProcessedEvent.claim("stock", order))
+        self.assertFalse(ProcessedEvent.claim("stock", order))
+        self.assertTrue(ProcessedEvent.claim("sales", order))
+        self.assertTrue(ProcessedEvent.claim("stock", other))
+        # same id, different order model
+        self.rice_order.pk = order.pk
+        self.assertTrue(ProcessedEvent.claim("stock", self.rice_order))
+
+    def test_release(self):
+        order = self.paddy_orders[0]
+        self.assertFalse(ProcessedEvent.release("stock", order))
+
+        ProcessedEvent.claim("stock", order)
+        self.assertTrue(ProcessedEvent.release("stock", order))
+        self.assertFalse(ProcessedEvent.release("stock", order))
+        self.assertTrue(ProcessedEvent.claim("stock", order))
+
+    def test_handle_once(self):
+        calls = []
+
+        @handle_once("test_handler")
+        def receiver(sender, order, **kwargs):
+            calls.append(order.pk)
+            if kwargs.get("fail"):
+                raise ValueError("receiver failed")
+            return "done"
+
+        order, other = self.paddy_orders[:2]
+        self.assertEqual(receiver(Purchase_paddy, order=order), "done")
+        self.assertIsNone(receiver(Purchase_paddy, order=order))
+        with self.assertRaises(ValueError):
+            receiver(Purchase_paddy, order=other, fail=True)
+        # the failed run's claim was rolled back with it, so a retry runs
+        receiver(Purchase_paddy, order=other)
+
+        self.assertEqual(calls, [order.pk, other.pk, other.pk])
+
+    def test_mark_all(self):
+        first, *rest = self.paddy_orders
+        orders = Purchase_paddy.objects.filter(pk__in=[order.pk for order in rest])
+
+        self.assertEqual(ProcessedEvent.mark_all("stock", orders), len(rest))
+
+        self.assertEqual(
+            set(ProcessedEvent.objects.filter(handler="stock").values_list("order_type", "order_id")),
+            {("manager.Purchase_paddy", order.pk) for order in rest},
+        )
+        self.assertTrue(all(marker.created_at for marker in ProcessedEvent.objects.all()))
+        self.assertTrue(ProcessedEvent.claim("stock", first))
+        self.assertFalse(ProcessedEvent.claim("stock", rest[0]))
+        self.assertEqual(ProcessedEvent.mark_all("stock", Purchase_paddy.objects.none()), 0)
+
+
+class MarkSuccessfulOrdersMigrationTests(TestCase):
+    """RSCMS_app/migrations/0003_processedevent.py on orders from before there were markers."""
+    migration = import_module("RSCMS_app.migrations.0003_processedevent")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.buyer = cls.users["manager"][0]
+        cls.listings = list(Marketplace.objects.order_by("id"))
+
+    def paddy_order(self, listing, kg=40, received=False):
+        order = Purchase_paddy.objects.create(
+            manager=self.buyer, paddy=listing, quantity_purchased=kg, total_price=Decimal(kg * 25),
+        )
+        if received:
+            order.status = "Successful"
+            order.save()
+        else:
+            Purchase_paddy.objects.filter(pk=order.pk).update(status="Successful")
+        return order
+
+    def migrate(self):
+        ProcessedEvent.objects.all().delete()
+        self.migration.mark_successful_orders(apps, None)
+
+    def marked(self, handler):
+        return set(ProcessedEvent.objects.filter(handler=handler).values_list("order_id", flat=True))
+
+    def test_orders_that_never_reached_stock_are_left_for_the_backfill(self):
+        received = self.paddy_order(self.listings[0], received=True)
+        # no stock row for this paddy at all
+        unstocked = self.paddy_order(self.listings[1], kg=30)
+        # its stock row was last written before the order was placed
+        late = self.paddy_order(self.listings[0], kg=20)
+        PaddyStockOfManager.objects.update(updated_at=received.purchase_date)
+        Purchase_paddy.objects.filter(pk=late.pk).update(purchase_date=received.purchase_date + timedelta(seconds=1))
+
+        self.migrate()
+
+        self.assertEqual(self.marked("paddy_stock_receipt"), {received.pk})
+        self.assertEqual(self.marked("daily_sales"), {received.pk, unstocked.pk, late.pk})
+
+        backfill_receipts(PaddyStockOfManager)
+        stocks = dict(PaddyStockOfManager.objects.values_list("paddy_name", "total_quantity"))
+        self.assertEqual(stocks, {self.listings[0].name: 60.0, self.listings[1].name: 30.0})
+        self.assertEqual(self.marked("paddy_stock_receipt"), {received.pk, unstocked.pk, late.pk})
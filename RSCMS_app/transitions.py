@@ -0,0 +1,60 @@
+"""
+Order status transitions.
+
+TracksStatus remembers the status an order was loaded or last saved with and,
+when a save really changes it, sends `status_changed` and (for Successful)
+`order_became_successful`, inside the same transaction as the save. Receivers
+get `order` and `previous` (None for a new row).
+
+Handlers whose effect must not be repeated, such as adding a purchase to stock,
+are wrapped in @handle_once: a ProcessedEvent row marks the order as handled,
+so a transition sent twice (Successful -> Delivered -> Successful, or a stale
+instance saved again) is skipped without touching the stock.
+"""
+from functools import wraps
+
+from django.db import transaction
+from django.dispatch import Signal
+
+status_changed = Signal()
+order_became_successful = Signal()
+
+
+class TracksStatus:
+    """Model mixin for orders with a `status` field; see the module docstring."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "status" in field_names:
+            instance._saved_status = instance.status
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is not None and "status" not in update_fields:
+                return
+            previous = getattr(self, "_saved_status", None)
+            # before sending, so receivers saving the order again don't resend
+            self._saved_status = self.status
+            if previous == self.status:
+                return
+            status_changed.send(sender=type(self), order=self, previous=previous)
+            if self.status == "Successful":
+                order_became_successful.send(sender=type(self), order=self, previous=previous)
+
+
+def handle_once(name):
+    """Run the decorated transition receiver at most once per order under `name`."""
+    def decorator(receiver):
+        @wraps(receiver)
+        def wrapper(sender, order, **kwargs):
+            from RSCMS_app.models import ProcessedEvent
+
+            with transaction.atomic():
+                if ProcessedEvent.claim(name, order):
+                    return receiver(sender, order=order, **kwargs)
+        return wrapper
+    return decorator
@@ -1,9 +1,10 @@
 from django.shortcuts import render
 from django.shortcuts import render
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib import messages
 
+from .models import OutboundEmail
+
 def home(request):
     return render(request, 'home.html')
 def about(request):
@@ -17,8 +18,8 @@ def contact_support(request):
         email = request.POST.get('email')
         message = request.POST.get('message')
         
-        # Send email (optional)
-        send_mail(
+        # Queued; send_outbox delivers it
+        OutboundEmail.enqueue(
             f"Support Request from {name}",
             message,
             settings.DEFAULT_FROM_EMAIL,
@@ -63,8 +63,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'RSCMS_app.middleware.QueryBudgetMiddleware',
 ]
 
+# Per-request SQL instrumentation (RSCMS_app.middleware.QueryBudgetMiddleware)
+QUERY_INSTRUMENTATION = DEBUG
+# Queries a view may run when it declares no @query_budget
+QUERY_BUDGET_DEFAULT = 50
+# One statement fingerprint repeated this often in a request is reported as a likely N+1
+QUERY_REPEAT_THRESHOLD = 10
+
 ROOT_URLCONF = 'Rice_Supply_Chain_Management_System.urls'
 
 TEMPLATES = [
@@ -77,9 +85,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'manager.context_processors.manager_profile',
-                'admin_panel.context_processors.admin_profile',
-                'customer.context_processors.customer_profile'
+                'RSCMS_app.context_processors.role_profile',
             ],
         },
     },
@@ -154,8 +160,33 @@ USE_TZ = True
 
 
 
+# Caches. "shared" holds the profile versions behind the cached sidebar profile
+# (RSCMS_app.context_processors), so it has to be shared by every worker process:
+# the file cache is, on one host; use DatabaseCache (after `python manage.py
+# createcachetable`) or Redis when running on several hosts. One-time codes are
+# kept in the database instead (RSCMS_app.otp).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "shared"),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+PROFILE_CACHE = "shared"
+
 # SMTP Email Configuration (Gmail)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
+
+# Farmer purchase reference codes: one sequence per year, or per dealer and year
+PADDY_PURCHASE_REFERENCE_PER_DEALER = False
+
+# PDF backend per document type (manager.pdf): "reportlab" draws fixed layouts directly,
+# "html" renders the pdf_download templates through xhtml2pdf
+PDF_RENDERER = "reportlab"
+PDF_RENDERERS = {}  # overrides, e.g. {"paddy_stock_report": "html"}
@@ -1,3 +1,7 @@
 from django.test import TestCase
 
-# Create your tests here.
+from RSCMS_app.queries import QueryBudgetChecks
+
+
+class QueryBudgetTests(QueryBudgetChecks, TestCase):
+    app_label = "admin_panel"
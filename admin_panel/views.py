@@ -1,18 +1,21 @@
-import random
-from datetime import datetime, timedelta
+from datetime import timedelta
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.mail import send_mail
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
 
 from .forms import PasswordResetRequestForm, AdminProfileForm,UserPasswordChangeForm
 from .models import AdminProfile
 from dealer.models import DealerProfile
 from manager.models import ManagerProfile,Purchase_paddy
+from RSCMS_app.models import DailySales, OutboundEmail
+from RSCMS_app.otp import OTPService, VERIFIED, INVALID, EXPIRED, LOCKED
+from RSCMS_app.queries import query_budget
 from customer.models import CustomerProfile, Purchase_Rice
 
 # Check if user is an admin
@@ -23,7 +26,23 @@ def check_admin(user):
 @login_required(login_url='login')
 @user_passes_test(check_admin)
 def admin_dashboard(request):
-    return render(request, 'admin/dashboard.html', {'role': 'admin'})
+    # Platform sales of the last 30 days, per (seller role, buyer role), from the daily rollup
+    since = timezone.localdate() - timedelta(days=30)
+    sales = {
+        (row['seller__role'], row['buyer_role']): row
+        for row in DailySales.objects.filter(day__gte=since).values('seller__role', 'buyer_role').annotate(
+            total_kg=Sum('kg'), total_revenue=Sum('revenue'), order_count=Sum('orders'),
+        ).order_by()
+    }
+    context = {
+        'role': 'admin',
+        'sales_summary': [
+            ("🌾 Paddy sold by dealers", sales.get(('dealer', 'manager'))),
+            ("🍚 Rice sold to managers", sales.get(('manager', 'manager'))),
+            ("🛒 Rice sold to customers", sales.get(('manager', 'customer'))),
+        ],
+    }
+    return render(request, 'admin/dashboard.html', context)
 
 # Admin Profile View
 @login_required(login_url='login')
@@ -48,8 +67,9 @@ def update_admin_profile(request):
         form = AdminProfileForm(instance=profile)
     return render(request, "admin/update_admin_profile.html", {'form': form})
 
+@query_budget(8, role="admin")
 def see_all_delears(request):
-    delears = DealerProfile.objects.all()
+    delears = DealerProfile.objects.select_related('user')
     return render(request,"admin/see_all_delears.html",{'delears':delears})
 
 def individuals_delear_details(request, id):
@@ -61,16 +81,18 @@ def individuals_delear_details(request, id):
     })
 
 
+@query_budget(8, role="admin")
 def see_all_manager(request):
-    managers = ManagerProfile.objects.all()
+    managers = ManagerProfile.objects.select_related('user')
     return render(request,"admin/see_all_manager.html",{'managers':managers})
 
 def individual_manager_details(request, id):
     manager = get_object_or_404(ManagerProfile, pk=id)
     return render(request, "admin/individual_manager_details.html", {'manager': manager})
 
+@query_budget(8, role="admin")
 def see_all_customers(request):
-    customers = CustomerProfile.objects.all()
+    customers = CustomerProfile.objects.select_related('user')
     return render(request, 'admin/see_all_customer.html', {'customers': customers})
 
 def individual_customer_details(request, id):
@@ -96,20 +118,15 @@ def delete_delear(request,id):
         delear.delete()
         return redirect("see_all_delears")
 
-# Temporary OTP Storage
-otp_storage = {}
+password_reset_otp = OTPService("password_reset")
 
 # Send OTP to Email
 def send_otp(email):
-    otp = random.randint(100000, 999999)
-    otp_storage[email] = {
-        'otp': otp,
-        'timestamp': datetime.now()
-    }
+    otp = password_reset_otp.issue(email)
 
     subject = "Password Reset OTP - RSCMS"
     message = f"Hello,\n\nYour OTP for password reset is: {otp}\n\nDo not share this OTP with anyone."
-    send_mail(subject, message, settings.EMAIL_HOST_USER, [email])
+    OutboundEmail.enqueue(subject, message, settings.EMAIL_HOST_USER, [email])
 
 # Password Reset Request View
 def request_password_reset(request):
@@ -133,21 +150,17 @@ def request_password_reset(request):
 def verify_otp(request, email):
     if request.method == "POST":
         entered_otp = request.POST.get("otp")
-        data = otp_storage.get(email)
-
-        if data:
-            otp_valid = str(data['otp']) == entered_otp
-            otp_expired = datetime.now() > data['timestamp'] + timedelta(minutes=5)
-
-            if otp_valid and not otp_expired:
-                del otp_storage[email]
-                messages.success(request, "OTP verified successfully. Set a new password.")
-                return redirect('reset_password', email=email)
-            elif otp_expired:
-                del otp_storage[email]
-                messages.error(request, "OTP has expired. Please request a new one.")
-            else:
-                messages.error(request, "Invalid OTP. Please try again.")
+        result = password_reset_otp.verify(email, entered_otp or "")
+
+        if result == VERIFIED:
+            messages.success(request, "OTP verified successfully. Set a new password.")
+            return redirect('reset_password', email=email)
+        elif result == INVALID:
+            messages.error(request, "Invalid OTP. Please try again.")
+        elif result == EXPIRED:
+            messages.error(request, "OTP has expired. Please request a new one.")
+        elif result == LOCKED:
+            messages.error(request, "Too many wrong OTPs. Please request a new one.")
         else:
             messages.error(request, "No OTP found for this email.")
     return render(request, "password_reset_and_change/verify_otp.html", {'email': email})
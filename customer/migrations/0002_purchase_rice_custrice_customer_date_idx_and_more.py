@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-17 03:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0001_initial'),
+        ('manager', '0002_purchase_paddy_paddybuy_mgr_status_date_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase_rice',
+            index=models.Index(fields=['customer', 'purchase_date'], name='custrice_customer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase_rice',
+            index=models.Index(fields=['rice', 'status', 'purchase_date'], name='custrice_rice_status_date_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-17 05:15
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+
+def store_cost_basis(apps, schema_editor):
+    """
+    Fill in the cost basis of the margins already stored. A non-zero margin
+    was priced against stock, whose cost per Kg it gives back. A zero margin
+    is either a sale without stock or one sold at cost; the seller's stock
+    now is the only evidence left, so those take its cost, or stay empty.
+    """
+    Purchase_Rice = apps.get_model('customer', 'Purchase_Rice')
+    RiceStock = apps.get_model('manager', 'RiceStock')
+    money = DecimalField(max_digits=10, decimal_places=2)
+    sales = Purchase_Rice.objects.filter(status='Successful')
+    sales.exclude(profit_or_loss=0).exclude(quantity_purchased=0).update(stock_cost_per_kg=ExpressionWrapper(
+        (F('total_price') - F('profit_or_loss')) / F('quantity_purchased'), output_field=money,
+    ))
+    costs = {}
+    # the oldest stock wins when a manager holds one rice name in several qualities, as in manager.profit
+    for manager_id, rice_name, cost in RiceStock.objects.order_by('-id').values_list(
+        'manager_id', 'rice_name', 'average_price_per_kg',
+    ):
+        costs[(manager_id, rice_name)] = cost
+    for (manager_id, rice_name), cost in costs.items():
+        sales.filter(profit_or_loss=0, rice__manager_id=manager_id, rice__rice_name=rice_name).update(
+            stock_cost_per_kg=cost,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0002_purchase_rice_custrice_customer_date_idx_and_more'),
+        ('manager', '0004_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase_rice',
+            name='stock_cost_per_kg',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text="Seller's average stock cost per Kg the margin was priced at; empty when they held no stock", max_digits=10, null=True),
+        ),
+        migrations.RunPython(store_cost_basis, migrations.RunPython.noop),
+    ]
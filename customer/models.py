@@ -1,6 +1,7 @@
 from django.db import models
 from accounts.models import CustomUser
 from manager.models import RicePost
+from RSCMS_app.transitions import TracksStatus
 # Create your models here.
 class CustomerProfile(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, limit_choices_to={'role':'customer'},related_name="customerprofile")
@@ -13,7 +14,7 @@ class CustomerProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True,blank=True,null=True)
 
 
-class Purchase_Rice(models.Model):
+class Purchase_Rice(TracksStatus, models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('Accepted', 'Accepted'),
@@ -28,12 +29,23 @@ class Purchase_Rice(models.Model):
     quantity_purchased = models.FloatField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     profit_or_loss = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    stock_cost_per_kg = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True,
+        help_text="Seller's average stock cost per Kg the margin was priced at; empty when they held no stock",
+    )
     delivery_cost = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     is_confirmed = models.BooleanField(default=False)
     payment = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')  # ✅ New field
     purchase_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'purchase_date'], name='custrice_customer_date_idx'),
+            # manager's sales to customers, reached through rice__manager
+            models.Index(fields=['rice', 'status', 'purchase_date'], name='custrice_rice_status_date_idx'),
+        ]
+
     def __str__(self):
         return f"Rice Purchase by {self.customer.username} - {self.rice.rice_name}"
     
@@ -1,3 +1,130 @@
+import csv
+import io
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from RSCMS_app.benchmark import seed_supply_chain
+from RSCMS_app.queries import QueryBudgetChecks, QueryPlanAssertions
+from manager.models import RicePost, RiceStock
+from .models import Purchase_Rice
+
+
+class RicePurchaseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.post = RicePost.objects.order_by("id").first()
+        RicePost.objects.filter(pk=cls.post.pk).update(quantity_kg=100)
+
+    def test_purchase_over_the_post_is_a_form_error(self):
+        self.client.force_login(self.users["customer"][0])
+        url = reverse("purchase_rice_from_manager", args=[self.post.pk])
+
+        response = self.client.post(url, {"quantity_purchased": 101, "delivery_cost": 0})
+        self.assertIn("Not enough rice available.", response.context["form"].errors["quantity_purchased"])
+        self.assertFalse(Purchase_Rice.objects.exists())
+
+        response = self.client.post(url, {"quantity_purchased": 60, "delivery_cost": 0})
+        purchase = Purchase_Rice.objects.get()
+        self.assertRedirects(response, reverse("mock_customer_rice_payment", args=[purchase.pk]), fetch_redirect_response=False)
+        self.assertEqual(RicePost.objects.get(pk=self.post.pk).quantity_kg, 40)
+
+
+class PurchaseExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.customer = cls.users["customer"][0]
+        post = RicePost.objects.order_by("id").first()
+        RicePost.objects.filter(pk=post.pk).update(rice_name="=HYPERLINK(\"http://example.com\")")
+        post.refresh_from_db()
+        for kg, days_ago in ((5, 0), (8, 10)):
+            purchase = Purchase_Rice.objects.create(
+                customer=cls.customer, rice=post, quantity_purchased=kg, total_price=Decimal(kg * 50),
+            )
+            Purchase_Rice.objects.filter(pk=purchase.pk).update(purchase_date=timezone.now() - timedelta(days=days_ago))
+        Purchase_Rice.objects.create(
+            customer=cls.users["customer"][1], rice=post, quantity_purchased=3, total_price=Decimal(150),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+        self.url = reverse("export_rice_purchases_history")
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv_lists_own_purchases_in_the_date_range(self):
+        rows = list(csv.reader(io.StringIO(self.export().decode("utf-8-sig"))))
+        self.assertEqual(rows[0][:3], ["Rice Name", "Manager", "Quantity (kg)"])
+        self.assertEqual([row[2] for row in rows[1:]], ["8.0", "5.0"])
+        self.assertEqual({row[0] for row in rows[1:]}, {"'=HYPERLINK(\"http://example.com\")"})
+
+        today = timezone.localdate().isoformat()
+        rows = list(csv.reader(io.StringIO(self.export(**{"from": today, "to": today}).decode("utf-8-sig"))))
+        self.assertEqual([row[2] for row in rows[1:]], ["5.0"])
+
+    def test_xlsx_download(self):
+        response = self.client.get(self.url, {"format": "xlsx"})
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="rice_purchase_history.xlsx"')
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as workbook:
+            self.assertIsNone(workbook.testzip())
+            self.assertEqual(workbook.read("xl/worksheets/sheet1.xml").count(b"<row>"), 3)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"format": "pdf"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"from": "01/02/2024"}).status_code, 400)
+
+
+class StoreCostBasisMigrationTests(TestCase):
+    """customer/migrations/0003_purchase_rice_stock_cost_per_kg.py on margins stored before it."""
+    migration = import_module("customer.migrations.0003_purchase_rice_stock_cost_per_kg")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        stocked, unstocked = RicePost.objects.order_by("id")
+        RiceStock.objects.create(
+            manager=stocked.manager, rice_name=stocked.rice_name, stock_quantity=10,
+            total_price=350, average_price_per_kg=Decimal("35.00"),
+        )
+        sales = [
+            (stocked, 4, "200.00", "60.00", "Successful"),
+            (stocked, 2, "70.00", "0.00", "Successful"),    # sold at cost
+            (unstocked, 3, "180.00", "0.00", "Successful"),
+            (stocked, 5, "250.00", "0.00", "Pending"),
+        ]
+        cls.sales = Purchase_Rice.objects.bulk_create(
+            Purchase_Rice(customer=cls.users["customer"][0], rice=rice, quantity_purchased=kg,
+                          total_price=Decimal(price), profit_or_loss=Decimal(margin), status=status)
+            for rice, kg, price, margin, status in sales
+        )
+
+    def test_cost_basis_of_stored_margins(self):
+        self.migration.store_cost_basis(apps, None)
+
+        self.assertEqual(
+            [Purchase_Rice.objects.get(pk=sale.pk).stock_cost_per_kg for sale in self.sales],
+            [Decimal("35.00"), Decimal("35.00"), None, None],
+        )
+
+
+@skipUnless(connection.vendor == "sqlite", "plans are read from SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+    def test_customer_orders_use_an_index(self):
+        self.assertServedByIndex(Purchase_Rice.objects.filter(customer=1).order_by("-purchase_date"))
+
 
-# Create your tests here.
+class QueryBudgetTests(QueryBudgetChecks, TestCase):
+    app_label = "customer"
@@ -11,6 +11,7 @@ urlpatterns = [
     path("purchase_rice_from_manager/<int:id>/",views.purchase_rice_from_manager,name="purchase_rice_from_manager"),
     path("explore_rice_post/",views.explore_rice_post,name="explore_rice_post"),
     path('rice_purchases_history/', views.rice_purchases_history, name='rice_purchases_history'),
+    path('rice_purchases_history/export/', views.export_rice_purchases_history, name='export_rice_purchases_history'),
 
     path("mock_customer_rice_payment/<int:purchase_id>/", views.mock_customer_rice_payment, name="mock_customer_rice_payment"),
     path('insert-phone-number/<int:purchase_id>/', views.insert_phone_number_customer, name='insert_phone_number_customer'),
@@ -3,16 +3,18 @@ from django.shortcuts import render, get_object_or_404,redirect,HttpResponse
 from .models import CustomerProfile, Purchase_Rice, Payment_For_Rice
 from manager.models import RicePost
 from .forms import PaymentForRiceForm
+from RSCMS_app import exports
+from RSCMS_app.otp import OTPService, VERIFIED, INVALID, EXPIRED, LOCKED
+from RSCMS_app.queries import query_budget
 from decimal import Decimal
 from .forms import CustomerProfileForm, PurchaseRiceForm
 from django.contrib import messages
 
 import uuid
-import random
-from datetime import datetime, timedelta
-from django.core.mail import send_mail
+from RSCMS_app.models import OutboundEmail
 from django.conf import settings
 from django.db.models import Q
+from django.db import transaction
 
 
 from django.template.loader import render_to_string
@@ -21,7 +23,7 @@ from django.http import HttpResponse
 from django.template.loader import get_template
 import tempfile
 
-from xhtml2pdf import pisa
+from manager import receipts
 
 
 
@@ -80,20 +82,22 @@ def purchase_rice_from_manager(request, id):
         form = PurchaseRiceForm(request.POST)
         if form.is_valid():
             purchase = form.save(commit=False)
-            if purchase.quantity_purchased > rice.quantity_kg:
-                form.add_error('quantity_purchased', "Not enough rice available.")
+            if purchase.quantity_purchased <= 0:
+                form.add_error('quantity_purchased', "Quantity must be greater than zero.")
             else:
                 purchase.customer = request.user
                 purchase.rice = rice
                 purchase.total_price = (Decimal(purchase.quantity_purchased) * rice.price_per_kg) + purchase.delivery_cost
-                purchase.save()
 
-                rice.quantity_kg -= purchase.quantity_purchased
-                if rice.quantity_kg <= 0:
-                    rice.is_sold = True
-                rice.save()
+                with transaction.atomic():
+                    remaining = RicePost.reserve_quantity(rice.id, purchase.quantity_purchased)
+                    if remaining is not None:
+                        purchase.save()
 
-                return redirect("mock_customer_rice_payment", purchase_id=purchase.id)
+                if remaining is None:
+                    form.add_error('quantity_purchased', "Not enough rice available.")
+                else:
+                    return redirect("mock_customer_rice_payment", purchase_id=purchase.id)
     else:
         form = PurchaseRiceForm()
 
@@ -109,6 +113,23 @@ def rice_purchases_history(request):
     }
     return render(request, "customer/purchase_history.html", context)
 
+@login_required
+@user_passes_test(check_customer_or_admin)
+def export_rice_purchases_history(request):
+    purchases = Purchase_Rice.objects.filter(customer=request.user).order_by("purchase_date")
+    columns = [
+        ("Rice Name", "rice__rice_name"),
+        ("Manager", "rice__manager__managerprofile__full_name"),
+        ("Quantity (kg)", "quantity_purchased"),
+        ("Price/kg", "rice__price_per_kg"),
+        ("Delivery Cost", "delivery_cost"),
+        ("Total Price", "total_price"),
+        ("Date", "purchase_date"),
+        ("Delivery Status", "status"),
+        ("Payment", "payment"),
+    ]
+    return exports.export_response(request, purchases, columns, "rice_purchase_history", date_field="purchase_date")
+
 @login_required
 @user_passes_test(check_customer)
 def mock_customer_rice_payment(request, purchase_id):
@@ -150,43 +171,34 @@ def insert_phone_number_customer(request,purchase_id):
 
     return render(request,"customer/payment/insert_phone_number.html")
 
-otp_storage = {}
+rice_payment_otp = OTPService("customer_rice_payment")
 @login_required
 @user_passes_test(check_customer)
 def send_purchases_otp_customer(request,email,purchase_id):
-    otp = random.randint(100000,999999)
-    otp_storage[email] = {
-        'otp' : otp,
-        'timestamp' : datetime.now()
-    }
+    otp = rice_payment_otp.issue(email)
     subject = "Transaction OTP - RSCMS"
     message = f"Assalamu Alaikum\n\nYour OTP for transaction is: {otp}\n\nNever share your Code and PIN with anyone.\n\nRSCMS never ask for this.\n\nExpiry: within 300 seconds"
-    send_mail(subject,message,settings.EMAIL_HOST_USER, [email])
+    OutboundEmail.enqueue(subject, message, settings.EMAIL_HOST_USER, [email])
     
     return redirect("insert_otp_customer",purchase_id=purchase_id,email=email)
     
 @login_required
 @user_passes_test(check_customer)
 def verify_purchases_otp_customer(request, email, purchase_id, otp):
-    data = otp_storage.get(email)
-    if data:
-        otp_valid = data['otp'] == otp
-        otp_expired = datetime.now() > data['timestamp'] + timedelta(minutes=5)
-
-        if otp_valid and not otp_expired:
-            del otp_storage[email]
-            messages.success(request, "OTP verified successfully.")
-            return redirect("insert_password_customer", purchase_id=purchase_id,email=email)
-        elif otp_expired:
-            del otp_storage[email]
-            messages.error(request, "OTP has expired. Please request a new one.")
-            return redirect('insert_phone_number_customer', purchase_id=purchase_id)
-        else:
-            messages.error(request, "Invalid OTP. Please try again.")
-            return redirect('insert_otp_customer', purchase_id=purchase_id, email=email)
+    result = rice_payment_otp.verify(email, otp)
+    if result == VERIFIED:
+        messages.success(request, "OTP verified successfully.")
+        return redirect("insert_password_customer", purchase_id=purchase_id,email=email)
+    elif result == INVALID:
+        messages.error(request, "Invalid OTP. Please try again.")
+        return redirect('insert_otp_customer', purchase_id=purchase_id, email=email)
+    elif result == EXPIRED:
+        messages.error(request, "OTP has expired. Please request a new one.")
+    elif result == LOCKED:
+        messages.error(request, "Too many wrong OTPs. Please request a new one.")
     else:
         messages.error(request, "No OTP found for this email.")
-        return redirect('insert_phone_number_customer', purchase_id=purchase_id)
+    return redirect('insert_phone_number_customer', purchase_id=purchase_id)
 
 
 
@@ -253,8 +265,9 @@ def explore_rice_post(request):
 # Oder track
 @login_required
 @user_passes_test(lambda u: u.role == 'customer')
+@query_budget(8, role="customer")
 def my_order_page(request):
-    orders = Purchase_Rice.objects.filter(customer=request.user).order_by("-purchase_date")
+    orders = Purchase_Rice.objects.filter(customer=request.user).select_related("rice__manager__managerprofile").order_by("-purchase_date")
     return render(request, 'customer/my_order_page.html', {'orders': orders})
 
 @login_required
@@ -273,21 +286,10 @@ def confirm_delivery(request, id):
 @login_required
 @user_passes_test(lambda u: u.role == 'customer')
 def download_receipt_for_buying_rice_for_customer(request, id):
-    rice = get_object_or_404(Purchase_Rice, id=id, customer=request.user)
-    price_per_kg = float(rice.total_price - rice.delivery_cost) / float(rice.quantity_purchased)
-
-    html_content = render_to_string(
-        "customer/receipt.html",
-        {"rice": rice, "price_per_kg": price_per_kg},
+    order = get_object_or_404(
+        Purchase_Rice.objects.select_related(*receipts.RECEIPTS["customer_rice_purchase"].related),
+        id=id, customer=request.user,
     )
-
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="receipt.pdf"'
-
-    pisa_status = pisa.CreatePDF(html_content, dest=response)
-
-    if pisa_status.err:
-        return HttpResponse("Error generating PDF", status=500)
-    return response
+    return receipts.receipt_response("customer_rice_purchase", order)
 
     
\ No newline at end of file
@@ -2,10 +2,19 @@ from django import forms
 from django.core.exceptions import ValidationError
 from .models import DealerProfile, Marketplace, PaddyPurchaseFromFarmer, PaddyStock
 
+def validate_farmer_phone(phone):
+    if phone:
+        if not phone.isdigit() or len(phone) != 10 or phone[0] not in ['6', '7', '8', '9']:
+            raise ValidationError(
+                "Please enter a valid 10-digit Indian mobile number starting with 6, 7, 8, or 9"
+            )
+    return phone
+
+
 class PaddyStockForm(forms.ModelForm):
     class Meta:
         model = PaddyStock
-        exclude = ['dealer', 'stored_since']  # system-controlled fields
+        exclude = ['dealer', 'stored_since', 'purchase_value']  # system-controlled fields
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter Paddy Name'}),
             'moisture_category': forms.Select(attrs={'class': 'form-control'}),
@@ -144,13 +153,7 @@ class PaddyPurchaseForm(forms.ModelForm):
         return round(moisture, 1)
 
     def clean_farmer_phone(self):
-        phone = self.cleaned_data.get('farmer_phone')
-        if phone:
-            if not phone.isdigit() or len(phone) != 10 or phone[0] not in ['6', '7', '8', '9']:
-                raise forms.ValidationError(
-                    "Please enter a valid 10-digit Indian mobile number starting with 6, 7, 8, or 9"
-                )
-        return phone
+        return validate_farmer_phone(self.cleaned_data.get('farmer_phone'))
 
 
 class MarketplaceForm(forms.ModelForm):
@@ -188,3 +191,10 @@ class MarketplaceForm(forms.ModelForm):
         if stock and qty > stock.available_quantity:
             raise forms.ValidationError(f"Cannot list more than available stock ({stock.available_quantity} Kg)")
         return qty
+
+
+class PurchaseImportForm(forms.Form):
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.ndjson'}),
+        help_text='CSV with a header row, or JSONL with one lot per line'
+    )
@@ -0,0 +1,141 @@
+"""
+Bulk import of farmer purchase lots from CSV or JSONL files
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+
+from .forms import PaddyPurchaseForm
+from .models import PaddyPurchaseFromFarmer, PaddyStock
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+IMPORT_FIELDS = PaddyPurchaseForm._meta.fields
+
+# Columns a lot may leave out; same defaults as the model
+ROW_DEFAULTS = {"farmer_phone": "", "notes": "", "transport_cost": 0, "other_costs": 0}
+
+
+def guess_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+class PurchaseFileError(Exception):
+    """The file as a whole can't be read (not UTF-8, broken CSV quoting); nothing is imported."""
+
+
+def iter_purchase_rows(stream, file_format="csv"):
+    """Yield (line number, row) pairs from a text stream, one line at a time."""
+    line_no = 0
+    try:
+        if file_format == "jsonl":
+            for line_no, line in enumerate(stream, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_no, None
+        else:
+            # strict: an unbalanced quote is an error rather than swallowing the lines after it
+            reader = csv.DictReader(stream, strict=True)
+            for row in reader:
+                line_no = reader.line_num
+                yield line_no, {(key or "").strip(): value for key, value in row.items()}
+    except UnicodeDecodeError:
+        raise PurchaseFileError(
+            f"The file is not UTF-8 text (after line {line_no}). Save it as UTF-8, e.g. \"CSV UTF-8\" in Excel, "
+            "and upload it again."
+        )
+    except csv.Error as e:
+        raise PurchaseFileError(f"The file is not valid CSV (after line {line_no}): {e}")
+
+
+def import_farmer_purchases(dealer, rows, chunk_size=CHUNK_SIZE):
+    """
+    Validate and insert farmer lots chunk by chunk, then sync each touched
+    PaddyStock (one per paddy type and moisture category) once at the end.
+    Invalid rows are skipped and reported; a PurchaseFileError from `rows`
+    rolls the whole import back.
+    """
+    result = {"created": 0, "skipped": 0, "errors": [], "stocks": 0}
+    stocks = {}
+    deltas = {}
+    rows = iter(rows)
+    form = PaddyPurchaseForm(data={})
+
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            purchases = []
+            for line_no, row in chunk:
+                purchase = _build_purchase(form, dealer, line_no, row, result)
+                if purchase is None:
+                    continue
+
+                key = (purchase.paddy_type, purchase._get_moisture_category())
+                stock = stocks.get(key)
+                if stock is None:
+                    stock, created = PaddyStock.objects.get_or_create(
+                        dealer=dealer,
+                        name=key[0],
+                        moisture_category=key[1],
+                        defaults={"moisture_content": purchase.moisture_content},
+                    )
+                    stocks[key] = stock
+                    deltas[stock.pk] = [0, 0, 0, 0]
+
+                purchase.paddy_stock = stock
+                stock.moisture_content = purchase.moisture_content
+                deltas[stock.pk] = [total + part for total, part in zip(deltas[stock.pk], purchase._stock_delta())]
+                purchases.append(purchase)
+
+            if purchases:
+                codes = PaddyPurchaseFromFarmer.reserve_reference_codes(dealer, len(purchases))
+                for purchase, code in zip(purchases, codes):
+                    purchase.reference_code = code
+                PaddyPurchaseFromFarmer.objects.bulk_create(purchases, batch_size=chunk_size)
+                result["created"] += len(purchases)
+
+        for stock in stocks.values():
+            locked = PaddyStock.objects.select_for_update().get(pk=stock.pk)
+            locked.apply_purchase_delta(*deltas[stock.pk])
+            locked.moisture_content = stock.moisture_content
+            locked.save()
+
+    result["stocks"] = len(stocks)
+    return result
+
+
+def _build_purchase(form, dealer, line_no, row, result):
+    # the same cleaning as a purchase entered by hand, on one form rebound per row:
+    # building a PaddyPurchaseForm per row costs more than the insert itself
+    if not isinstance(row, dict):
+        _add_error(result, line_no, "Row is not a valid JSON object")
+        return None
+
+    data = dict(ROW_DEFAULTS)
+    data.update({key: row[key] for key in IMPORT_FIELDS if row.get(key) not in (None, "")})
+    form.data = data
+    form.instance = PaddyPurchaseFromFarmer(dealer=dealer)
+    form.full_clean()
+    if form.errors:
+        _add_error(result, line_no, "; ".join(f"{field}: {' '.join(messages)}" for field, messages in form.errors.items()))
+        return None
+
+    purchase = form.instance
+    purchase._calculate_total_cost()
+    return purchase
+
+
+def _add_error(result, line_no, message):
+    result["skipped"] += 1
+    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+        result["errors"].append((line_no, message))
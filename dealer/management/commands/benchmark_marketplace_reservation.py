@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.models import Sum
+
+from RSCMS_app.benchmark import scratch_database
+from accounts.models import CustomUser
+from dealer.models import DealerProfile, Marketplace, PaddyStock
+from manager.models import Purchase_paddy
+
+
+class Command(BaseCommand):
+    help = 'Hammer one Marketplace listing from concurrent buyers; report purchases/s and any oversell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent buyers')
+        parser.add_argument('--quantity', type=int, default=2000, help='Kg on the listing')
+        parser.add_argument('--max-kg', type=int, default=5, help='Largest single purchase in Kg')
+        parser.add_argument('--legacy', action='store_true', help='Use the old read-check-write path for comparison')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            listing, managers = self._setup(options['quantity'], options['threads'])
+            stats = {'purchases': 0, 'failed': 0, 'db_errors': 0}
+            lock = threading.Lock()
+            purchase = self._legacy_purchase if options['legacy'] else self._atomic_purchase
+
+            threads = [
+                threading.Thread(target=self._buyer, args=(purchase, manager, listing.pk, options['max_kg'], stats, lock))
+                for manager in managers
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            listing.refresh_from_db()
+            sold = Purchase_paddy.objects.filter(paddy=listing).aggregate(total=Sum('quantity_purchased'))['total'] or 0
+            removed = options['quantity'] - listing.quantity
+            oversold = max(sold - options['quantity'], 0)
+
+        mode = 'legacy read-check-write' if options['legacy'] else 'atomic reservation'
+        self.stdout.write(f"Mode: {mode}, {options['threads']} buyers, {options['quantity']} Kg listed")
+        self.stdout.write(f"Purchases: {stats['purchases']} in {elapsed:.2f}s ({stats['purchases'] / elapsed:.0f} purchases/s)")
+        self.stdout.write(f"Rejected: {stats['failed']}, database errors: {stats['db_errors']}")
+        self.stdout.write(f"Kg sold: {sold:.0f}, Kg taken off listing: {removed}, left: {listing.quantity}, available: {listing.is_available}")
+
+        if oversold or sold != removed:
+            self.stdout.write(self.style.ERROR(f"✘ Oversold by {oversold:.0f} Kg, {sold - removed:.0f} Kg of lost updates"))
+        else:
+            self.stdout.write(self.style.SUCCESS("✔ No oversell, every sold Kg was taken off the listing."))
+
+    def _setup(self, quantity, buyers):
+        user = CustomUser.objects.create(username='bench_dealer', role='dealer')
+        dealer = DealerProfile.objects.create(user=user, license_number='BENCH', storage_capacity=quantity)
+        stock = PaddyStock.objects.create(
+            dealer=dealer, name='Swarna', quantity=quantity, available_quantity=quantity,
+            moisture_content=Decimal('14.0'), price_per_kg=Decimal('25.00'),
+        )
+        listing = Marketplace.objects.create(paddy_stock=stock, dealer=dealer, quantity=quantity, status='Published')
+        managers = [CustomUser.objects.create(username=f'bench_manager_{i}', role='manager') for i in range(buyers)]
+        return listing, managers
+
+    def _buyer(self, purchase, manager, listing_id, max_kg, stats, lock):
+        rng = random.Random(manager.pk)
+        try:
+            while True:
+                kg = rng.randint(1, max_kg)
+                try:
+                    done = purchase(manager, listing_id, kg)
+                except OperationalError:
+                    with lock:
+                        stats['db_errors'] += 1
+                    continue
+
+                with lock:
+                    stats['purchases' if done else 'failed'] += 1
+                if not done and not Marketplace.objects.filter(pk=listing_id, is_available=True, quantity__gt=0).exists():
+                    break
+        finally:
+            connections.close_all()
+
+    def _atomic_purchase(self, manager, listing_id, kg):
+        with transaction.atomic():
+            if not Marketplace.reserve_quantity(listing_id, kg):
+                return False
+            Purchase_paddy.objects.create(manager=manager, paddy_id=listing_id, quantity_purchased=kg, total_price=Decimal(kg))
+        return True
+
+    def _legacy_purchase(self, manager, listing_id, kg):
+        # Mirrors the pre-reservation purchase_paddy view
+        paddy = Marketplace.objects.get(pk=listing_id)
+        if not paddy.is_available or kg > paddy.quantity:
+            return False
+        Purchase_paddy.objects.create(manager=manager, paddy=paddy, quantity_purchased=kg, total_price=Decimal(kg))
+        paddy.quantity = paddy.quantity - kg
+        if paddy.quantity <= 0:
+            paddy.is_available = False
+        paddy.save()
+        return True
+
+
+# python manage.py benchmark_marketplace_reservation [--threads 8] [--legacy]
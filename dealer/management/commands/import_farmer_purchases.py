@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from dealer.imports import CHUNK_SIZE, PurchaseFileError, guess_format, import_farmer_purchases, iter_purchase_rows
+from dealer.models import DealerProfile
+
+
+class Command(BaseCommand):
+    help = 'Import farmer purchase lots for a dealer from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with header row) or JSONL file of purchase lots')
+        parser.add_argument('--dealer', required=True, help='Username of the dealer the lots belong to')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='File format (default: guessed from the extension)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows validated and inserted per batch')
+
+    def handle(self, *args, **options):
+        try:
+            dealer = DealerProfile.objects.get(user__username=options['dealer'])
+        except DealerProfile.DoesNotExist:
+            raise CommandError(f"Dealer '{options['dealer']}' not found")
+
+        file_format = options['format'] or guess_format(options['path'])
+        started = time.perf_counter()
+
+        with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+            try:
+                result = import_farmer_purchases(dealer, iter_purchase_rows(stream, file_format), chunk_size=options['chunk_size'])
+            except PurchaseFileError as e:
+                raise CommandError(f"{e} Nothing was imported.")
+
+        elapsed = time.perf_counter() - started
+        for line_no, message in result['errors']:
+            self.stdout.write(self.style.WARNING(f"⚠️ Line {line_no}: {message}"))
+
+        rate = result['created'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✔ Done! {result['created']} lots imported into {result['stocks']} stock rows, "
+            f"{result['skipped']} skipped ({elapsed:.1f}s, {rate:.0f} rows/s)."
+        ))
+
+
+# python manage.py import_farmer_purchases lots.csv --dealer <username>
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from dealer.models import PaddyStock
+
+
+TRACKED_FIELDS = ["quantity", "available_quantity", "purchase_value", "purchase_price", "transport_cost", "other_cost", "price_per_kg"]
+
+
+class Command(BaseCommand):
+    help = 'Rebuild dealer PaddyStock running totals from farmer purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dealer', type=int, help='Only recalculate stock of this DealerProfile id')
+        parser.add_argument('--check', action='store_true', help='Report drifted stock rows without saving')
+
+    def handle(self, *args, **options):
+        stocks = PaddyStock.objects.all()
+        if options['dealer']:
+            stocks = stocks.filter(dealer_id=options['dealer'])
+
+        checked = 0
+        drifted = 0
+        for stock in stocks.iterator(chunk_size=500):
+            before = {field: getattr(stock, field) for field in TRACKED_FIELDS}
+            stock.recalculate()
+            changed = [f for f in TRACKED_FIELDS if before[f] != getattr(stock, f)]
+            checked += 1
+
+            if changed:
+                drifted += 1
+                details = ", ".join(f"{f}: {before[f]} -> {getattr(stock, f)}" for f in changed)
+                self.stdout.write(self.style.WARNING(f"⚠️ Stock ID {stock.id} ({stock}): {details}"))
+                if not options['check']:
+                    stock.save()
+
+        action = "found drifted" if options['check'] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"✔ Done! {checked} stock rows checked, {drifted} {action}."))
+
+
+# python manage.py recalculate_paddy_stock [--check] [--dealer <id>]
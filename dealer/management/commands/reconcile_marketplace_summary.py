@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from dealer.models import MarketplaceSummary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the marketplace summary (avg price, total Kg, top dealer) from the Marketplace table'
+
+    def handle(self, *args, **kwargs):
+        before = MarketplaceSummary.objects.filter(pk=MarketplaceSummary.SINGLETON_ID).first()
+        summary = MarketplaceSummary.rebuild()
+
+        if before and (before.listing_count, before.priced_count, before.price_sum, before.total_kg) != (
+            summary.listing_count, summary.priced_count, summary.price_sum, summary.total_kg
+        ):
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ Summary had drifted: {before.listing_count} listings / {before.total_kg} Kg "
+                f"-> {summary.listing_count} listings / {summary.total_kg} Kg"
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✔ Done! {summary.listing_count} listings, {summary.total_kg} Kg, "
+            f"avg ₹{summary.avg_price or 0}/Kg, top dealer: {summary.top_dealer or '--'}"
+        ))
+
+
+# python manage.py reconcile_marketplace_summary
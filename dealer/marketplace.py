@@ -0,0 +1,117 @@
+"""
+Paddy marketplace listing shared by the manager and public marketplace pages
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+from .models import Marketplace, MarketplaceSummary
+
+PAGE_SIZE = 24
+
+# sort key -> (field, descending); ties are broken by id in the same direction
+SORTS = {
+    'recent': ('stored_since', True),
+    'price_asc': ('price_per_kg', False),
+    'price_desc': ('price_per_kg', True),
+    'moisture': ('moisture_content', False),
+}
+
+
+def available_listings():
+    return Marketplace.objects.filter(is_available=True)
+
+
+def marketplace_page(sort='recent', cursor=None, page_size=PAGE_SIZE):
+    """
+    Keyset (cursor) pagination: every page seeks past the last row of the
+    previous one instead of counting through an OFFSET.
+    Returns (posts, next_cursor).
+    """
+    field = SORTS.get(sort, SORTS['recent'])[0]
+    posts = list(marketplace_queryset(sort, cursor)[:page_size + 1])
+
+    position = _decode_cursor(field, cursor)
+    if position and position[0] is not None and len(posts) <= page_size and Marketplace._meta.get_field(field).null:
+        # The seek stops at the last valued row; listings without a value sort after it
+        posts += marketplace_queryset(sort).filter(**{f'{field}__isnull': True})[:page_size + 1 - len(posts)]
+
+    next_cursor = None
+    if len(posts) > page_size:
+        posts = posts[:page_size]
+        last = posts[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return posts, next_cursor
+
+
+def marketplace_queryset(sort='recent', cursor=None):
+    """
+    Available listings in `sort` order, seeking past `cursor`. A cursor with a
+    value only reaches the other valued rows, so the seek stays an index range;
+    marketplace_page() continues into the null block itself.
+    """
+    field, descending = SORTS.get(sort, SORTS['recent'])
+    expression = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+    posts = available_listings().select_related('dealer__user').order_by(expression, '-id' if descending else 'id')
+
+    position = _decode_cursor(field, cursor)
+    if position:
+        posts = posts.filter(_after(field, descending, *position))
+    return posts
+
+
+def marketplace_stats():
+    """Headline numbers from the incrementally maintained summary row (one read)."""
+    summary = MarketplaceSummary.current()
+    return {
+        'post_count': summary.listing_count,
+        'avg_price': summary.avg_price,
+        'total_quantity': summary.total_kg,
+        'top_dealer': summary.top_dealer,
+    }
+
+
+def marketplace_context(request):
+    sort = request.GET.get('sort', 'recent')
+    if sort not in SORTS:
+        sort = 'recent'
+    posts, next_cursor = marketplace_page(sort, request.GET.get('after'))
+    stats = marketplace_stats()
+    return {
+        'posts': posts,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
+        'post_count': stats['post_count'],
+        'avg_price': stats['avg_price'],
+        'total_quantity': stats['total_quantity'] or 0,
+        'top_dealer': stats['top_dealer'],
+        'current_sort': sort,
+    }
+
+
+def _after(field, descending, value, pk):
+    seek = 'lt' if descending else 'gt'
+    if value is None:
+        # Already in the trailing block of rows without a value
+        return Q(**{f'{field}__isnull': True, f'pk__{seek}': pk})
+    # Leading range term keeps this sargable: field >= value AND (field > value OR id > pk)
+    return Q(**{f'{field}__{seek}e': value}) & (Q(**{f'{field}__{seek}': value}) | Q(**{f'pk__{seek}': pk}))
+
+
+def encode_cursor(value, pk):
+    raw = None if value is None else (value.isoformat() if hasattr(value, 'isoformat') else str(value))
+    return base64.urlsafe_b64encode(json.dumps([raw, pk]).encode()).decode()
+
+
+def _decode_cursor(field, cursor):
+    if not cursor:
+        return None
+    try:
+        raw, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = None if raw is None else Marketplace._meta.get_field(field).to_python(raw)
+        return value, int(pk)
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
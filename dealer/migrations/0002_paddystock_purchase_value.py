@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-17 02:51
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_purchase_value(apps, schema_editor):
+    PaddyStock = apps.get_model('dealer', 'PaddyStock')
+    PaddyPurchaseFromFarmer = apps.get_model('dealer', 'PaddyPurchaseFromFarmer')
+
+    totals = (
+        PaddyPurchaseFromFarmer.objects.filter(paddy_stock__isnull=False)
+        .values('paddy_stock')
+        .annotate(value=Sum(F('quantity') * F('purchase_price_per_kg'), output_field=models.DecimalField()))
+    )
+    stocks = []
+    for row in totals:
+        stock = PaddyStock(pk=row['paddy_stock'], purchase_value=row['value'] or 0)
+        stocks.append(stock)
+    PaddyStock.objects.bulk_update(stocks, ['purchase_value'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dealer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paddystock',
+            name='purchase_value',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Running total of quantity × purchase price (₹)', max_digits=14),
+        ),
+        migrations.RunPython(backfill_purchase_value, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    # Continue numbering after the codes issued by the old count()-based scheme
+    ReferenceSequence = apps.get_model('dealer', 'ReferenceSequence')
+    PaddyPurchaseFromFarmer = apps.get_model('dealer', 'PaddyPurchaseFromFarmer')
+
+    last_values = {}
+    for code in PaddyPurchaseFromFarmer.objects.values_list('reference_code', flat=True).iterator():
+        prefix, _, number = (code or '').rpartition('-')
+        if prefix and number.isdigit():
+            last_values[prefix] = max(last_values.get(prefix, 0), int(number))
+
+    ReferenceSequence.objects.bulk_create(
+        ReferenceSequence(key=key, last_value=value) for key, value in last_values.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dealer', '0002_paddystock_purchase_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-17 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_summary(apps, schema_editor):
+    Marketplace = apps.get_model('dealer', 'Marketplace')
+    MarketplaceSummary = apps.get_model('dealer', 'MarketplaceSummary')
+    MarketplaceDealerCount = apps.get_model('dealer', 'MarketplaceDealerCount')
+
+    listings = Marketplace.objects.filter(is_available=True)
+    totals = listings.aggregate(
+        listing_count=Count('id'),
+        priced_count=Count('price_per_kg'),
+        price_sum=Sum('price_per_kg'),
+        total_kg=Sum('quantity'),
+    )
+    MarketplaceSummary.objects.create(
+        pk=1,
+        listing_count=totals['listing_count'],
+        priced_count=totals['priced_count'],
+        price_sum=totals['price_sum'] or 0,
+        total_kg=totals['total_kg'] or 0,
+    )
+    MarketplaceDealerCount.objects.bulk_create(
+        MarketplaceDealerCount(dealer_id=row['dealer'], listing_count=row['listing_count'])
+        for row in listings.values('dealer').annotate(listing_count=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dealer', '0003_referencesequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketplaceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_count', models.PositiveIntegerField(default=0)),
+                ('priced_count', models.PositiveIntegerField(default=0)),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('total_kg', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MarketplaceDealerCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_count', models.IntegerField(db_index=True, default=0)),
+                ('dealer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='marketplace_count', to='dealer.dealerprofile')),
+            ],
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
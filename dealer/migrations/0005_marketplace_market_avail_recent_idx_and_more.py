@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dealer', '0004_marketplacesummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marketplace',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['stored_since', 'id'], name='market_avail_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketplace',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price_per_kg', 'id'], name='market_avail_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketplace',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['moisture_content', 'id'], name='market_avail_moisture_idx'),
+        ),
+    ]
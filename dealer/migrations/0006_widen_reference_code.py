@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dealer', '0005_marketplace_market_avail_recent_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paddypurchasefromfarmer',
+            name='reference_code',
+            field=models.CharField(blank=True, max_length=40, unique=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.utils import timezone
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Subquery, Sum, Value, When
 from django.core.validators import MinValueValidator, MaxValueValidator
 from accounts.models import CustomUser
 from decimal import Decimal, ROUND_HALF_UP
@@ -35,6 +37,30 @@ class DealerProfile(Location):
         return f"{self.user.username}"
 
 
+class ReferenceSequence(models.Model):
+    """Counter behind generated reference codes, one row per prefix/year (and optionally dealer)."""
+    key = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} @ {self.last_value}"
+
+    @classmethod
+    def reserve(cls, key, count=1):
+        """Atomically reserve `count` consecutive numbers and return them as a range."""
+        with transaction.atomic():
+            updated = cls.objects.filter(key=key).update(last_value=F("last_value") + count)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(key=key, last_value=count)
+                except IntegrityError:
+                    # Another request created the row first
+                    cls.objects.filter(key=key).update(last_value=F("last_value") + count)
+            last = cls.objects.filter(key=key).values_list("last_value", flat=True).get()
+        return range(last - count + 1, last + 1)
+
+
 class PaddyStock(models.Model):
     dealer = models.ForeignKey(DealerProfile, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
@@ -44,6 +70,7 @@ class PaddyStock(models.Model):
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="₹ per Kg")
     transport_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="₹ per Kg")
     other_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="₹ per Kg")
+    purchase_value = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Running total of quantity × purchase price (₹)")
     moisture_content = models.DecimalField(max_digits=4, decimal_places=1)
     image = models.ImageField(upload_to='paddy_images/', blank=True, null=True)
     price_per_kg = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, default=0, help_text="Final avg cost per Kg")
@@ -59,6 +86,59 @@ class PaddyStock(models.Model):
     def __str__(self):
         return f"{self.name} [{self.moisture_category}] - {self.available_quantity} Kg"
 
+    def apply_purchase_delta(self, kg, value, transport, other):
+        """Add (or with negative values remove) one farmer lot from the running totals."""
+        new_quantity = self.quantity + int(kg)
+        # Listed kg (quantity - available) stays reserved for the marketplace
+        self.available_quantity = min(max(self.available_quantity + int(kg), 0), max(new_quantity, 0))
+        self.quantity = max(new_quantity, 0)
+        self.purchase_value = Decimal(self.purchase_value or 0) + value
+        self.transport_cost = Decimal(self.transport_cost or 0) + transport
+        self.other_cost = Decimal(self.other_cost or 0) + other
+        # a lot arriving after the stock ran out makes it available again
+        self.is_available = self.quantity > 0
+        self._refresh_averages()
+
+    def recalculate(self):
+        """Rebuild the running totals from the linked farmer purchases (repair path)."""
+        totals = self.purchases.aggregate(
+            kg=Sum("quantity"),
+            value=Sum(F("quantity") * F("purchase_price_per_kg"), output_field=models.DecimalField()),
+            transport=Sum("transport_cost"),
+            other=Sum("other_costs"),
+        )
+        listed = self.quantity - self.available_quantity
+        self.quantity = totals["kg"] or 0
+        self.available_quantity = max(self.quantity - listed, 0)
+        self.purchase_value = Decimal(str(totals["value"] or 0))
+        self.transport_cost = Decimal(str(totals["transport"] or 0))
+        self.other_cost = Decimal(str(totals["other"] or 0))
+        self.is_available = self.quantity > 0
+        self._refresh_averages()
+
+    def _refresh_averages(self):
+        cent = Decimal("0.01")
+        self.purchase_value = Decimal(self.purchase_value).quantize(cent)
+        self.transport_cost = Decimal(self.transport_cost).quantize(cent)
+        self.other_cost = Decimal(self.other_cost).quantize(cent)
+
+        if self.quantity > 0:
+            total_kg = Decimal(self.quantity)
+            self.purchase_price = (self.purchase_value / total_kg).quantize(cent, rounding=ROUND_HALF_UP)
+            self.price_per_kg = (
+                (self.purchase_value + self.transport_cost + self.other_cost) / total_kg
+            ).quantize(cent, rounding=ROUND_HALF_UP)
+        else:
+            # No purchases left → reset stock
+            self.quantity = 0
+            self.available_quantity = 0
+            self.purchase_value = 0
+            self.purchase_price = 0
+            self.transport_cost = 0
+            self.other_cost = 0
+            self.price_per_kg = 0
+            self.is_available = False
+
 
 class PaddyPurchaseFromFarmer(models.Model):
     dealer = models.ForeignKey(DealerProfile, on_delete=models.CASCADE)
@@ -72,15 +152,41 @@ class PaddyPurchaseFromFarmer(models.Model):
     transport_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Total transport cost (₹)")
     other_costs = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Total other costs (₹)")
     total_cost = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
-    reference_code = models.CharField(max_length=20, unique=True, blank=True)
+    reference_code = models.CharField(max_length=40, unique=True, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
         if not self.reference_code:
-            count = PaddyPurchaseFromFarmer.objects.count()
-            self.reference_code = f"PUR-{timezone.now().year}-{count + 1:04d}"
+            self.reference_code = self.reserve_reference_codes(self.dealer)[0]
+
+        self._calculate_total_cost()
+
+        with transaction.atomic():
+            old = PaddyPurchaseFromFarmer.objects.get(pk=self.pk) if self.pk else None
+            self._sync_stock(old)
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def reserve_reference_codes(cls, dealer=None, count=1):
+        """Reserve `count` reference codes in one round trip (bulk imports ask for a block)."""
+        year = timezone.now().year
+        if dealer is not None and getattr(settings, "PADDY_PURCHASE_REFERENCE_PER_DEALER", False):
+            prefix = f"PUR-{year}-{dealer.pk}"
+        else:
+            prefix = f"PUR-{year}"
+        return [f"{prefix}-{number:04d}" for number in ReferenceSequence.reserve(prefix, count)]
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            stock = PaddyStock.objects.select_for_update().filter(pk=self.paddy_stock_id).first()
+            result = super().delete(*args, **kwargs)
+            if stock:
+                stock.apply_purchase_delta(*self._stock_delta(sign=-1))
+                stock.save()
+        return result
 
+    def _calculate_total_cost(self):
         quantity = Decimal(str(self.quantity or 0))
         purchase_price = Decimal(str(self.purchase_price_per_kg or 0))
         transport_cost = Decimal(str(self.transport_cost or 0))
@@ -89,10 +195,6 @@ class PaddyPurchaseFromFarmer(models.Model):
         # Cost fully in Kg
         self.total_cost = (quantity * purchase_price) + transport_cost + other_costs
 
-        old = PaddyPurchaseFromFarmer.objects.get(pk=self.pk) if self.pk else None
-        super().save(*args, **kwargs)
-        self._sync_stock(old)
-
     def _get_moisture_category(self):
         if self.moisture_content <= 13.5:
             return "Easy"
@@ -100,98 +202,40 @@ class PaddyPurchaseFromFarmer(models.Model):
             return "Medium"
         return "Hard"
 
-    def _sync_stock(self, old=None):
-        moisture_category = self._get_moisture_category()
+    def _stock_delta(self, sign=1):
+        kg = Decimal(self.quantity or 0)
+        return (
+            sign * kg,
+            sign * kg * Decimal(str(self.purchase_price_per_kg or 0)),
+            sign * Decimal(str(self.transport_cost or 0)),
+            sign * Decimal(str(self.other_costs or 0)),
+        )
 
+    def _sync_stock(self, old=None):
+        """Move this lot's contribution between stock rows in O(1) instead of rescanning."""
         stock, created = PaddyStock.objects.get_or_create(
             dealer=self.dealer,
             name=self.paddy_type,
-            moisture_category=moisture_category,
-            defaults={
-                "quantity": 0,
-                "available_quantity": 0,
-                "purchase_price": 0,
-                "transport_cost": 0,
-                "other_cost": 0,
-                "moisture_content": self.moisture_content,
-            },
+            moisture_category=self._get_moisture_category(),
+            defaults={"moisture_content": self.moisture_content},
         )
-
-        purchases = PaddyPurchaseFromFarmer.objects.filter(
-            dealer=self.dealer, paddy_type=self.paddy_type
-        )
-
-        total_kg = Decimal("0.00")
-        total_purchase_price = Decimal("0.00")
-        total_transport = Decimal("0.00")   
-        total_other = Decimal("0.00")    
-
-        for p in purchases:
-            total_kg += Decimal(p.quantity)
-            total_purchase_price += Decimal(p.quantity) * (p.purchase_price_per_kg or 0)
-            total_transport += Decimal(p.transport_cost or 0)
-            total_other += Decimal(p.other_costs or 0)
-
-        if total_kg > 0:
-            stock.quantity = int(total_kg)
-            stock.available_quantity = stock.quantity
-            stock.purchase_price = (total_purchase_price / total_kg).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            stock.transport_cost = total_transport.quantize(Decimal("0.01"))
-            stock.other_cost = total_other.quantize(Decimal("0.01"))
-            stock.price_per_kg = (
-                (total_purchase_price + total_transport + total_other) / total_kg
-            ).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
+        stock = PaddyStock.objects.select_for_update().get(pk=stock.pk)
+
+        delta = self._stock_delta()
+        if old and old.paddy_stock_id == stock.pk:
+            # Edit within the same stock row: apply the net change in one step
+            delta = tuple(new + prev for new, prev in zip(delta, old._stock_delta(sign=-1)))
+        elif old and old.paddy_stock_id:
+            old_stock = PaddyStock.objects.select_for_update().filter(pk=old.paddy_stock_id).first()
+            if old_stock:
+                old_stock.apply_purchase_delta(*old._stock_delta(sign=-1))
+                old_stock.save()
+
+        stock.apply_purchase_delta(*delta)
         stock.moisture_content = self.moisture_content
         stock.save()
 
         self.paddy_stock = stock
-        super().save(update_fields=["paddy_stock"])
-
-        def delete(self, *args, **kwargs):
-            stock = self.paddy_stock
-            super().delete(*args, **kwargs)
-
-            if stock:
-                self._recalculate_stock(stock)
-
-        def _recalculate_stock(self, stock):
-            purchases = PaddyPurchaseFromFarmer.objects.filter(
-                dealer=stock.dealer, paddy_type=stock.name
-            )
-
-            total_kg = Decimal("0.00")
-            total_purchase_price = Decimal("0.00")
-            total_transport = Decimal("0.00")
-            total_other = Decimal("0.00")
-
-            for p in purchases:
-                total_kg += Decimal(p.quantity)
-                total_purchase_price += Decimal(p.quantity) * (p.purchase_price_per_kg or 0)
-                total_transport += Decimal(p.transport_cost or 0)
-                total_other += Decimal(p.other_costs or 0)
-
-            if total_kg > 0:
-                stock.quantity = int(total_kg)
-                stock.available_quantity = stock.quantity
-                stock.purchase_price = (total_purchase_price / total_kg).quantize(Decimal("0.01"))
-                stock.transport_cost = total_transport.quantize(Decimal("0.01"))
-                stock.other_cost = total_other.quantize(Decimal("0.01"))
-                stock.price_per_kg = (
-                    (total_purchase_price + total_transport + total_other) / total_kg
-                ).quantize(Decimal("0.01"))
-                stock.is_available = True
-            else:
-                # No purchases left → reset stock
-                stock.quantity = 0
-                stock.available_quantity = 0
-                stock.purchase_price = 0
-                stock.transport_cost = 0
-                stock.other_cost = 0
-                stock.price_per_kg = 0
-                stock.is_available = False
-
-            stock.save()
 
 
 class Marketplace(models.Model):
@@ -213,9 +257,67 @@ class Marketplace(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Draft')
     stored_since = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # One per marketplace sort, over available listings only. Partial rather than
+        # leading with is_available: Django filters booleans as a bare `WHERE is_available`,
+        # which SQLite cannot seek an index on but does match against an index condition.
+        indexes = [
+            models.Index(fields=['stored_since', 'id'], condition=Q(is_available=True), name='market_avail_recent_idx'),
+            models.Index(fields=['price_per_kg', 'id'], condition=Q(is_available=True), name='market_avail_price_idx'),
+            models.Index(fields=['moisture_content', 'id'], condition=Q(is_available=True), name='market_avail_moisture_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.quantity} Kg @ ₹{self.price_per_kg}/Kg"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(field in field_names for field in ("is_available", "dealer_id", "quantity", "price_per_kg")):
+            instance._summary_snapshot = instance.summary_contribution()
+        return instance
+
+    def summary_contribution(self):
+        """What this listing adds to MarketplaceSummary: (dealer id, Kg, price) or None when not listed."""
+        if not self.is_available:
+            return None
+        return (self.dealer_id, self.quantity, self.price_per_kg)
+
+    def capture_summary_snapshot(self):
+        """
+        Make sure _summary_snapshot holds the stored row's contribution. from_db()
+        takes it for free when the fields are loaded; a listing loaded with
+        only()/defer() (or built with a pk) reads them here instead of passing
+        for a new listing, which would count it twice.
+        """
+        if hasattr(self, "_summary_snapshot"):
+            return
+        row = type(self).objects.filter(pk=self.pk).values_list(
+            "is_available", "dealer_id", "quantity", "price_per_kg",
+        ).first() if self.pk else None
+        self._summary_snapshot = tuple(row[1:]) if row and row[0] else None
+
+    @classmethod
+    def reserve_quantity(cls, listing_id, kg):
+        """
+        Take `kg` off an available listing in one conditional UPDATE.
+        Returns False (and changes nothing) when the listing cannot cover it.
+        """
+        sold_out = Q(quantity=kg)
+        # is_available/status are assigned before quantity so they see the pre-update value on every backend
+        reserved = cls.objects.filter(pk=listing_id, is_available=True, quantity__gte=kg).update(
+            is_available=Case(When(sold_out, then=Value(False)), default=Value(True)),
+            status=Case(When(sold_out, then=Value('Sold')), default=F('status')),
+            quantity=F('quantity') - kg,
+        ) == 1
+        if reserved:
+            dealer_id, remaining, price = cls.objects.filter(pk=listing_id).values_list("dealer_id", "quantity", "price_per_kg").get()
+            MarketplaceSummary.apply(
+                (dealer_id, remaining + kg, price),
+                (dealer_id, remaining, price) if remaining > 0 else None,
+            )
+        return reserved
+
     def save(self, *args, **kwargs):
         if not self.pk:
             if self.quantity > self.paddy_stock.available_quantity:
@@ -228,5 +330,114 @@ class Marketplace(models.Model):
             self.moisture_content = self.moisture_content or self.paddy_stock.moisture_content
             self.price_per_kg = self.price_per_kg or self.paddy_stock.price_per_kg
             self.quality_notes = self.quality_notes or self.paddy_stock.quality_notes
+        else:
+            self.capture_summary_snapshot()
 
         super().save(*args, **kwargs)
+
+
+class MarketplaceSummary(models.Model):
+    """
+    Running totals over available Marketplace listings (a single row), kept in
+    step by the listing signals and the purchase path so the marketplace
+    headline numbers cost one read.
+    """
+    listing_count = models.PositiveIntegerField(default=0)
+    priced_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_kg = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    SINGLETON_ID = 1
+
+    def __str__(self):
+        return f"{self.listing_count} listings, {self.total_kg} Kg"
+
+    @property
+    def avg_price(self):
+        if not self.priced_count:
+            return None
+        return (self.price_sum / self.priced_count).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+    @classmethod
+    def apply(cls, old, new):
+        """Swap one listing's old contribution for its new one (either may be None)."""
+        if old == new:
+            return
+
+        counts = {"listing_count": 0, "priced_count": 0, "price_sum": Decimal("0"), "total_kg": 0}
+        for contribution, sign in ((old, -1), (new, 1)):
+            if contribution is None:
+                continue
+            dealer_id, kg, price = contribution
+            counts["listing_count"] += sign
+            counts["total_kg"] += sign * (kg or 0)
+            if price is not None:
+                counts["priced_count"] += sign
+                counts["price_sum"] += sign * Decimal(price)
+
+        changes = {field: F(field) + value for field, value in counts.items() if value}
+        if changes and not cls.objects.filter(pk=cls.SINGLETON_ID).update(**changes):
+            cls.rebuild()
+            return
+
+        old_dealer = old[0] if old else None
+        new_dealer = new[0] if new else None
+        if old_dealer != new_dealer:
+            if old_dealer:
+                MarketplaceDealerCount.bump(old_dealer, -1)
+            if new_dealer:
+                MarketplaceDealerCount.bump(new_dealer, 1)
+
+    @classmethod
+    def current(cls):
+        """Summary row with the top dealer's username annotated, in one query."""
+        top_dealer = (
+            MarketplaceDealerCount.objects.filter(listing_count__gt=0)
+            .order_by("-listing_count", "dealer_id")
+            .values("dealer__user__username")[:1]
+        )
+        summary = cls.objects.annotate(top_dealer=Subquery(top_dealer)).filter(pk=cls.SINGLETON_ID).first()
+        return summary or cls.rebuild()
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the summary and per-dealer counts from the Marketplace table."""
+        with transaction.atomic():
+            listings = Marketplace.objects.filter(is_available=True)
+            totals = listings.aggregate(
+                listing_count=Count("id"),
+                priced_count=Count("price_per_kg"),
+                price_sum=Sum("price_per_kg"),
+                total_kg=Sum("quantity"),
+            )
+            summary, created = cls.objects.select_for_update().get_or_create(pk=cls.SINGLETON_ID)
+            summary.listing_count = totals["listing_count"]
+            summary.priced_count = totals["priced_count"]
+            summary.price_sum = totals["price_sum"] or 0
+            summary.total_kg = totals["total_kg"] or 0
+            summary.save()
+
+            MarketplaceDealerCount.objects.all().delete()
+            MarketplaceDealerCount.objects.bulk_create(
+                MarketplaceDealerCount(dealer_id=row["dealer"], listing_count=row["listing_count"])
+                for row in listings.filter(dealer__isnull=False).values("dealer").annotate(listing_count=Count("id"))
+            )
+        return cls.current()
+
+
+class MarketplaceDealerCount(models.Model):
+    dealer = models.OneToOneField(DealerProfile, on_delete=models.CASCADE, related_name="marketplace_count")
+    listing_count = models.IntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.dealer} - {self.listing_count} listings"
+
+    @classmethod
+    def bump(cls, dealer_id, step):
+        if not cls.objects.filter(dealer_id=dealer_id).update(listing_count=F("listing_count") + step):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(dealer_id=dealer_id, listing_count=max(step, 0))
+            except IntegrityError:
+                cls.objects.filter(dealer_id=dealer_id).update(listing_count=F("listing_count") + step)
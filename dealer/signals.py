@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .models import Marketplace, MarketplaceSummary
+
+
+@receiver(post_save, sender=Marketplace)
+def update_marketplace_summary_on_save(sender, instance, created, **kwargs):
+    new = instance.summary_contribution()
+    MarketplaceSummary.apply(getattr(instance, '_summary_snapshot', None), new)
+    instance._summary_snapshot = new
+
+
+@receiver(pre_delete, sender=Marketplace)
+def capture_marketplace_summary_snapshot(sender, instance, **kwargs):
+    # the row is gone by post_delete, too late to read a deferred listing's fields
+    instance.capture_summary_snapshot()
+
+
+@receiver(post_delete, sender=Marketplace)
+def update_marketplace_summary_on_delete(sender, instance, **kwargs):
+    # Also runs for listings removed by a PaddyStock/DealerProfile cascade
+    MarketplaceSummary.apply(instance._summary_snapshot, None)
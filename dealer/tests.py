@@ -1,3 +1,420 @@
-from django.test import TestCase
+import json
+import random
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from RSCMS_app.benchmark import seed_supply_chain
+from RSCMS_app.queries import QueryBudgetChecks, QueryPlanAssertions
+from accounts.models import CustomUser
+from manager.models import Purchase_paddy
+from .forms import PaddyPurchaseForm
+from .marketplace import PAGE_SIZE, SORTS, encode_cursor, marketplace_page, marketplace_queryset
+from .models import DealerProfile, Marketplace, MarketplaceSummary, PaddyPurchaseFromFarmer, PaddyStock, ReferenceSequence
+
+
+@skipUnless(connection.vendor == "sqlite", "plans are read from SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+    def test_marketplace_sorts_use_an_index(self):
+        since = timezone.now() - timedelta(days=30)
+        for sort, (field, descending) in SORTS.items():
+            with self.subTest(sort=sort):
+                self.assertServedByIndex(marketplace_queryset(sort))
+            # later pages seek past a cursor and must stay on the same index
+            with self.subTest(sort=sort, page="next"):
+                cursor = encode_cursor(since if field == "stored_since" else 1, 1)
+                self.assertServedByIndex(marketplace_queryset(sort, cursor))
+
+    def test_dealer_orders_use_an_index(self):
+        since = timezone.now() - timedelta(days=30)
+        self.assertServedByIndex(Purchase_paddy.objects.filter(paddy__dealer=1).order_by("-purchase_date"))
+        self.assertServedByIndex(Purchase_paddy.objects.filter(paddy__dealer=1, purchase_date__gte=since))
+
+
+class QueryBudgetTests(QueryBudgetChecks, TestCase):
+    app_label = "dealer"
+
+
+def rescan(dealer, paddy_type):
+    """The totals the old full rescan wrote: every purchase of the dealer's paddy type, summed again."""
+    total_kg = total_price = total_transport = total_other = Decimal("0.00")
+    for p in PaddyPurchaseFromFarmer.objects.filter(dealer=dealer, paddy_type=paddy_type):
+        total_kg += Decimal(p.quantity)
+        total_price += Decimal(p.quantity) * (p.purchase_price_per_kg or 0)
+        total_transport += Decimal(p.transport_cost or 0)
+        total_other += Decimal(p.other_costs or 0)
+    if not total_kg:
+        return {"quantity": 0, "purchase_price": 0, "transport_cost": 0, "other_cost": 0, "price_per_kg": 0}
+    cent = Decimal("0.01")
+    return {
+        "quantity": int(total_kg),
+        "purchase_price": (total_price / total_kg).quantize(cent, rounding=ROUND_HALF_UP),
+        "transport_cost": total_transport.quantize(cent),
+        "other_cost": total_other.quantize(cent),
+        "price_per_kg": ((total_price + total_transport + total_other) / total_kg).quantize(cent, rounding=ROUND_HALF_UP),
+    }
+
+
+class PaddyStockTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(username="dealer", password="dealer", role="dealer")
+        cls.dealer = DealerProfile.objects.create(user=user, license_number="L-1", storage_capacity=10**6)
+
+    def buy(self, kg, price="20.00", transport="100.00", other="0", paddy_type="Swarna", moisture="14.0"):
+        return PaddyPurchaseFromFarmer.objects.create(
+            dealer=self.dealer, farmer_name="Farmer", paddy_type=paddy_type, quantity=kg,
+            purchase_price_per_kg=Decimal(price), moisture_content=Decimal(moisture),
+            transport_cost=Decimal(transport), other_costs=Decimal(other),
+        )
+
+    def stock(self, paddy_type="Swarna"):
+        stock = PaddyStock.objects.get(dealer=self.dealer, name=paddy_type)
+        return {field: getattr(stock, field) for field in rescan(self.dealer, paddy_type)}
+
+    def test_incremental_totals_match_the_old_rescan(self):
+        rng = random.Random(7)
+        lots = []
+        for step in range(60):
+            action = rng.random()
+            if lots and action < 0.2:
+                lots.pop(rng.randrange(len(lots))).delete()
+            elif lots and action < 0.45:
+                lot = rng.choice(lots)
+                lot.quantity = rng.randint(1, 900)
+                lot.purchase_price_per_kg = Decimal(rng.randint(1500, 3000)) / 100
+                lot.transport_cost = Decimal(rng.randint(0, 50000)) / 100
+                lot.save()
+            else:
+                lots.append(self.buy(
+                    rng.randint(1, 900), price=str(Decimal(rng.randint(1500, 3000)) / 100),
+                    transport=str(Decimal(rng.randint(0, 50000)) / 100), other=str(Decimal(rng.randint(0, 9999)) / 100),
+                    moisture=rng.choice(["14.0", "14.5", "15.0"]),
+                ))
+            with self.subTest(step=step):
+                self.assertEqual(self.stock(), rescan(self.dealer, "Swarna"))
+
+    def test_stock_is_available_again_after_running_out(self):
+        self.buy(100).delete()
+        self.assertFalse(PaddyStock.objects.get(dealer=self.dealer).is_available)
+        self.buy(50)
+        stock = PaddyStock.objects.get(dealer=self.dealer)
+        self.assertTrue(stock.is_available)
+        self.assertEqual(stock.quantity, 50)
+
+
+class ReferenceCodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user(username="dealer", password="dealer", role="dealer")
+        # a pk and a count past the four digits the codes are padded to
+        cls.dealer = DealerProfile.objects.create(pk=123456, user=user, license_number="L-1", storage_capacity=10**6)
+
+    def buy(self):
+        purchase = PaddyPurchaseFromFarmer(
+            dealer=self.dealer, farmer_name="Farmer", paddy_type="Swarna", quantity=10,
+            purchase_price_per_kg=Decimal("20.00"), moisture_content=Decimal("14.0"),
+        )
+        purchase.save()
+        # SQLite doesn't enforce max_length, the model validation does
+        purchase.full_clean()
+        return purchase
+
+    def test_reserved_blocks_are_contiguous_and_never_overlap(self):
+        first = ReferenceSequence.reserve("TEST")
+        block = ReferenceSequence.reserve("TEST", count=5)
+        last = ReferenceSequence.reserve("TEST")
+        self.assertEqual(list(first), [1])
+        self.assertEqual(list(block), [2, 3, 4, 5, 6])
+        self.assertEqual(list(last), [7])
+        self.assertEqual(list(ReferenceSequence.reserve("OTHER", count=2)), [1, 2])
+
+    def test_codes_are_numbered_per_year(self):
+        year = timezone.now().year
+        codes = [self.buy().reference_code for _ in range(3)]
+        self.assertEqual(codes, [f"PUR-{year}-0001", f"PUR-{year}-0002", f"PUR-{year}-0003"])
+
+    @override_settings(PADDY_PURCHASE_REFERENCE_PER_DEALER=True)
+    def test_per_dealer_codes_carry_the_dealer(self):
+        year = timezone.now().year
+        ReferenceSequence.objects.create(key=f"PUR-{year}-{self.dealer.pk}", last_value=99998)
+        codes = [self.buy().reference_code for _ in range(2)]
+        self.assertEqual(codes, [f"PUR-{year}-123456-99999", f"PUR-{year}-123456-100000"])
+        self.assertEqual(
+            list(PaddyPurchaseFromFarmer.objects.order_by("id").values_list("reference_code", flat=True)), codes,
+        )
+
+
+class PurchaseImportTests(TestCase):
+    HEADER = "farmer_name,farmer_phone,paddy_type,quantity,purchase_price_per_kg,moisture_content,transport_cost,other_costs\n"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username="dealer", password="dealer", role="dealer")
+        cls.dealer = DealerProfile.objects.create(user=cls.user, license_number="L-1", storage_capacity=10**6)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, content, name="lots.csv"):
+        if isinstance(content, str):
+            content = content.encode()
+        return self.client.post(reverse("import_purchases"), {"file": SimpleUploadedFile(name, content)})
+
+    def test_bad_rows_are_skipped_and_the_rest_imported(self):
+        response = self.upload(self.HEADER + (
+            "Ravi,9876543210,Swarna,100,20,14.0,50,0\n"
+            "Sita,12345,Swarna,100,20,14.0,0,0\n"      # phone
+            "Gopal,,Swarna,0,20,14.0,0,0\n"            # quantity
+            "Lakshmi,,IR64,250.0,22.50,13.2,,\n"        # spreadsheet-style integer, blank costs
+            "Anil,,Swarna,100,20,31.0,0,0\n"           # moisture
+        ))
+        result = response.context["result"]
+        self.assertEqual((result["created"], result["skipped"]), (2, 3))
+        self.assertEqual([line for line, _ in result["errors"]], [3, 4, 6])
+        self.assertIn("farmer_phone", result["errors"][0][1])
+        self.assertEqual(
+            sorted(PaddyPurchaseFromFarmer.objects.values_list("farmer_name", "quantity")), [("Lakshmi", 250), ("Ravi", 100)],
+        )
+        self.assertEqual(PaddyStock.objects.get(dealer=self.dealer, name="IR64").quantity, 250)
+
+    def test_rows_are_cleaned_like_the_purchase_form(self):
+        rows = [
+            {"farmer_name": "A", "paddy_type": "Swarna", "quantity": "10.0", "purchase_price_per_kg": "20", "moisture_content": "14"},
+            {"farmer_name": "B", "paddy_type": "Swarna", "quantity": "10", "purchase_price_per_kg": "20", "moisture_content": "14.25"},
+            {"farmer_name": "C", "paddy_type": "Swarna", "quantity": "10", "purchase_price_per_kg": "20", "moisture_content": "4.9"},
+            {"farmer_name": "D", "farmer_phone": "5876543210", "paddy_type": "Swarna", "quantity": "10", "moisture_content": "14"},
+        ]
+        jsonl = "\n".join(json.dumps(row) for row in rows)
+        result = self.upload(jsonl, name="lots.jsonl").context["result"]
+        imported = set(PaddyPurchaseFromFarmer.objects.values_list("farmer_name", flat=True))
+        for row in rows:
+            form = PaddyPurchaseForm(data={"transport_cost": 0, "other_costs": 0, **row})
+            with self.subTest(row["farmer_name"]):
+                self.assertEqual(row["farmer_name"] in imported, form.is_valid())
+        self.assertEqual(result["created"] + result["skipped"], len(rows))
+
+    def test_file_that_is_not_utf8_is_a_form_error(self):
+        response = self.upload((self.HEADER + "Ravi,,Swarna,100,20,14.0,0,0\nJosé,,Swarna,100,20,14.0,0,0\n").encode("latin-1"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("not UTF-8", response.context["form"].errors["file"][0])
+        self.assertIsNone(response.context["result"])
+        self.assertFalse(PaddyPurchaseFromFarmer.objects.exists())
+
+    def test_broken_csv_is_a_form_error(self):
+        response = self.upload(self.HEADER + 'Ravi,,Swarna,100,20,14.0,0,0\n"Sita,,Swarna,100,20,14.0,0,0\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("not valid CSV", response.context["form"].errors["file"][0])
+        # the good line before it is rolled back with the rest
+        self.assertFalse(PaddyPurchaseFromFarmer.objects.exists())
+        self.assertFalse(PaddyStock.objects.exists())
+
+
+class SummaryAssertions:
+    def assertSummaryMatchesListings(self):
+        fields = ("listing_count", "priced_count", "price_sum", "total_kg")
+        kept = MarketplaceSummary.objects.values(*fields).get()
+        MarketplaceSummary.rebuild()
+        self.assertEqual(kept, MarketplaceSummary.objects.values(*fields).get())
+
+
+class MarketplaceSummaryTests(SummaryAssertions, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_supply_chain(orders=0)
+
+    def test_partially_loaded_listing_is_not_counted_twice(self):
+        MarketplaceSummary.rebuild()
+        listing = Marketplace.objects.only("quantity").first()
+        listing.quantity -= 10
+        listing.save()
+        self.assertSummaryMatchesListings()
+
+        listing = Marketplace.objects.defer("price_per_kg", "is_available").first()
+        listing.is_available = False
+        listing.save(update_fields=["is_available"])
+        self.assertSummaryMatchesListings()
+
+    def test_partially_loaded_listing_is_taken_off_on_delete(self):
+        MarketplaceSummary.rebuild()
+        Marketplace.objects.only("id").filter(is_available=True).first().delete()
+        self.assertSummaryMatchesListings()
+
+
+class MarketplaceReservationTests(SummaryAssertions, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.listing = Marketplace.objects.order_by("id").first()
+
+    def setUp(self):
+        MarketplaceSummary.rebuild()
+
+    def reload(self):
+        return Marketplace.objects.get(pk=self.listing.pk)
+
+    def test_partial_reservation_keeps_the_listing_available(self):
+        self.assertTrue(Marketplace.reserve_quantity(self.listing.pk, 400))
+        listing = self.reload()
+        self.assertEqual(listing.quantity, self.listing.quantity - 400)
+        self.assertTrue(listing.is_available)
+        self.assertEqual(listing.status, self.listing.status)
+        self.assertSummaryMatchesListings()
+
+    def test_reserving_the_rest_sells_the_listing_out(self):
+        self.assertTrue(Marketplace.reserve_quantity(self.listing.pk, 400))
+        self.assertTrue(Marketplace.reserve_quantity(self.listing.pk, self.listing.quantity - 400))
+        listing = self.reload()
+        self.assertEqual(listing.quantity, 0)
+        self.assertFalse(listing.is_available)
+        self.assertEqual(listing.status, "Sold")
+        self.assertSummaryMatchesListings()
+
+    def test_oversell_is_refused_and_changes_nothing(self):
+        self.assertFalse(Marketplace.reserve_quantity(self.listing.pk, self.listing.quantity + 1))
+        self.assertEqual(self.reload().quantity, self.listing.quantity)
+        self.assertSummaryMatchesListings()
+
+        Marketplace.reserve_quantity(self.listing.pk, self.listing.quantity)
+        self.assertFalse(Marketplace.reserve_quantity(self.listing.pk, 1))
+        self.assertSummaryMatchesListings()
+
+    def test_purchase_over_the_listed_quantity_is_a_form_error(self):
+        Marketplace.objects.filter(pk=self.listing.pk).update(quantity=100)
+        self.client.force_login(self.users["manager"][0])
+        url = reverse("purchase_paddy", args=[self.listing.pk])
+
+        response = self.client.post(url, {"quantity_purchased": 101, "transport_cost": 0})
+        self.assertIn("Not enough stock available.", response.context["form"].errors["quantity_purchased"])
+        self.assertFalse(Purchase_paddy.objects.exists())
+
+        self.client.post(url, {"quantity_purchased": 100, "transport_cost": 0})
+        self.assertEqual(Purchase_paddy.objects.get().quantity_purchased, 100)
+        self.assertFalse(self.reload().is_available)
+
+
+class MarketplacePaginationTests(TestCase):
+    PAGE_SIZE = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_supply_chain(orders=0)
+        stock = PaddyStock.objects.order_by("id").first()
+        rng = random.Random(3)
+        same_moment = timezone.now()
+        for i in range(21):
+            listing = Marketplace.objects.create(
+                paddy_stock=stock, dealer=stock.dealer, quantity=10, status="Published",
+                price_per_kg=Decimal(rng.choice(["24.00", "25.00", "26.50"])),
+                moisture_content=Decimal(rng.choice(["13.5", "14.0"])),
+            )
+            # ties on every sort key, and listings without a price after the priced ones
+            Marketplace.objects.filter(pk=listing.pk).update(
+                stored_since=same_moment if i % 3 else same_moment - timedelta(hours=i),
+                price_per_kg=None if i % 5 == 0 else listing.price_per_kg,
+            )
+        Marketplace.objects.filter(pk=Marketplace.objects.order_by("id")[3].pk).update(is_available=False)
+
+    def expected_order(self, sort):
+        field, descending = SORTS[sort]
+        listings = list(Marketplace.objects.filter(is_available=True))
+        valued = sorted(
+            (listing for listing in listings if getattr(listing, field) is not None),
+            key=lambda listing: (getattr(listing, field), listing.pk), reverse=descending,
+        )
+        unvalued = sorted(
+            (listing for listing in listings if getattr(listing, field) is None),
+            key=lambda listing: listing.pk, reverse=descending,
+        )
+        return [listing.pk for listing in valued + unvalued]
+
+    def walk(self, sort):
+        seen, cursor, pages = [], None, 0
+        while True:
+            posts, cursor = marketplace_page(sort, cursor, page_size=self.PAGE_SIZE)
+            self.assertLessEqual(len(posts), self.PAGE_SIZE)
+            seen += [post.pk for post in posts]
+            pages += 1
+            if cursor is None:
+                return seen, pages
+
+    def test_cursors_walk_every_listing_once_in_order(self):
+        for sort in SORTS:
+            with self.subTest(sort=sort):
+                expected = self.expected_order(sort)
+                seen, pages = self.walk(sort)
+                self.assertEqual(seen, expected)
+                self.assertEqual(pages, -(-len(expected) // self.PAGE_SIZE))
+
+    def test_unreadable_cursor_starts_from_the_first_page(self):
+        first_page, _ = marketplace_page("price_asc", page_size=self.PAGE_SIZE)
+        for cursor in ["garbage", encode_cursor("not a price", 1), "W251bGxd"]:
+            with self.subTest(cursor=cursor):
+                posts, _ = marketplace_page("price_asc", cursor, page_size=self.PAGE_SIZE)
+                self.assertEqual(posts, first_page)
+
+    def test_marketplace_page_links_to_the_next_page(self):
+        stock = PaddyStock.objects.order_by("id").first()
+        for _ in range(PAGE_SIZE):
+            Marketplace.objects.create(paddy_stock=stock, dealer=stock.dealer, quantity=10, status="Published")
+        self.client.force_login(CustomUser.objects.filter(role="manager").first())
+        response = self.client.get(reverse("explore_paddy_post"), {"sort": "price_desc"})
+        cursor = response.context["next_cursor"]
+        self.assertTrue(response.context["is_first_page"])
+        response = self.client.get(reverse("explore_paddy_post"), {"sort": "price_desc", "after": cursor})
+        self.assertFalse(response.context["is_first_page"])
+        self.assertEqual(
+            [post.pk for post in response.context["posts"]],
+            self.expected_order("price_desc")[PAGE_SIZE:2 * PAGE_SIZE],
+        )
+
+
+class DealerStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.listing, cls.other_dealers_listing = Marketplace.objects.order_by("id")
+        manager = cls.users["manager"][0]
+
+        def order(listing, kg, price, status="Pending", days_ago=0, confirmed=False):
+            purchase = Purchase_paddy.objects.create(
+                manager=manager, paddy=listing, quantity_purchased=kg, total_price=Decimal(price), is_confirmed=confirmed,
+            )
+            if days_ago:
+                Purchase_paddy.objects.filter(pk=purchase.pk).update(purchase_date=timezone.now() - timedelta(days=days_ago))
+                purchase.refresh_from_db()
+            purchase.status = status
+            purchase.save()
+
+        order(cls.listing, 40, "1000.00", status="Successful", confirmed=True)
+        order(cls.listing, 80, "2000.00", confirmed=True)   # confirmed, not yet Successful
+        order(cls.listing, 20, "500.00", status="Successful", days_ago=40, confirmed=True)
+        order(cls.listing, 10, "250.00")
+        order(cls.other_dealers_listing, 60, "1500.00", status="Successful", confirmed=True)
+
+    def setUp(self):
+        self.client.force_login(self.listing.dealer.user)
+        self.context = self.client.get(reverse("dealer_stats")).context
+
+    def test_sales_series_counts_successful_orders_of_the_last_30_days(self):
+        self.assertEqual(self.context["sales_labels"], [timezone.localdate().strftime("%b %d")])
+        self.assertEqual(self.context["sales_data"], [1000.0])
+        self.assertEqual(self.context["quantity_sold"], [40.0])
+        self.assertEqual(self.context["total_quantity_sold"], 40.0)
+
+    def test_top_varieties_share_all_successful_revenue(self):
+        self.assertEqual(self.context["top_varieties_labels"], [self.listing.name])
+        self.assertEqual(self.context["top_varieties_data"], [100])
+
+    def test_order_counts_and_inventory(self):
+        self.assertEqual(self.context["completed_orders"], 3)
+        self.assertEqual(self.context["pending_orders"], 1)
+        self.assertEqual(self.context["order_status_data"], [3, 1, 0, 1])
+        stock, = [row for row in self.context["inventory_status"] if row["name"] == self.listing.paddy_stock.name]
+        self.assertEqual(stock["sold"], 140.0)
@@ -17,6 +17,7 @@ urlpatterns = [
     
     # selling history
     path('selling_paddy_history/', views.selling_paddy_history, name='selling_paddy_history'),
+    path('selling_paddy_history/export/', views.export_selling_paddy_history, name='export_selling_paddy_history'),
     
     # paddy order review page for dealer
     path('incoming_order_for_paddy/', views.incoming_order_for_paddy, name='incoming_order_for_paddy'),
@@ -27,6 +28,8 @@ urlpatterns = [
     #latest update
     path('paddy-purchase/add/', views.create_purchase, name='paddy_purchase_add'),
     path('purchases/', views.all_purchases_list, name='all_purchases_list'),
+    path('purchases/export/', views.export_farmer_purchases, name='export_farmer_purchases'),
+    path('purchases/import/', views.import_purchases, name='import_purchases'),
 
     path('marketplace/create/<int:id>/', views.create_marketplace_post, name='create_marketplace_post'),
 
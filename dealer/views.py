@@ -6,14 +6,20 @@ from accounts.models import CustomUser
 from dealer.forms import DealerProfileForm, PaddyStockForm
 from dealer.models import DealerProfile, PaddyStock
 from manager.models import Purchase_paddy
+from RSCMS_app import exports
+from RSCMS_app.models import DailySales
+from RSCMS_app.queries import query_budget
 from django.utils import timezone
 from datetime import timedelta, datetime
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Coalesce, Now
 
 from django.contrib import messages
-from django.db.models import Sum, Count, Avg, F, Q, Case, When, Value, FloatField
+from django.db.models import Sum, Count, Avg, F, Q, Case, When, Value, FloatField, DurationField, ExpressionWrapper
 from .models import DealerProfile, Marketplace, PaddyPurchaseFromFarmer, PaddyStock
-from .forms import DealerProfileEditForm, MarketplaceForm, PaddyPurchaseForm
+from .forms import DealerProfileEditForm, MarketplaceForm, PaddyPurchaseForm, PurchaseImportForm
+from .imports import PurchaseFileError, guess_format, import_farmer_purchases, iter_purchase_rows
+from .marketplace import marketplace_context
+import io
 
 def check_dealer(user):
     return user.is_authenticated and user.role == 'dealer'
@@ -102,30 +108,7 @@ def add_paddy_post(request):
 
 
 def see_all_paddy_posts(request):
-    sort = request.GET.get('sort', 'recent')
-    posts = Marketplace.objects.filter(is_available=True)
-    
-    if sort == 'price_asc':
-        posts = posts.order_by('price_per_kg')
-    elif sort == 'price_desc':
-        posts = posts.order_by('-price_per_kg')
-    elif sort == 'moisture':
-        posts = posts.order_by('moisture_content')
-    else:
-        posts = posts.order_by('-stored_since')
-
-
-    avg_price = posts.aggregate(avg=Avg('price_per_kg'))['avg'] or 0
-    total_quantity = posts.aggregate(total=Sum('quantity'))['total'] or 0
-    top_dealer = posts.values('dealer__user__username').annotate(post_count=Count('id')).order_by('-post_count').first()
-
-    return render(request, 'dealer/paddy_posts.html', {
-        'posts': posts,
-        'avg_price': avg_price,
-        'total_quantity': total_quantity,
-        'top_dealer': top_dealer['dealer__user__username'] if top_dealer else None,
-        'current_sort': sort,
-    })
+    return render(request, 'dealer/paddy_posts.html', marketplace_context(request))
 
 
 def paddy_detail(request,post_id):
@@ -202,105 +185,80 @@ def dealer_order_list(request):
 
 
 @login_required
+@query_budget(12, role="dealer")
 def dealer_stats(request):
     dealer = request.user.dealerprofile
-    
-    # Date ranges for statistics
-    today = timezone.now().date()
-    last_30_days = today - timedelta(days=30)
-    
-    recent_orders_count = Purchase_paddy.objects.filter(
-        paddy__dealer=dealer,
-        purchase_date__gte=timezone.now() - timezone.timedelta(days=30)
-    ).count()
-    # Sales data (from Purchase_paddy)
-    sales_data = Purchase_paddy.objects.filter(
-        paddy__dealer=dealer,
-        purchase_date__gte=last_30_days,
-        is_confirmed=True
-    ).extra({
-        'day': "date(purchase_date)"
-    }).values('day').annotate(
-        total=Sum('total_price'),
-        quantity=Sum('quantity_purchased')
-    ).order_by('day')
-    
-    sales_labels = [sale['day'].strftime('%b %d') for sale in sales_data]
-    sales_values = [float(sale['total']) for sale in sales_data]
-    quantity_sold = [float(sale['quantity']) for sale in sales_data]
-    
-    # Top selling paddy varieties
-    top_varieties = Purchase_paddy.objects.filter(
-        paddy__dealer=dealer,
-        is_confirmed=True
-    ).values(
-        'paddy__name'
-    ).annotate(
-        total_quantity=Sum('quantity_purchased'),
-        total_sales=Sum('total_price'),
-        count=Count('id')
-    ).order_by('-total_sales')[:5]
-    
-    total_sales_all = sum(variety['total_sales'] for variety in top_varieties) if top_varieties else 0
-    top_varieties_data = []
-    top_varieties_labels = []
-    
-    for variety in top_varieties:
-        percentage = round((variety['total_sales'] / total_sales_all) * 100) if total_sales_all > 0 else 0
-        top_varieties_data.append(percentage)
-        top_varieties_labels.append(variety['paddy__name'])
-    
-    # Purchase status breakdown
-    purchase_status = Purchase_paddy.objects.filter(
-        paddy__dealer=dealer
-    ).aggregate(
+    now = timezone.now()
+    last_30_days = now - timedelta(days=30)
+    orders = Purchase_paddy.objects.filter(paddy__dealer=dealer)
+    confirmed = Q(is_confirmed=True)
+
+    # Order counts and sold quantity in one aggregate
+    purchase_status = orders.aggregate(
         total=Count('id'),
-        confirmed=Count('id', filter=Q(is_confirmed=True)),
+        recent=Count('id', filter=Q(purchase_date__gte=last_30_days)),
+        confirmed=Count('id', filter=confirmed),
         paid=Count('id', filter=Q(payment=True)),
-        pending=Count('id', filter=Q(is_confirmed=False))
+        pending=Count('id', filter=Q(is_confirmed=False)),
+        sold=Coalesce(Sum('quantity_purchased', filter=confirmed), 0.0),
     )
-    
-    # Inventory status - simplified without Cast
+
+    # Daily sales and top varieties come from the rollup of Successful orders
+    sales_data = DailySales.daily(timezone.localdate() - timedelta(days=30), seller=request.user, buyer_role='manager')
+
+    sales_labels = []
+    sales_values = []
+    quantity_sold = []
+    for sale in sales_data:
+        sales_labels.append(sale['day'].strftime('%b %d'))
+        sales_values.append(float(sale['total_revenue']))
+        quantity_sold.append(float(sale['total_kg']))
+
+    top_varieties = list(DailySales.by_variety(limit=5, seller=request.user, buyer_role='manager'))
+
+    total_sales_all = sum(variety['total_revenue'] for variety in top_varieties)
+    top_varieties_labels = [variety['variety'] for variety in top_varieties]
+    top_varieties_data = [
+        round((variety['total_revenue'] / total_sales_all) * 100) if total_sales_all > 0 else 0
+        for variety in top_varieties
+    ]
+
+    # Inventory status: confirmed Kg sold through each stock's listings, in one grouped query
+    sold_from_listings = Sum(
+        'marketplace_posts__purchase_paddy__quantity_purchased',
+        filter=Q(marketplace_posts__purchase_paddy__is_confirmed=True),
+    )
+    stocks = PaddyStock.objects.filter(dealer=dealer).annotate(
+        sold=Coalesce(sold_from_listings, 0.0),
+        age=ExpressionWrapper(Now() - F('stored_since'), output_field=DurationField()),
+        status=Case(
+            When(quantity__lt=100, then=Value('Low')),
+            When(quantity__lt=500, then=Value('Medium')),
+            default=Value('Good'),
+        ),
+    ).values('name', 'quantity', 'moisture_content', 'price_per_kg', 'sold', 'age', 'status')
+
     inventory_status = []
-    for stock in PaddyStock.objects.filter(dealer=dealer):
-        days_in_stock = (timezone.now() - stock.stored_since).days
-        total_sold = Purchase_paddy.objects.filter(
-            paddy=stock,
-            is_confirmed=True
-        ).aggregate(total=Sum('quantity_purchased'))['total'] or 0
-        
-        turnover_rate = days_in_stock / total_sold if total_sold > 0 else 0
-        
+    total_stock = 0
+    for stock in stocks:
+        total_stock += stock['quantity']
         inventory_status.append({
-            'name': stock.name,
-            'stock': stock.quantity,
-            'sold': total_sold,
-            'turnover': round(turnover_rate, 1),
-            'status': 'Low' if stock.quantity < 100 else 'Medium' if stock.quantity < 500 else 'Good',
-            'moisture': stock.moisture_content,
-            'price': stock.price_per_kg
+            'name': stock['name'],
+            'stock': stock['quantity'],
+            'sold': stock['sold'],
+            'turnover': round(stock['age'].days / stock['sold'], 1) if stock['sold'] > 0 else 0,
+            'status': stock['status'],
+            'moisture': stock['moisture_content'],
+            'price': stock['price_per_kg']
         })
-    
+
     # Calculate conversion rate
-    total_stock = PaddyStock.objects.filter(dealer=dealer).aggregate(
-        total=Sum('quantity')
-    )['total'] or 0
-    
-    sold_stock = Purchase_paddy.objects.filter(
-        paddy__dealer=dealer,
-        is_confirmed=True
-    ).aggregate(
-        total=Sum('quantity_purchased')
-    )['total'] or 0
-    
+    sold_stock = purchase_status['sold']
     conversion_rate = round((sold_stock / total_stock) * 100, 1) if total_stock > 0 else 0
 
-    print(( len(top_varieties_labels)))
-    print(len(top_varieties))
-    
     context = {
-        'total_sales': recent_orders_count,
-        'total_quantity_sold': sum(quantity_sold) if quantity_sold else 0,
+        'total_sales': purchase_status['recent'],
+        'total_quantity_sold': sum(quantity_sold),
         'completed_orders': purchase_status['confirmed'],
         'pending_orders': purchase_status['pending'],
         'paid_orders': purchase_status['paid'],
@@ -319,9 +277,7 @@ def dealer_stats(request):
             purchase_status['total'] - purchase_status['confirmed']  # cancelled/rejected
         ],
         'inventory_status': inventory_status,
-        'recent_purchases': Purchase_paddy.objects.filter(
-            paddy__dealer=dealer
-        ).select_related('manager', 'paddy').order_by('-purchase_date')[:5]
+        'recent_purchases': orders.select_related('manager', 'paddy').order_by('-purchase_date')[:5]
     }
     
     return render(request, 'dealer/dealer_stats.html', context)
@@ -343,16 +299,34 @@ def selling_paddy_history(request):
     }
     return render(request, "dealer/paddy_selling_history.html", context)
 
+@login_required
+@user_passes_test(lambda u: u.role == 'dealer')
+def export_selling_paddy_history(request):
+    dealer_profile = get_object_or_404(DealerProfile, user=request.user)
+    sales = Purchase_paddy.objects.filter(paddy__dealer=dealer_profile, status="Successful").order_by("purchase_date")
+    columns = [
+        ("Paddy Name", "paddy__name"),
+        ("Buyer (Manager)", "manager__managerprofile__full_name"),
+        ("Quantity (kg)", "quantity_purchased"),
+        ("Price", "paddy__price_per_kg"),
+        ("Transport Cost", "transport_cost"),
+        ("Total Price", "total_price"),
+        ("Purchase Date", "purchase_date"),
+        ("Payment", "payment"),
+    ]
+    return exports.export_response(request, sales, columns, "paddy_selling_history", date_field="purchase_date")
+
 # order and delivery track
 @login_required
 @user_passes_test(lambda u: u.role == 'dealer')
+@query_budget(10, role="dealer")
 def incoming_order_for_paddy(request):
     try:
         dealer_profile = DealerProfile.objects.get(user=request.user)
     except DealerProfile.DoesNotExist:
         return HttpResponse("Dealer profile not found", status=404)
     
-    orders = Purchase_paddy.objects.filter(paddy__dealer=dealer_profile).order_by("-purchase_date")
+    orders = Purchase_paddy.objects.filter(paddy__dealer=dealer_profile).select_related("paddy", "manager__managerprofile").order_by("-purchase_date")
     return render(request, 'dealer/incoming_order.html', {'orders': orders})
 
 @login_required
@@ -414,6 +388,27 @@ def create_purchase(request):
         form = PaddyPurchaseForm()
     return render(request, 'dealer/purchase_form.html', {'form': form})
 
+@login_required(login_url='login')
+@user_passes_test(check_dealer, login_url='login')
+def import_purchases(request):
+    """Bulk upload of farmer lots from a CSV/JSONL file."""
+    dealer = get_object_or_404(DealerProfile, user=request.user)
+    result = None
+    if request.method == 'POST':
+        form = PurchaseImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_farmer_purchases(dealer, iter_purchase_rows(stream, guess_format(upload.name)))
+            except PurchaseFileError as e:
+                form.add_error('file', f"{e} Nothing was imported.")
+            else:
+                messages.success(request, f"{result['created']} purchases imported, {result['skipped']} skipped.")
+    else:
+        form = PurchaseImportForm()
+    return render(request, 'dealer/import_purchases.html', {'form': form, 'result': result})
+
 @login_required(login_url='login')
 @user_passes_test(check_dealer, login_url='login')
 def all_purchases_list(request):
@@ -433,6 +428,26 @@ def all_purchases_list(request):
         return render(request, 'dealer/purchases_list.html', context)
     
 
+@login_required(login_url='login')
+@user_passes_test(check_dealer, login_url='login')
+def export_farmer_purchases(request):
+    purchases = PaddyPurchaseFromFarmer.objects.filter(dealer=request.user.dealerprofile).order_by('created_at')
+    columns = [
+        ("Ref #", "reference_code"),
+        ("Farmer", "farmer_name"),
+        ("Phone", "farmer_phone"),
+        ("Type", "paddy_type"),
+        ("Quantity (kg)", "quantity"),
+        ("Price/kg", "purchase_price_per_kg"),
+        ("Moisture (%)", "moisture_content"),
+        ("Transport Cost", "transport_cost"),
+        ("Other Costs", "other_costs"),
+        ("Total", "total_cost"),
+        ("Date", "created_at"),
+    ]
+    return exports.export_response(request, purchases, columns, "farmer_purchases", date_field="created_at")
+
+
 @login_required(login_url='login')
 @user_passes_test(check_dealer, login_url='login')
 def create_marketplace_post(request, id):
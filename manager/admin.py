@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ManagerProfile, RicePost, RiceStock,PaddyStockOfManager,PaymentForPaddy,PaymentForRice,PurchaseRice,Purchase_paddy
+from .models import ManagerProfile, RicePost, RiceStock,PaddyStockOfManager,PaymentForPaddy,PaymentForRice,PurchaseRice,Purchase_paddy,StockMovement
 # Register your models here.
 class ManagerModel(admin.ModelAdmin):
     list_display = ['full_name','phone_number','mill_name','mill_location','bio']
@@ -7,6 +7,17 @@ class ManagerModel(admin.ModelAdmin):
 class RicePostModel(admin.ModelAdmin):
     list_display = ['manager','quality','quantity_kg','price_per_kg','description','is_sold']
     
+class StockMovementModel(admin.ModelAdmin):
+    list_display = ['stock_type','stock_id','reason','quantity','value','reference','created_at']
+    list_filter = ['stock_type','reason']
+
+    # append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
 admin.site.register(ManagerProfile,ManagerModel)
 admin.site.register(RicePost,RicePostModel)
 admin.site.register(RiceStock)
@@ -14,4 +25,5 @@ admin.site.register(PaddyStockOfManager)
 admin.site.register(PaymentForPaddy)
 admin.site.register(PaymentForRice)
 admin.site.register(PurchaseRice)
-admin.site.register(Purchase_paddy)
\ No newline at end of file
+admin.site.register(Purchase_paddy)
+admin.site.register(StockMovement,StockMovementModel)
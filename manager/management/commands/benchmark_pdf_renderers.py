@@ -0,0 +1,78 @@
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from RSCMS_app.benchmark import scratch_database, seed_supply_chain
+from customer.models import Purchase_Rice
+from manager import receipts
+from manager.models import PaddyStockOfManager, Purchase_paddy, PurchaseRice
+from manager.views import paddy_stock_report_pdf
+
+RENDERERS = ("html", "reportlab")
+
+
+class Command(BaseCommand):
+    help = 'Compare render time and peak memory of the xhtml2pdf and ReportLab backends for every PDF document'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Renders per document and backend')
+        parser.add_argument('--stock-rows', type=int, default=200, help='Rows in the paddy stock report')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            documents = self._documents(options['stock_rows'])
+            self.stdout.write(f"{'document':<26} {'backend':<10} {'ms/render':>10} {'p95 ms':>9} {'peak KiB':>9} {'bytes':>8}")
+            for name, render in documents.items():
+                results = {renderer: self._measure(render, renderer, options['repeat']) for renderer in RENDERERS}
+                for renderer, (mean, p95, peak, size) in results.items():
+                    self.stdout.write(f"{name:<26} {renderer:<10} {mean:>10.2f} {p95:>9.2f} {peak / 1024:>9.0f} {size:>8}")
+                html, canvas = results["html"][0], results["reportlab"][0]
+                self.stdout.write(self.style.SUCCESS(f"✔ {name}: ReportLab is {html / canvas:.1f}x faster"))
+
+    def _documents(self, stock_rows):
+        users = seed_supply_chain(orders=1)
+        manager = users['manager'][0]
+        PaddyStockOfManager.objects.bulk_create(
+            PaddyStockOfManager(
+                manager=manager, paddy_name=f"Swarna {i}", moisture_content=Decimal('14.0'), total_quantity=1000 + i,
+                total_price=Decimal('25000.00'), average_price_per_kg=Decimal('25.00'),
+            )
+            for i in range(stock_rows)
+        )
+        orders = {
+            Purchase_paddy: Purchase_paddy.objects.first(),
+            PurchaseRice: PurchaseRice.objects.first(),
+            Purchase_Rice: Purchase_Rice.objects.first(),
+        }
+
+        documents = {}
+        for kind, spec in receipts.RECEIPTS.items():
+            order = spec.model.objects.select_related(*spec.related).get(pk=orders[spec.model].pk)
+            documents[kind] = lambda renderer, kind=kind, order=order: receipts.render_receipt(kind, order, renderer)
+        stocks = list(PaddyStockOfManager.objects.filter(manager=manager))
+        documents['paddy_stock_report'] = lambda renderer: paddy_stock_report_pdf(manager, stocks, renderer)
+        return documents
+
+    def _measure(self, render, renderer, repeat):
+        size = len(render(renderer))  # warm up template and font caches
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render(renderer)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        tracemalloc.start()
+        render(renderer)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        return statistics.mean(timings), p95, peak, size
+
+
+# python manage.py benchmark_pdf_renderers [--repeat 20] [--stock-rows 200]
@@ -1,39 +1,73 @@
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 from django.core.management.base import BaseCommand
-from manager.models import PurchaseRice, RiceStock
-from decimal import Decimal
+from manager import profit
+from manager.models import PurchaseRice
+
 
 class Command(BaseCommand):
     help = 'Calculate profit or loss for previously successful rice sales'
 
-    def handle(self, *args, **kwargs):
-        updated_count = 0
-        failed_count = 0
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Sales priced and written per chunk')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Price chunks in this many processes (0: in this process)')
 
+    def handle(self, *args, **options):
         sales = PurchaseRice.objects.filter(status="Successful", profit_or_loss__isnull=True)
-
         if not sales.exists():
             self.stdout.write(self.style.WARNING("No eligible sales found to update."))
             return
 
-        for sale in sales:
-            try:
-                stock = RiceStock.objects.get(manager=sale.rice.manager, rice_name=sale.rice.rice_name)
-                cost_per_kg = Decimal(str(stock.average_price_per_kg))
-                total_cost = cost_per_kg * Decimal(str(sale.quantity_purchased))
-                profit = Decimal(str(sale.total_price)) - total_cost
-
-                sale.profit_or_loss = float(profit)
-                sale.save(update_fields=["profit_or_loss"])
-                updated_count += 1
-                self.stdout.write(self.style.SUCCESS(f"✅ Sale ID {sale.id} updated. Profit/Loss: {profit:.2f}"))
-
-            except RiceStock.DoesNotExist:
-                sale.profit_or_loss = 0.0
-                sale.save(update_fields=["profit_or_loss"])
-                failed_count += 1
-                self.stdout.write(self.style.WARNING(f"⚠️ Sale ID {sale.id}: Stock not found. Set to 0"))
-
-        self.stdout.write(self.style.SUCCESS(f"\n✔ Done! {updated_count} updated, {failed_count} had missing stock info."))
-        
-        
-# python manage.py calculate_profit_or_loss
\ No newline at end of file
+        started = time.perf_counter()
+        costs = profit.stock_costs(managers=sales.values("rice__manager"))
+        chunks = self.read_chunks(sales, options['chunk_size'])
+
+        updated_count = missing_count = 0
+        for priced in self.price(chunks, costs, options['workers']):
+            profit.save_profits(priced)
+            missing = sum(1 for _, value in priced if value is None)
+            updated_count += len(priced) - missing
+            missing_count += missing
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{updated_count + missing_count} sales priced")
+
+        elapsed = time.perf_counter() - started
+        rows = updated_count + missing_count
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✔ Done! {updated_count} updated, {missing_count} had missing stock info (set to 0). "
+            f"{rows} rows in {elapsed:.2f}s, {rows / elapsed:,.0f} rows/s."
+        ))
+
+    @staticmethod
+    def read_chunks(sales, chunk_size):
+        """SALE_COLUMNS tuples in id order, `chunk_size` at a time (keyset paged, as rows stop matching once priced)."""
+        last_id = 0
+        while True:
+            rows = list(sales.filter(id__gt=last_id).order_by("id").values_list(*profit.SALE_COLUMNS)[:chunk_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    @staticmethod
+    def price(chunks, costs, workers):
+        if workers <= 1:
+            for rows in chunks:
+                yield profit.price_chunk(rows, costs)
+            return
+
+        # keep a couple of chunks per worker in flight rather than reading the whole history up front
+        with ProcessPoolExecutor(workers, initializer=profit.init_worker, initargs=(costs,)) as pool:
+            pending = deque()
+            for rows in chunks:
+                pending.append(pool.submit(profit.price_chunk_in_worker, rows))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+# python manage.py calculate_profit_or_loss [--chunk-size 5000] [--workers 4]
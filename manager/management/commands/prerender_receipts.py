@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from manager import receipts
+
+
+class Command(BaseCommand):
+    help = 'Render and store the receipts of Successful orders that have none for the current template version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(receipts.RECEIPTS), help='Only this receipt kind')
+
+    def handle(self, *args, **options):
+        kinds = [options['kind']] if options['kind'] else list(receipts.RECEIPTS)
+        for kind in kinds:
+            spec = receipts.RECEIPTS[kind]
+            rendered = failed = 0
+            orders = spec.model.objects.filter(status="Successful").select_related(*spec.related)
+            for order in orders.iterator(chunk_size=500):
+                if receipts.default_storage.exists(receipts.receipt_path(kind, order.pk)):
+                    continue
+                try:
+                    receipts.store_receipt(kind, order)
+                    rendered += 1
+                except receipts.pdf.RenderError as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"⚠️ {e}"))
+            self.stdout.write(self.style.SUCCESS(f"✔ {kind}: {rendered} rendered, {failed} failed."))
+
+
+# python manage.py prerender_receipts [--kind paddy_purchase]
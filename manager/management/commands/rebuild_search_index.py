@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from manager import search
+
+
+class Command(BaseCommand):
+    help = 'Repopulate the full-text search tables for rice posts and paddy listings'
+
+    def handle(self, *args, **kwargs):
+        if not search.fts_enabled():
+            self.stdout.write(self.style.WARNING("⚠️ Full-text search needs SQLite FTS5; search falls back to icontains."))
+            return
+
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS("✔ Search index rebuilt."))
+
+
+# python manage.py rebuild_search_index
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from manager import profit
+
+
+class Command(BaseCommand):
+    help = 'Reprice the stored profit/loss of customer rice sales whose seller\'s stock cost has changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Sales repriced per batch')
+
+    def handle(self, *args, **options):
+        changed = profit.recompute_customer_margins(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"✔ Done! {changed} customer sale margins repriced."))
+
+
+# run periodically (e.g. nightly) so the customer P&L report follows stock cost changes
+# python manage.py recompute_customer_margins [--batch-size 5000]
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from manager.models import StockMovement, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Snapshot the balance of every stock that has moved since its last snapshot'
+
+    def handle(self, *args, **options):
+        stocks = StockMovement.objects.values_list("stock_type", "stock_id").distinct().order_by()
+
+        taken = 0
+        for stock_type, stock_id in stocks.iterator():
+            if StockSnapshot.take(stock_type, stock_id):
+                taken += 1
+        self.stdout.write(self.style.SUCCESS(f"✔ Done! {taken} stock snapshots taken."))
+
+
+# run periodically (e.g. nightly) so balance lookups only replay the latest movements
+# python manage.py snapshot_stock
@@ -1,41 +1,48 @@
-from django.core.management.base import BaseCommand
-from manager.models import Purchase_paddy, PaddyStockOfManager
-from decimal import Decimal
+from datetime import date
 
-class Command(BaseCommand):
-    help = 'Update PaddyStockOfManager using old successful Purchase_paddy records'
-
-    def handle(self, *args, **kwargs):
-        successful_purchases = Purchase_paddy.objects.filter(status='Successful')
-
-        count = 0
-        for purchase in successful_purchases:
-            manager = purchase.manager
-            paddy = purchase.paddy  
-
-            stock, created = PaddyStockOfManager.objects.get_or_create(
-                manager=manager,
-                paddy_name=paddy.name,
-                moisture_content = paddy.moisture_content,
-                # rice_type=paddy.rice_type,
-                defaults={
-                    'total_quantity': 0,
-                    'total_price': 0,
-                    'average_price_per_kg': 0,
-                }
-            )
+from django.core.management.base import BaseCommand, CommandError
+from manager.models import PaddyStockOfManager
+from manager.stock_backfill import backfill_receipts
 
-            stock.total_quantity += purchase.quantity_purchased
-            stock.total_price += purchase.total_price
 
-            if stock.total_quantity > 0:
-                stock.average_price_per_kg = round(Decimal(stock.total_price) / Decimal(stock.total_quantity), 2)
+class Command(BaseCommand):
+    help = 'Add successful Purchase_paddy records that never reached PaddyStockOfManager (safe to rerun)'
+    model = PaddyStockOfManager
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only purchases from this date on (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Purchases aggregated per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Show the stock changes without writing them')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"--since must be a YYYY-MM-DD date, got {options['since']!r}")
+
+        def progress(batch, orders, keys):
+            self.stdout.write(f"Batch {batch}: {orders} purchases into {keys} stocks")
+
+        changes = backfill_receipts(
+            self.model, since=since, batch_size=options['batch_size'], dry_run=options['dry_run'], progress=progress,
+        )
+
+        for key, (quantity, value, added_kg, added_value, new) in changes.items():
+            name = " / ".join(str(part) for part in key[1:])
+            before = "new stock" if new else f"{quantity:g} kg ({value})"
+            self.stdout.write(
+                f"  manager {key[0]} {name}: {before} → {quantity + added_kg:g} kg ({value + added_value}), "
+                f"+{added_kg:g} kg"
+            )
 
-            stock.save()
-            count += 1
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"⚠️ Dry run: {len(changes)} stocks would change, nothing written."))
+        elif changes:
+            self.stdout.write(self.style.SUCCESS(f"✔ Done! {len(changes)} stocks updated."))
+        else:
+            self.stdout.write(self.style.SUCCESS("✔ Done! Every successful purchase is already in stock."))
 
-        self.stdout.write(self.style.SUCCESS(f'✅ Successfully updated stock for {count} purchases.'))
-        
 
-# for manually update paddy stock
-# python manage.py update_old_paddy_stock
\ No newline at end of file
+# python manage.py update_old_paddy_stock [--since 2025-01-01] [--dry-run]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-17 03:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dealer', '0005_marketplace_market_avail_recent_idx_and_more'),
+        ('manager', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase_paddy',
+            index=models.Index(fields=['manager', 'status', 'purchase_date'], name='paddybuy_mgr_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase_paddy',
+            index=models.Index(fields=['paddy', 'purchase_date'], name='paddybuy_paddy_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaserice',
+            index=models.Index(fields=['manager', 'status', 'purchase_date'], name='ricebuy_mgr_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaserice',
+            index=models.Index(fields=['rice', 'status', 'purchase_date'], name='ricebuy_rice_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ricepost',
+            index=models.Index(condition=models.Q(('is_sold', False)), fields=['created_at'], name='ricepost_unsold_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ricepost',
+            index=models.Index(condition=models.Q(('is_sold', False)), fields=['manager', 'created_at'], name='ricepost_mgr_unsold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ricestock',
+            index=models.Index(fields=['manager', 'rice_name'], name='ricestock_mgr_name_idx'),
+        ),
+    ]
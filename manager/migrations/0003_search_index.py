@@ -0,0 +1,42 @@
+from django.db import migrations
+
+TABLES = ("manager_ricepost_fts", "dealer_marketplace_fts")
+
+COLUMNS = "name, description, quality_notes, district, prefix='2 3', tokenize='unicode61 remove_diacritics 2'"
+
+
+def create_search_tables(apps, schema_editor):
+    # FTS5 is SQLite only; other backends keep the icontains search
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table in TABLES:
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {table} USING fts5({COLUMNS})")
+
+    schema_editor.execute(
+        "INSERT INTO manager_ricepost_fts (rowid, name, description, quality_notes, district) "
+        "SELECT id, coalesce(rice_name, ''), description, quality, '' FROM manager_ricepost"
+    )
+    schema_editor.execute(
+        "INSERT INTO dealer_marketplace_fts (rowid, name, description, quality_notes, district) "
+        "SELECT m.id, m.name, '', m.quality_notes, coalesce(d.district, '') "
+        "FROM dealer_marketplace m JOIN dealer_dealerprofile d ON d.id = m.dealer_id"
+    )
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table in TABLES:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dealer', '0005_marketplace_market_avail_recent_idx_and_more'),
+        ('manager', '0002_purchase_paddy_paddybuy_mgr_status_date_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
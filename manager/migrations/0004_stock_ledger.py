@@ -0,0 +1,73 @@
+# Generated by Django 5.2 on 2026-10-17 03:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    """One opening movement per existing stock, so the ledger starts from today's balances."""
+    StockMovement = apps.get_model('manager', 'StockMovement')
+    stocks = (
+        (apps.get_model('manager', 'PaddyStockOfManager'), 'paddy', 'total_quantity'),
+        (apps.get_model('manager', 'RiceStock'), 'rice', 'stock_quantity'),
+    )
+    for model, stock_type, quantity_field in stocks:
+        StockMovement.objects.bulk_create(
+            (
+                StockMovement(
+                    manager_id=stock.manager_id, stock_type=stock_type, stock_id=stock.pk, reason='adjustment',
+                    quantity=getattr(stock, quantity_field) or 0, value=stock.total_price or 0,
+                    reference='opening balance', created_at=stock.updated_at,
+                )
+                for stock in model.objects.iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0003_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_type', models.CharField(choices=[('paddy', 'Paddy'), ('rice', 'Rice')], max_length=5)),
+                ('stock_id', models.BigIntegerField()),
+                ('reason', models.CharField(choices=[('receipt', 'Receipt'), ('milling', 'Milling'), ('posting', 'Posting'), ('sale', 'Sale'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('quantity', models.FloatField(help_text='Kg in (+) or out (-)')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('manager', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_type', models.CharField(choices=[('paddy', 'Paddy'), ('rice', 'Rice')], max_length=5)),
+                ('stock_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField(help_text='When the last movement happened')),
+                ('quantity', models.FloatField()),
+                ('value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('last_movement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='manager.stockmovement')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['stock_type', 'stock_id', 'created_at'], name='stockmove_stock_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['stock_type', 'stock_id', 'taken_at'], name='stocksnap_stock_time_idx'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
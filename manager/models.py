@@ -1,7 +1,13 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from accounts.models import CustomUser
 from dealer.models import Marketplace, PaddyStock
+from RSCMS_app.transitions import TracksStatus
 
 # Create your models here.
 
@@ -32,9 +38,32 @@ class RicePost(models.Model):
     is_sold = models.BooleanField(default=False)
     rice_image = models.ImageField(upload_to="rice_image/",blank=True,null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # unsold posts only (see Marketplace.Meta for why boolean filters are partial indexes)
+            models.Index(fields=["created_at"], condition=Q(is_sold=False), name="ricepost_unsold_created_idx"),
+            models.Index(fields=["manager", "created_at"], condition=Q(is_sold=False), name="ricepost_mgr_unsold_idx"),
+        ]
+
+    @classmethod
+    def reserve_quantity(cls, post_id, kg):
+        """
+        Take `kg` off an unsold rice post in one conditional UPDATE and mark it
+        sold in the same statement when it runs out. Returns the remaining Kg,
+        or None when the post cannot cover the order. Call inside a transaction.
+        """
+        updated = cls.objects.filter(pk=post_id, is_sold=False, quantity_kg__gte=kg).update(
+            # is_sold is assigned first so it sees the pre-update quantity on every backend
+            is_sold=Case(When(quantity_kg__lte=kg, then=Value(True)), default=Value(False)),
+            quantity_kg=F("quantity_kg") - kg,
+        )
+        if not updated:
+            return None
+        return cls.objects.filter(pk=post_id).values_list("quantity_kg", flat=True).get()
     
     
-class Purchase_paddy(models.Model):
+class Purchase_paddy(TracksStatus, models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('Accepted', 'Accepted'),
@@ -53,12 +82,20 @@ class Purchase_paddy(models.Model):
     payment = models.BooleanField(default=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')  # ✅ New field
     purchase_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # manager's orders / successful purchases, newest first
+            models.Index(fields=["manager", "status", "purchase_date"], name="paddybuy_mgr_status_date_idx"),
+            # dealer's orders reached through paddy__dealer, filtered or sorted by date
+            models.Index(fields=["paddy", "purchase_date"], name="paddybuy_paddy_date_idx"),
+        ]
         
     def __str__(self):
         return f"Purchases By {self.manager.full_name} from {self.paddy.dealer.username}"
         
 
-class PurchaseRice(models.Model):
+class PurchaseRice(TracksStatus, models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('Accepted', 'Accepted'),
@@ -79,6 +116,13 @@ class PurchaseRice(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')  # ✅ Add this line
     purchase_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["manager", "status", "purchase_date"], name="ricebuy_mgr_status_date_idx"),
+            # seller side, reached through rice__manager
+            models.Index(fields=["rice", "status", "purchase_date"], name="ricebuy_rice_status_date_idx"),
+        ]
+
 class PaymentForPaddy(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -118,7 +162,63 @@ class PaymentForRice(models.Model):
     def __str__(self):
         return f"{self.transaction_id} - {self.status}"
         
-class PaddyStockOfManager(models.Model):
+class LedgeredStock:
+    """
+    Model mixin for stock rows whose quantity and value are mirrored in the
+    StockMovement ledger. It remembers the balance the row was loaded or last
+    recorded with; save() ledgers the difference since then, as a manual
+    adjustment unless the caller names the movement.
+    """
+    STOCK_TYPE = None
+    QUANTITY_FIELD = None
+    # Successful purchases received into this stock: (order model, ProcessedEvent handler,
+    # {stock field: order lookup} for the fields that pick the stock row); see manager.stock_backfill
+    RECEIPTS = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._recorded_balance = instance.balance
+        return instance
+
+    @property
+    def balance(self):
+        return float(getattr(self, self.QUANTITY_FIELD) or 0), Decimal(str(self.total_price or 0))
+
+    def save(self, *args, movement="adjustment", reference="", **kwargs):
+        """Save and ledger the change under `movement` (a StockMovement reason)."""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.record_movement(movement, reference)
+
+    def record_movement(self, reason, reference=""):
+        """Ledger the change since the row was loaded or last recorded. Returns the movement or None."""
+        quantity, value = self.balance
+        recorded_quantity, recorded_value = getattr(self, "_recorded_balance", (0.0, Decimal("0")))
+        self._recorded_balance = quantity, value
+        if quantity == recorded_quantity and value == recorded_value:
+            return None
+        return StockMovement.record(
+            self.manager_id, self.STOCK_TYPE, self.pk, reason,
+            quantity - recorded_quantity, value - recorded_value, reference,
+        )
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            setattr(self, self.QUANTITY_FIELD, 0)
+            self.total_price = 0
+            self.record_movement("adjustment", "stock deleted")
+            return super().delete(*args, **kwargs)
+
+
+class PaddyStockOfManager(LedgeredStock, models.Model):
+    STOCK_TYPE = "paddy"
+    QUANTITY_FIELD = "total_quantity"
+    RECEIPTS = ("manager.Purchase_paddy", "paddy_stock_receipt", {
+        "manager_id": "manager", "paddy_name": "paddy__name", "moisture_content": "paddy__moisture_content",
+    })
+
+
     # one manager can be owner of multiple paddy stock
     manager = models.ForeignKey(
         CustomUser,on_delete=models.CASCADE,
@@ -147,7 +247,13 @@ class PaddyStockOfManager(models.Model):
         return f"{self.paddy_name} - {self.manager.managerprofile.full_name} ({self.total_quantity} kg)"
     
     
-class RiceStock(models.Model):
+class RiceStock(LedgeredStock, models.Model):
+    STOCK_TYPE = "rice"
+    QUANTITY_FIELD = "stock_quantity"
+    RECEIPTS = ("manager.PurchaseRice", "rice_stock_receipt", {
+        "manager_id": "manager", "rice_name": "rice__rice_name", "quality": "rice__quality",
+    })
+
     manager = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -181,6 +287,150 @@ class RiceStock(models.Model):
     class Meta:
         verbose_name = "Rice Stock"
         verbose_name_plural = "Rice Stocks"
+        indexes = [
+            models.Index(fields=["manager", "rice_name"], name="ricestock_mgr_name_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.rice_name} - {self.manager.managerprofile.full_name} ({self.stock_quantity} kg)"
\ No newline at end of file
+        return f"{self.rice_name} - {self.manager.managerprofile.full_name} ({self.stock_quantity} kg)"
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of every change to a manager's paddy or rice stock.
+    Rows are never edited or deleted, and outlive the stock they belong to.
+    """
+    STOCK_TYPES = [
+        ('paddy', 'Paddy'),
+        ('rice', 'Rice'),
+    ]
+    REASONS = [
+        ('receipt', 'Receipt'),        # a Successful purchase arriving
+        ('milling', 'Milling'),        # paddy processed into rice
+        ('posting', 'Posting'),        # rice moved into a rice post for sale
+        ('sale', 'Sale'),
+        ('adjustment', 'Adjustment'),  # edited or deleted by hand
+    ]
+    # a snapshot is taken once a stock has this many movements after its last one
+    SNAPSHOT_EVERY = 50
+
+    manager = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="stock_movements")
+    stock_type = models.CharField(max_length=5, choices=STOCK_TYPES)
+    stock_id = models.BigIntegerField()
+    reason = models.CharField(max_length=10, choices=REASONS)
+    quantity = models.FloatField(help_text="Kg in (+) or out (-)")
+    value = models.DecimalField(max_digits=12, decimal_places=2)
+    reference = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["stock_type", "stock_id", "created_at"], name="stockmove_stock_time_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_type} stock {self.stock_id}: {self.quantity:+} kg ({self.reason})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Stock movements are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Stock movements are append-only")
+
+    @classmethod
+    def record(cls, manager_id, stock_type, stock_id, reason, quantity, value, reference=""):
+        movement = cls.objects.create(
+            manager_id=manager_id, stock_type=stock_type, stock_id=stock_id, reason=reason,
+            quantity=quantity, value=value, reference=reference,
+        )
+        last = StockSnapshot.latest(stock_type, stock_id)
+        tail = cls.objects.filter(stock_type=stock_type, stock_id=stock_id)
+        if last:
+            tail = tail.filter(id__gt=last.last_movement_id)
+        if tail.count() >= cls.SNAPSHOT_EVERY:
+            StockSnapshot.take(stock_type, stock_id)
+        return movement
+
+    @classmethod
+    def record_many(cls, movements, batch_size=1000):
+        """
+        record() for many unsaved movements at once: one INSERT per batch_size
+        and one grouped count of the movements since each stock's last
+        snapshot, then a snapshot of every stock that is due one.
+        """
+        movements = cls.objects.bulk_create(movements, batch_size=batch_size)
+        stock_ids = {}
+        for movement in movements:
+            stock_ids.setdefault(movement.stock_type, set()).add(movement.stock_id)
+
+        last_snapshot = StockSnapshot.objects.filter(
+            stock_type=OuterRef("stock_type"), stock_id=OuterRef("stock_id"),
+        ).order_by("-last_movement_id").values("last_movement_id")[:1]
+        for stock_type, ids in stock_ids.items():
+            due = cls.objects.filter(stock_type=stock_type, stock_id__in=ids).filter(
+                id__gt=Coalesce(Subquery(last_snapshot), 0),
+            ).values("stock_id").annotate(tail=Count("id")).filter(tail__gte=cls.SNAPSHOT_EVERY).order_by()
+            for row in due:
+                StockSnapshot.take(stock_type, row["stock_id"])
+        return movements
+
+    @classmethod
+    def balance(cls, stock_type, stock_id, at=None):
+        """
+        (kg, value) of a stock as of `at` (now when None): the latest snapshot
+        before then plus the movements after it, at most SNAPSHOT_EVERY of them
+        unless snapshots are behind.
+        """
+        at = at or timezone.now()
+        snapshot = StockSnapshot.latest(stock_type, stock_id, at)
+        tail = cls.objects.filter(stock_type=stock_type, stock_id=stock_id, created_at__lte=at)
+        if snapshot:
+            tail = tail.filter(id__gt=snapshot.last_movement_id)
+        totals = tail.aggregate(kg=Sum("quantity"), value=Sum("value"))
+        quantity = (snapshot.quantity if snapshot else 0) + (totals["kg"] or 0)
+        value = (snapshot.value if snapshot else Decimal("0")) + (totals["value"] or 0)
+        return quantity, value
+
+
+class StockSnapshot(models.Model):
+    """A stock's balance after one movement, so balance() needn't replay the whole ledger."""
+    stock_type = models.CharField(max_length=5, choices=StockMovement.STOCK_TYPES)
+    stock_id = models.BigIntegerField()
+    last_movement = models.ForeignKey(StockMovement, on_delete=models.CASCADE, related_name="+")
+    taken_at = models.DateTimeField(help_text="When the last movement happened")
+    quantity = models.FloatField()
+    value = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["stock_type", "stock_id", "taken_at"], name="stocksnap_stock_time_idx"),
+        ]
+
+    @classmethod
+    def latest(cls, stock_type, stock_id, at=None):
+        snapshots = cls.objects.filter(stock_type=stock_type, stock_id=stock_id)
+        if at:
+            snapshots = snapshots.filter(taken_at__lte=at)
+        return snapshots.order_by("-last_movement_id").first()
+
+    @classmethod
+    def take(cls, stock_type, stock_id):
+        """Snapshot the stock as of its newest movement, unless that one is snapshotted already."""
+        last_movement = StockMovement.objects.filter(
+            stock_type=stock_type, stock_id=stock_id,
+        ).order_by("-id").first()
+        if last_movement is None or cls.objects.filter(last_movement=last_movement).exists():
+            return None
+        previous = cls.latest(stock_type, stock_id)
+        since = StockMovement.objects.filter(stock_type=stock_type, stock_id=stock_id, id__lte=last_movement.id)
+        if previous:
+            since = since.filter(id__gt=previous.last_movement_id)
+        totals = since.aggregate(kg=Sum("quantity"), value=Sum("value"))
+        quantity = (previous.quantity if previous else 0) + (totals["kg"] or 0)
+        value = (previous.value if previous else Decimal("0")) + (totals["value"] or 0)
+        return cls.objects.create(
+            stock_type=stock_type, stock_id=stock_id, last_movement=last_movement,
+            taken_at=last_movement.created_at, quantity=quantity, value=value,
+        )
@@ -0,0 +1,119 @@
+"""
+PDF rendering backends.
+
+"html" renders a Django template and lets xhtml2pdf lay out the HTML/CSS;
+"reportlab" draws a fixed-layout Document (title, header lines, one table)
+straight onto a ReportLab canvas, which skips HTML parsing altogether. The
+backend is chosen per document type with PDF_RENDERER / PDF_RENDERERS.
+"""
+from collections import namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import dateformat, timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from xhtml2pdf import pisa
+
+# Bump when draw() changes what a document looks like, so stored copies are redrawn
+CANVAS_VERSION = 1
+
+Document = namedtuple("Document", "title lines columns rows")
+
+MARGIN = 40
+FONT = "Helvetica"
+BOLD = "Helvetica-Bold"
+FONT_SIZE = 9
+ROW_HEIGHT = 18
+PADDING = 6
+
+
+class RenderError(Exception):
+    pass
+
+
+def renderer_for(document_type):
+    return settings.PDF_RENDERERS.get(document_type, settings.PDF_RENDERER)
+
+
+def render_html(template_name, context):
+    """The template rendered through xhtml2pdf, as PDF bytes."""
+    pdf = BytesIO()
+    if pisa.CreatePDF(render_to_string(template_name, context), dest=pdf).err:
+        raise RenderError(f"xhtml2pdf could not render {template_name}")
+    return pdf.getvalue()
+
+
+def profile_of(user, related_name):
+    """The user's profile, or None: a customer only gets one once they open their profile page."""
+    return getattr(user, related_name, None)
+
+
+def display_name(user, profile):
+    """The profile's full name, or the username without a profile (the templates showed a blank)."""
+    return profile.full_name if profile is not None else user.username
+
+
+def format_date(value):
+    """Same text as the templates' |date:"M d, Y h:i A"."""
+    return dateformat.format(timezone.localtime(value), "M d, Y h:i A") if value else ""
+
+
+def draw(document):
+    """Draw `document` on A4 pages, repeating the table header on each page. Returns PDF bytes."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    pdf.setTitle(document.title)
+    page_width, page_height = A4
+    widths = _column_widths(document, page_width - 2 * MARGIN)
+
+    y = page_height - MARGIN
+    pdf.setFont(BOLD, 16)
+    pdf.setFillColorRGB(0.8, 0, 0)
+    pdf.drawCentredString(page_width / 2, y - 16, document.title)
+    pdf.setFillColorRGB(0, 0, 0)
+    y -= 36
+    pdf.setFont(FONT, 11)
+    for line in document.lines:
+        pdf.drawCentredString(page_width / 2, y - 11, line)
+        y -= 18
+    y -= 8
+
+    y = _draw_row(pdf, document.columns, widths, y, header=True)
+    for row in document.rows:
+        if y - ROW_HEIGHT < MARGIN:
+            pdf.showPage()
+            y = _draw_row(pdf, document.columns, widths, page_height - MARGIN, header=True)
+        y = _draw_row(pdf, row, widths, y)
+
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _column_widths(document, available):
+    widths = [stringWidth(str(column), BOLD, FONT_SIZE) for column in document.columns]
+    for row in document.rows:
+        widths = [max(width, stringWidth(str(cell), FONT, FONT_SIZE)) for width, cell in zip(widths, row)]
+    widths = [width + 2 * PADDING for width in widths]
+    # share out the spare width, or squeeze every column when the table is too wide
+    scale = available / sum(widths)
+    return [width * scale for width in widths]
+
+
+def _draw_row(pdf, cells, widths, top, header=False):
+    x = MARGIN
+    bottom = top - ROW_HEIGHT
+    pdf.setLineWidth(0.5)
+    for cell, width in zip(cells, widths):
+        if header:
+            pdf.setFillColorRGB(0.95, 0.95, 0.95)
+            pdf.rect(x, bottom, width, ROW_HEIGHT, stroke=1, fill=1)
+            pdf.setFillColorRGB(0, 0, 0)
+        else:
+            pdf.rect(x, bottom, width, ROW_HEIGHT, stroke=1, fill=0)
+        pdf.setFont(BOLD if header else FONT, FONT_SIZE)
+        pdf.drawCentredString(x + width / 2, bottom + 6, str(cell))
+        x += width
+    return bottom
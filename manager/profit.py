@@ -0,0 +1,273 @@
+"""
+Profit/loss of rice sales against the seller's average stock cost.
+
+A sale's profit is its total price less the seller's RiceStock
+average_price_per_kg times the Kg sold, or 0 when the seller has no stock of
+that rice. The backfill functions work on plain tuples so that chunks of
+sales can be priced in worker processes without a database connection; the
+report querysets do the same arithmetic in SQL.
+
+Sales to customers store their margin in Purchase_Rice.profit_or_loss, and
+the stock cost it was priced at in stock_cost_per_kg, when they succeed, so
+their report reads both back instead of pricing again, and
+recompute_customer_margins() only rewrites the sales whose seller's stock
+cost has moved since.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Abs, Coalesce, NullIf
+
+from customer.models import Purchase_Rice
+from .models import PurchaseRice, RiceStock
+
+# sales columns price_chunk() expects, in order
+SALE_COLUMNS = ("id", "rice__manager_id", "rice__rice_name", "quantity_purchased", "total_price")
+
+
+def costing_stocks(manager, rice_name):
+    """
+    The RiceStock rows a sale of `rice_name` by `manager` is costed against,
+    first one first: the oldest wins when a manager holds one rice name in
+    several qualities.
+    """
+    return RiceStock.objects.filter(manager=manager, rice_name=rice_name).order_by("id")
+
+
+def costing_stock(manager, rice_name):
+    """The stock a sale of `rice_name` by `manager` is costed against, None without stock."""
+    return costing_stocks(manager, rice_name).first()
+
+
+def stock_costs(managers=None):
+    """{(manager id, rice name): average cost per Kg} in one query, for the given managers (all when None)."""
+    stocks = RiceStock.objects.all()
+    if managers is not None:
+        stocks = stocks.filter(manager__in=managers)
+    costs = {}
+    # the oldest stock wins when a manager holds one rice name in several qualities
+    for manager_id, rice_name, cost in stocks.order_by("-id").values_list("manager_id", "rice_name", "average_price_per_kg"):
+        costs[(manager_id, rice_name)] = cost
+    return costs
+
+
+def price_chunk(rows, costs):
+    """[(sale id, profit or None when the seller has no stock)] for SALE_COLUMNS rows."""
+    priced = []
+    for sale_id, manager_id, rice_name, quantity, total_price in rows:
+        cost = costs.get((manager_id, rice_name))
+        if cost is None:
+            priced.append((sale_id, None))
+            continue
+        total_cost = Decimal(str(cost)) * Decimal(str(quantity))
+        priced.append((sale_id, float(Decimal(str(total_price)) - total_cost)))
+    return priced
+
+
+def save_profits(priced, model=PurchaseRice):
+    """Store price_chunk() results on their sales, 0 where the seller had no stock.
+
+    One prepared UPDATE run for every row: bulk_update() would build a CASE
+    expression per row, which costs more than the pricing itself.
+    """
+    field = model._meta.get_field("profit_or_loss")
+    table = connection.ops.quote_name(model._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {table} SET profit_or_loss = %s WHERE id = %s",
+            [(field.get_db_prep_save(0 if value is None else value, connection), sale_id) for sale_id, value in priced],
+        )
+
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _money(expression):
+    return ExpressionWrapper(expression, output_field=MONEY)
+
+
+def stock_cost(manager, rice_name, default=Decimal("0")):
+    """
+    Average cost per Kg of the stock the outer query's `manager` holds of
+    `rice_name` (both lookups on the outer row), `default` without stock.
+    """
+    cost = Subquery(
+        costing_stocks(OuterRef(manager), OuterRef(rice_name)).values("average_price_per_kg")[:1],
+        output_field=MONEY,
+    )
+    if default is None:
+        return cost
+    return Coalesce(cost, Value(default), output_field=MONEY)
+
+
+def manager_sales_report(seller):
+    """
+    `seller`'s successful rice sales to other managers, newest first, each
+    annotated with cost_per_kg, selling_price (net of delivery),
+    selling_price_per_kg, total_cost, profit and profit_abs.
+    """
+    sales = PurchaseRice.objects.filter(rice__manager=seller, status="Successful").select_related(
+        "rice", "manager__managerprofile",
+    ).annotate(
+        cost_per_kg=stock_cost("rice__manager", "rice__rice_name"),
+        selling_price=_money(F("total_price") - F("delivery_cost")),
+    ).annotate(
+        selling_price_per_kg=_money(F("selling_price") / NullIf(F("quantity_purchased"), 0.0)),
+        total_cost=_money(F("cost_per_kg") * F("quantity_purchased")),
+    ).annotate(
+        profit=_money(F("selling_price") - F("total_cost")),
+    ).annotate(
+        profit_abs=_money(Abs("profit")),
+    )
+    return sales.order_by("-purchase_date", "-id")
+
+
+def manager_sales_by_variety(sales):
+    """
+    Totals of manager_sales_report() rows per rice name: count, quantity,
+    selling_price, cost_per_kg, total_cost and profit. The stock cost is looked
+    up once per rice name rather than once per sale.
+    """
+    return sales.order_by().values("rice__manager", "rice__rice_name").annotate(
+        count=Count("id"),
+        quantity=Sum("quantity_purchased"),
+        selling_price=_money(Sum(F("total_price") - F("delivery_cost"))),
+        group_cost=stock_cost("rice__manager", "rice__rice_name"),
+    ).annotate(
+        total_cost=_money(F("group_cost") * F("quantity")),
+    ).annotate(
+        profit=_money(F("selling_price") - F("total_cost")),
+    ).order_by("rice__rice_name")
+
+
+def report_totals(varieties):
+    """Sum the per-variety rows into totals for the whole report."""
+    totals = {"count": 0, "quantity": 0.0, "selling_price": Decimal("0"), "total_cost": Decimal("0"), "profit": Decimal("0")}
+    for variety in varieties:
+        for key in totals:
+            totals[key] += variety[key]
+    return totals
+
+
+# a customer sale whose margin was priced against the seller's stock; the rest had none to go on
+_PRICED = Q(stock_cost_per_kg__isnull=False)
+
+
+def _sale_cost():
+    return Case(
+        When(_PRICED, then=_money(F("total_price") - F("profit_or_loss"))),
+        default=Value(Decimal("0")), output_field=MONEY,
+    )
+
+
+def _sale_profit():
+    return Case(
+        When(_PRICED, then=_money(F("profit_or_loss") - F("delivery_cost"))),
+        default=_money(F("total_price") - F("delivery_cost")), output_field=MONEY,
+    )
+
+
+def customer_sales_report(seller):
+    """
+    `seller`'s successful rice sales to customers, newest first, annotated like
+    manager_sales_report() but from what was stored when each sale was priced:
+    total_cost is what the margin was priced against, and profit is the margin
+    less delivery. A sale priced while its seller held no stock of the rice
+    (no stock_cost_per_kg) costs 0, so its profit is the whole selling price.
+    Stock bought or emptied since does not change a row.
+    """
+    sales = Purchase_Rice.objects.filter(rice__manager=seller, status="Successful").select_related(
+        "rice", "customer__customerprofile",
+    ).annotate(
+        selling_price=_money(F("total_price") - F("delivery_cost")),
+        total_cost=_sale_cost(),
+        profit=_sale_profit(),
+    ).annotate(
+        selling_price_per_kg=_money(F("selling_price") / NullIf(F("quantity_purchased"), 0.0)),
+        cost_per_kg=_money(F("total_cost") / NullIf(F("quantity_purchased"), 0.0)),
+        profit_abs=_money(Abs("profit")),
+    )
+    return sales.order_by("-purchase_date", "-id")
+
+
+def customer_sales_by_variety(sales):
+    """Totals of customer_sales_report() rows per rice name, in one GROUP BY."""
+    # spelled out rather than summing the row annotations, whose names the sums reuse
+    return sales.order_by().values("rice__manager", "rice__rice_name").annotate(
+        count=Count("id"),
+        quantity=Sum("quantity_purchased"),
+        selling_price=_money(Sum(F("total_price") - F("delivery_cost"))),
+        sale_cost=_money(Sum(_sale_cost())),
+        sale_profit=_money(Sum(_sale_profit())),
+    ).annotate(
+        total_cost=F("sale_cost"),
+        profit=F("sale_profit"),
+    ).order_by("rice__rice_name")
+
+
+def recompute_customer_margins(batch_size=5000):
+    """
+    Reprice successful customer sales against their seller's current RiceStock
+    cost where the stored cost basis or margin no longer matches it (including
+    sales that have no cost basis yet and stock now, or the reverse),
+    `batch_size` at a time. The comparison runs in SQL, so only the stale rows
+    are read and written. Returns how many sales changed.
+    """
+    # priced as the order_became_successful receiver does: margin 0 and no cost when the seller has no stock
+    stale = Purchase_Rice.objects.filter(status="Successful").annotate(
+        current_cost=stock_cost("rice__manager", "rice__rice_name", default=None),
+    ).annotate(
+        current=Coalesce(
+            _money(F("total_price") - F("current_cost") * F("quantity_purchased")),
+            Value(Decimal("0")), output_field=MONEY,
+        ),
+    ).annotate(
+        drift=_money(Abs(F("profit_or_loss") - F("current"))),
+        cost_drift=_money(Abs(F("stock_cost_per_kg") - F("current_cost"))),
+    ).filter(
+        Q(drift__gte=Decimal("0.01"))
+        | Q(cost_drift__gte=Decimal("0.01"))
+        | Q(stock_cost_per_kg__isnull=True, current_cost__isnull=False)
+        | Q(stock_cost_per_kg__isnull=False, current_cost__isnull=True)
+    )
+
+    changed = last_id = 0
+    while True:
+        # keyset paged, as repriced rows stop matching
+        priced = list(stale.filter(id__gt=last_id).order_by("id").values_list("id", "current", "current_cost")[:batch_size])
+        if not priced:
+            return changed
+        save_margins(priced)
+        changed += len(priced)
+        last_id = priced[-1][0]
+
+
+def save_margins(priced):
+    """Store (sale id, margin, stock cost per Kg or None) on customer sales, one prepared UPDATE as save_profits()."""
+    margin = Purchase_Rice._meta.get_field("profit_or_loss")
+    cost = Purchase_Rice._meta.get_field("stock_cost_per_kg")
+    table = connection.ops.quote_name(Purchase_Rice._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {table} SET profit_or_loss = %s, stock_cost_per_kg = %s WHERE id = %s",
+            [
+                (margin.get_db_prep_save(value, connection), cost.get_db_prep_save(cost_per_kg, connection), sale_id)
+                for sale_id, value, cost_per_kg in priced
+            ],
+        )
+
+
+# process pool plumbing: each worker receives the cost table once
+_worker_costs = None
+
+
+def init_worker(costs):
+    global _worker_costs
+    _worker_costs = costs
+
+
+def price_chunk_in_worker(rows):
+    return price_chunk(rows, _worker_costs)
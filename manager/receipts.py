@@ -0,0 +1,207 @@
+"""
+Receipt PDFs.
+
+A receipt never changes once its order is Successful, so it is rendered once
+at that transition (see manager/signals.py) and kept in default storage under
+receipts/<kind>/<order id>/<template version>.pdf. The version is a hash of
+the template source: editing a template makes every download render (and
+store) a fresh copy, while unchanged receipts are served straight from disk.
+Orders that are not Successful yet are rendered on each download, unstored.
+
+Each kind renders through the backend manager.pdf picks for it: its HTML
+template, or a ReportLab drawing of the same fields built by its layout.
+"""
+import hashlib
+import logging
+from collections import namedtuple
+from functools import lru_cache
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.template.loader import get_template
+
+from customer.models import Purchase_Rice
+from . import pdf
+from .models import Purchase_paddy, PurchaseRice
+
+logger = logging.getLogger("rscms.receipts")
+
+# context_name: what the template calls the order; fee: the cost left out of the Kg price;
+# floor: the manager receipts have always shown a whole-rupee price per Kg
+Receipt = namedtuple("Receipt", "model template context_name fee floor related filename layout")
+
+ORDER_COLUMNS = ["Quantity (kg)", "Price/kg", "Delivery Cost", "Total Price", "Purchases Date"]
+
+
+def _order_row(name, order, price_per_kg, fee):
+    return [name, order.quantity_purchased, price_per_kg, fee, order.total_price, pdf.format_date(order.purchase_date)]
+
+
+def _paddy_purchase(paddy, price_per_kg):
+    dealer = paddy.paddy.dealer
+    return pdf.Document(
+        "Receipt for paddy purchase",
+        [f"Dealer: {dealer.user}", f"Address: {dealer.state},{dealer.district},{dealer.address}"],
+        ["Paddy Name"] + ORDER_COLUMNS,
+        [_order_row(paddy.paddy.name, paddy, price_per_kg, paddy.transport_cost)],
+    )
+
+
+def _rice_purchase(rice, price_per_kg):
+    seller = rice.rice.manager
+    profile = pdf.profile_of(seller, "managerprofile")
+    return pdf.Document(
+        "Receipt for rice purchase",
+        [f"Manager: {pdf.display_name(seller, profile)}", f"Mill Name: {getattr(profile, 'mill_name', '')}",
+         f"Address: {getattr(profile, 'address', '')}"],
+        ["Rice Name"] + ORDER_COLUMNS,
+        [_order_row(rice.rice.rice_name, rice, price_per_kg, rice.delivery_cost)],
+    )
+
+
+def _rice_sale_to_manager(rice, price_per_kg):
+    buyer = rice.manager
+    profile = pdf.profile_of(buyer, "managerprofile")
+    return pdf.Document(
+        "Receipt for selling rice",
+        [f"Manager: {pdf.display_name(buyer, profile)}", f"Mill Name: {getattr(profile, 'mill_name', '')}",
+         f"Address: {getattr(profile, 'address', '')}"],
+        ["Rice Name"] + ORDER_COLUMNS,
+        [_order_row(rice.rice.rice_name, rice, price_per_kg, rice.delivery_cost)],
+    )
+
+
+def _rice_sale_to_customer(rice, price_per_kg):
+    buyer = rice.customer
+    profile = pdf.profile_of(buyer, "customerprofile")
+    return pdf.Document(
+        "Receipt for selling rice",
+        [f"Customer: {pdf.display_name(buyer, profile)}", f"Address: {getattr(profile, 'address', '')}"],
+        ["Rice Name"] + ORDER_COLUMNS,
+        [_order_row(rice.rice.rice_name, rice, price_per_kg, rice.delivery_cost)],
+    )
+
+
+def _customer_rice_purchase(rice, price_per_kg):
+    seller = rice.rice.manager
+    profile = pdf.profile_of(seller, "managerprofile")
+    return pdf.Document(
+        "Receipt for rice purchase",
+        [f"Manager: {pdf.display_name(seller, profile)}", f"Mill Name: {getattr(profile, 'mill_name', '')}"],
+        ["Rice Name"] + ORDER_COLUMNS,
+        [_order_row(rice.rice.rice_name, rice, price_per_kg, rice.delivery_cost)],
+    )
+
+
+RECEIPTS = {
+    "paddy_purchase": Receipt(
+        Purchase_paddy, "manager/pdf_download/receipt_for_buying_paddy_pdf.html",
+        "paddy", "transport_cost", True, ("paddy__dealer__user",), None, _paddy_purchase,
+    ),
+    "rice_purchase": Receipt(
+        PurchaseRice, "manager/pdf_download/receipt_for_buying_rice_pdf.html",
+        "rice", "delivery_cost", True, ("rice__manager__managerprofile",), None, _rice_purchase,
+    ),
+    "rice_sale_to_manager": Receipt(
+        PurchaseRice, "manager/pdf_download/receipt_for_selling_rice_to_manager_pdf.html",
+        "rice", "delivery_cost", True, ("rice", "manager__managerprofile"), None, _rice_sale_to_manager,
+    ),
+    "rice_sale_to_customer": Receipt(
+        Purchase_Rice, "manager/pdf_download/receipt_for_selling_to_cuatomer_rice_pdf.html",
+        "rice", "delivery_cost", True, ("rice", "customer__customerprofile"), None, _rice_sale_to_customer,
+    ),
+    "customer_rice_purchase": Receipt(
+        Purchase_Rice, "customer/receipt.html",
+        "rice", "delivery_cost", False, ("rice__manager__managerprofile",), "receipt.pdf", _customer_rice_purchase,
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def template_version(template_name):
+    source = get_template(template_name).template.source
+    return hashlib.sha256(source.encode()).hexdigest()[:12]
+
+
+def receipt_version(kind):
+    if pdf.renderer_for(kind) == "reportlab":
+        return f"canvas-{pdf.CANVAS_VERSION}"
+    return template_version(RECEIPTS[kind].template)
+
+
+def receipt_path(kind, order_id):
+    return f"receipts/{kind}/{order_id}/{receipt_version(kind)}.pdf"
+
+
+def receipt_context(kind, order):
+    spec = RECEIPTS[kind]
+    goods_total = float(order.total_price - getattr(order, spec.fee))
+    if spec.floor:
+        price_per_kg = goods_total // float(order.quantity_purchased)
+    else:
+        price_per_kg = goods_total / float(order.quantity_purchased)
+    return {spec.context_name: order, "price_per_kg": price_per_kg}
+
+
+def render_receipt(kind, order, renderer=None):
+    """The receipt as PDF bytes, from the kind's configured backend unless `renderer` is given."""
+    spec = RECEIPTS[kind]
+    context = receipt_context(kind, order)
+    if (renderer or pdf.renderer_for(kind)) == "reportlab":
+        return pdf.draw(spec.layout(order, context["price_per_kg"]))
+    return pdf.render_html(spec.template, context)
+
+
+def store_receipt(kind, order):
+    """Render and keep the receipt unless this template version is already stored. Returns its path."""
+    path = receipt_path(kind, order.pk)
+    if default_storage.exists(path):
+        return path
+
+    saved = default_storage.save(path, ContentFile(render_receipt(kind, order)))
+    if saved != path:
+        # another request stored it first; keep theirs
+        default_storage.delete(saved)
+
+    # drop the copies rendered from older template versions
+    folder, current = path.rsplit("/", 1)
+    for name in default_storage.listdir(folder)[1]:
+        if name != current:
+            default_storage.delete(f"{folder}/{name}")
+    return path
+
+
+def prerender_receipts(model, order_id):
+    """Store every receipt of a Successful order; called once the transition commits."""
+    for kind, spec in RECEIPTS.items():
+        if spec.model is not model:
+            continue
+        order = model.objects.select_related(*spec.related).filter(pk=order_id, status="Successful").first()
+        if order is None:
+            return
+        try:
+            store_receipt(kind, order)
+        except Exception:
+            # not fatal, and the status change has already committed: the download renders it again
+            logger.exception("Pre-rendering the %s receipt for order %s failed", kind, order_id)
+
+
+def receipt_response(kind, order):
+    """Serve the stored receipt of a Successful order, or render one for an order still in progress."""
+    filename = RECEIPTS[kind].filename
+    try:
+        if order.status == "Successful":
+            return FileResponse(
+                default_storage.open(store_receipt(kind, order)), content_type="application/pdf",
+                as_attachment=bool(filename), filename=filename or f"receipt_{order.pk}.pdf",
+            )
+        content = render_receipt(kind, order)
+    except Exception:
+        logger.exception("Rendering the %s receipt for order %s failed", kind, order.pk)
+        return HttpResponse("Error generating PDF", status=500)
+
+    response = HttpResponse(content, content_type="application/pdf")
+    if filename:
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,138 @@
+"""
+Full-text search over rice posts and paddy listings.
+
+Each kind has its own SQLite FTS5 table whose rowid is the post/listing id,
+kept in step by the signals in manager/signals.py. Other database backends
+fall back to the old icontains filters.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from dealer.models import Marketplace
+from .models import RicePost
+
+RICE_TABLE = "manager_ricepost_fts"
+PADDY_TABLE = "dealer_marketplace_fts"
+
+# bm25 weights for (name, description, quality_notes, district)
+WEIGHTS = (10.0, 2.0, 2.0, 1.0)
+
+TOKEN = re.compile(r"\w+")
+
+
+def fts_enabled():
+    return connection.vendor == "sqlite"
+
+
+def match_expression(query):
+    """Turn user input into an FTS5 query: every word must match, as a prefix."""
+    tokens = TOKEN.findall(query or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class RankedResults:
+    """
+    BM25-ranked matches from one FTS table, sliceable so Paginator can fetch
+    one page of ids at a time and load just those rows.
+    """
+
+    def __init__(self, model, table, match):
+        self.model = model
+        self.table = table
+        self.match = match
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {self.table} WHERE {self.table} MATCH %s", [self.match])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        weights = ", ".join(str(weight) for weight in WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, {weights}) LIMIT %s OFFSET %s",
+                [self.match, index.stop - start, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        found = self.model.objects.in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+
+
+def search_rice_posts(query):
+    match = match_expression(query)
+    if not fts_enabled():
+        return RicePost.objects.filter(Q(rice_name__icontains=query) | Q(description__icontains=query)).order_by("-created_at")
+    return RankedResults(RicePost, RICE_TABLE, match) if match else []
+
+
+def search_paddy_listings(query):
+    match = match_expression(query)
+    if not fts_enabled():
+        return Marketplace.objects.filter(name__icontains=query).order_by("-stored_since")
+    return RankedResults(Marketplace, PADDY_TABLE, match) if match else []
+
+
+def index_rice_post(post):
+    _upsert(RICE_TABLE, post.pk, post.rice_name, post.description, post.quality, "")
+
+
+def index_paddy_listing(listing):
+    _upsert(PADDY_TABLE, listing.pk, listing.name, "", listing.quality_notes, listing.dealer.district)
+
+
+def reindex_dealer_district(dealer):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {PADDY_TABLE} SET district = %s "
+            f"WHERE rowid IN (SELECT id FROM {Marketplace._meta.db_table} WHERE dealer_id = %s)",
+            [dealer.district or "", dealer.pk],
+        )
+
+
+def unindex(table, pk):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [pk])
+
+
+def rebuild():
+    """Repopulate both tables from the source rows in two INSERT ... SELECTs."""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {RICE_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {RICE_TABLE} (rowid, name, description, quality_notes, district) "
+            f"SELECT id, coalesce(rice_name, ''), description, quality, '' FROM {RicePost._meta.db_table}"
+        )
+        cursor.execute(f"DELETE FROM {PADDY_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {PADDY_TABLE} (rowid, name, description, quality_notes, district) "
+            f"SELECT m.id, m.name, '', m.quality_notes, coalesce(d.district, '') "
+            f"FROM {Marketplace._meta.db_table} m JOIN dealer_dealerprofile d ON d.id = m.dealer_id"
+        )
+
+
+def _upsert(table, pk, name, description, quality_notes, district):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {table} (rowid, name, description, quality_notes, district) "
+            f"VALUES (%s, %s, %s, %s, %s)",
+            [pk, name or "", description or "", quality_notes or "", district or ""],
+        )
@@ -1,110 +1,142 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from decimal import Decimal
-from .models import Purchase_paddy, PaddyStockOfManager,PurchaseRice, RiceStock
+from .models import Purchase_paddy, PaddyStockOfManager,PurchaseRice, RicePost, RiceStock
+from . import profit, receipts, search
 from customer.models import Purchase_Rice
+from dealer.models import DealerProfile, Marketplace
+from RSCMS_app.transitions import handle_once, order_became_successful
 
 
-@receiver(post_save, sender=Purchase_paddy)
-def update_paddy_stock_of_manager(sender, instance, created, **kwargs):
-    if instance.status == "Successful":
-        manager = instance.manager
-        paddy = instance.paddy
-        
-        stock, created = PaddyStockOfManager.objects.get_or_create(
-            manager=manager,
-            paddy_name = paddy.name,
-            moisture_content = paddy.moisture_content,
-            defaults={
-                'total_quantity' : 0,
-                'total_price' : 0,
-                'average_price_per_kg' : 0,
-            }
+@receiver(order_became_successful, sender=Purchase_paddy)
+@handle_once(PaddyStockOfManager.RECEIPTS[1])
+def update_paddy_stock_of_manager(sender, order, **kwargs):
+    manager = order.manager
+    paddy = order.paddy
+
+    stock, created = PaddyStockOfManager.objects.get_or_create(
+        manager=manager,
+        paddy_name = paddy.name,
+        moisture_content = paddy.moisture_content,
+        defaults={
+            'total_quantity' : 0,
+            'total_price' : 0,
+            'average_price_per_kg' : 0,
+        }
+    )
+
+    stock.total_quantity += order.quantity_purchased
+    stock.total_price += order.total_price
+
+    if stock.total_quantity > 0:
+        stock.average_price_per_kg = round(Decimal(stock.total_price)/Decimal(stock.total_quantity),2)
+
+    stock.save(movement="receipt", reference=f"Paddy purchase #{order.pk}")
+
+
+@receiver(order_became_successful, sender=PurchaseRice)
+@handle_once(RiceStock.RECEIPTS[1])
+def add_purchased_rice_to_stock(sender, order, **kwargs):
+    manager = order.manager
+    rice_post = order.rice
+
+    rice_name = rice_post.rice_name
+    quality = rice_post.quality
+
+    stock, created = RiceStock.objects.get_or_create(
+        manager=manager,
+        rice_name=rice_name,
+        quality=quality,
+        defaults={
+            'stock_quantity': 0,
+            'total_price': 0,
+            'average_price_per_kg': 0,
+        }
+    )
+
+    stock.stock_quantity += order.quantity_purchased
+    stock.total_price += order.total_price
+
+    if stock.stock_quantity > 0:
+        stock.average_price_per_kg = round(
+            Decimal(stock.total_price) / Decimal(stock.stock_quantity), 2
         )
-        
-        stock.total_quantity += instance.quantity_purchased
-        stock.total_price += instance.total_price
-        
-        if stock.total_quantity > 0:
-            stock.average_price_per_kg = round(Decimal(stock.total_price)/Decimal(stock.total_quantity),2)
-        
-        stock.save()
-        
-        
-
-@receiver(post_save, sender=PurchaseRice)
-def add_purchased_rice_to_stock(sender, instance, created, **kwargs):
-    if instance.status == 'Successful':
-        if not hasattr(instance, '_already_processed'):
-            manager = instance.manager
-            rice_post = instance.rice
-
-            rice_name = rice_post.rice_name
-            quality = rice_post.quality
-
-            stock, created = RiceStock.objects.get_or_create(
-                manager=manager,
-                rice_name=rice_name,
-                quality=quality,
-                defaults={
-                    'stock_quantity': 0,
-                    'total_price': 0,
-                    'average_price_per_kg': 0,
-                }
-            )
-
-            stock.stock_quantity += instance.quantity_purchased
-            stock.total_price += instance.total_price
-
-            if stock.stock_quantity > 0:
-                stock.average_price_per_kg = round(
-                    Decimal(stock.total_price) / Decimal(stock.stock_quantity), 2
-                )
-            stock.save()
-
-            instance._already_processed = True
-
-
-@receiver(post_save, sender=Purchase_Rice)
-def profit_loss_report_for_rice_to_customer(sender, instance, created, **kwargs):
-    # Avoid recursion by updating only when needed
-    if instance.status == "Successful" and instance.profit_or_loss in [None, 0]:
-        try:
-            stock = RiceStock.objects.get(
-                manager=instance.rice.manager,
-                rice_name=instance.rice.rice_name
-            )
+    stock.save(movement="receipt", reference=f"Rice purchase #{order.pk}")
 
+
+@receiver(order_became_successful, sender=Purchase_Rice)
+def profit_loss_report_for_rice_to_customer(sender, order, **kwargs):
+    if order.profit_or_loss in [None, 0]:
+        stock = profit.costing_stock(order.rice.manager_id, order.rice.rice_name)
+        if stock is not None:
             cost_price = Decimal(stock.average_price_per_kg or 0)
-            quantity = Decimal(instance.quantity_purchased or 0)
+            quantity = Decimal(order.quantity_purchased or 0)
             total_cost = cost_price * quantity
-            total_sale = Decimal(instance.total_price or 0)
-            profit = total_sale - total_cost
-
-            # ✅ Only update if value has changed
-            if instance.profit_or_loss != profit:
-                Purchase_Rice.objects.filter(id=instance.id).update(profit_or_loss=profit)
-
-        except RiceStock.DoesNotExist:
-            Purchase_Rice.objects.filter(id=instance.id).update(profit_or_loss=0)
-            
-            
-@receiver(post_save, sender=PurchaseRice)
-def profit_loss_report_for_rice_to_manager(sender, instance, created, **kwargs):
-    # Only recalculate if status is Successful and profit_or_loss not already set
-    if instance.status == "Successful" and instance.profit_or_loss is None:
-        try:
-            stock = RiceStock.objects.get(
-                manager=instance.rice.manager,
-                rice_name=instance.rice.rice_name
-            )
+            total_sale = Decimal(order.total_price or 0)
+            margin = total_sale - total_cost
+
+            # ✅ Only update if value has changed; the cost is kept so the report never has to look at stock again
+            if order.profit_or_loss != margin or order.stock_cost_per_kg != cost_price:
+                Purchase_Rice.objects.filter(id=order.id).update(profit_or_loss=margin, stock_cost_per_kg=cost_price)
+        else:
+            Purchase_Rice.objects.filter(id=order.id).update(profit_or_loss=0, stock_cost_per_kg=None)
+
+
+@receiver(order_became_successful, sender=PurchaseRice)
+def profit_loss_report_for_rice_to_manager(sender, order, **kwargs):
+    # Only calculate if profit_or_loss not already set
+    if order.profit_or_loss is None:
+        stock = profit.costing_stock(order.rice.manager_id, order.rice.rice_name)
+        if stock is not None:
             cost_price = Decimal(str(stock.average_price_per_kg))
-            total_cost = cost_price * Decimal(str(instance.quantity_purchased))
-            profit = Decimal(str(instance.total_price)) - total_cost
+            total_cost = cost_price * Decimal(str(order.quantity_purchased))
+            margin = Decimal(str(order.total_price)) - total_cost
+
+            order.profit_or_loss = float(margin)
+            order.save(update_fields=['profit_or_loss'])
+        else:
+            order.profit_or_loss = 0.0
+            order.save(update_fields=['profit_or_loss'])
+
+
+# Keep the full-text search tables in step with the rows they index
+RICE_SEARCH_FIELDS = {"rice_name", "description", "quality"}
+PADDY_SEARCH_FIELDS = {"name", "quality_notes", "dealer"}
+
+
+@receiver(post_save, sender=RicePost)
+def index_rice_post(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or RICE_SEARCH_FIELDS.intersection(update_fields):
+        search.index_rice_post(instance)
+
+
+@receiver(post_delete, sender=RicePost)
+def unindex_rice_post(sender, instance, **kwargs):
+    search.unindex(search.RICE_TABLE, instance.pk)
+
+
+@receiver(post_save, sender=Marketplace)
+def index_paddy_listing(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or PADDY_SEARCH_FIELDS.intersection(update_fields):
+        search.index_paddy_listing(instance)
+
+
+@receiver(post_delete, sender=Marketplace)
+def unindex_paddy_listing(sender, instance, **kwargs):
+    search.unindex(search.PADDY_TABLE, instance.pk)
+
+
+@receiver(post_save, sender=DealerProfile)
+def reindex_dealer_district(sender, instance, created, **kwargs):
+    if not created:
+        search.reindex_dealer_district(instance)
+
+
+# Receipts are immutable from Successful on: render them once, after the transition commits
+def prerender_receipts_on_success(sender, order, **kwargs):
+    transaction.on_commit(lambda: receipts.prerender_receipts(sender, order.pk))
 
-            instance.profit_or_loss = float(profit)
-            instance.save(update_fields=['profit_or_loss'])
 
-        except RiceStock.DoesNotExist:
-            instance.profit_or_loss = 0.0
-            instance.save(update_fields=['profit_or_loss'])
\ No newline at end of file
+for model in (Purchase_paddy, PurchaseRice, Purchase_Rice):
+    order_became_successful.connect(prerender_receipts_on_success, sender=model, dispatch_uid=f"receipts_{model.__name__}")
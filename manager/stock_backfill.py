@@ -0,0 +1,118 @@
+"""
+Receiving historical purchases into stock.
+
+Successful purchases are added to the buyer's stock by the transition
+receivers in manager/signals.py, which mark each order with a ProcessedEvent.
+Orders that went Successful before those receivers existed, or while they
+failed, have no marker; `python manage.py update_old_paddy_stock` and
+`update_old_rice_stock` add them here, batch by batch, for a LedgeredStock
+model whose RECEIPTS names the order model, the handler and the stock key.
+"""
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Sum
+from django.utils import timezone
+
+from RSCMS_app.models import ProcessedEvent
+from .models import StockMovement
+
+
+def pending_receipts(model, since=None):
+    """The Successful orders of `model`.RECEIPTS not received into stock yet."""
+    label, handler, _ = model.RECEIPTS
+    order_model = model._meta.apps.get_model(label)
+    orders = order_model.objects.filter(status="Successful").filter(~Exists(
+        ProcessedEvent.objects.filter(handler=handler, order_type=label, order_id=OuterRef("pk")),
+    ))
+    if since:
+        orders = orders.filter(purchase_date__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    return orders
+
+
+def backfill_receipts(model, since=None, batch_size=50000, dry_run=False, progress=None):
+    """
+    Add pending_receipts() from the `since` date on to `model`'s stock rows.
+
+    Orders are taken in id order, batch_size at a time. Each batch is one
+    GROUP BY per stock key, applied with bulk_create/bulk_update, ledgered with
+    StockMovement.record_many and marked in the same transaction, so an
+    interrupted run resumes where it stopped and a rerun finds nothing left to
+    add. With dry_run nothing is written. progress(batch, orders, keys) is
+    called after each batch.
+
+    Returns {key: [kg before, value before, kg added, value added, new stock]}.
+    """
+    _, handler, key_lookups = model.RECEIPTS
+    fields, lookups = list(key_lookups), list(key_lookups.values())
+    orders = pending_receipts(model, since)
+
+    changes = {}
+    stocks = {}
+    loaded_managers = set()
+    last_id = 0
+    batch_number = 0
+    while True:
+        ahead = orders.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)
+        upper = ahead[batch_size - 1:batch_size].first() or ahead.aggregate(last=Max("id"))["last"]
+        if upper is None:
+            break
+        batch = orders.filter(id__gt=last_id, id__lte=upper)
+        last_id = upper
+        batch_number += 1
+
+        with transaction.atomic():
+            grouped = list(batch.values(*lookups).annotate(
+                kg=Sum("quantity_purchased"), value=Sum("total_price"), count=Count("id"),
+            ).order_by())
+            keys = {tuple(row[lookup] for lookup in lookups): row for row in grouped}
+
+            # the stock rows of every manager in the batch, loaded once per manager
+            managers = {key[0] for key in keys} - loaded_managers
+            for stock in model.objects.filter(manager_id__in=managers).order_by("-id"):
+                stocks[tuple(getattr(stock, field) for field in fields)] = stock
+            loaded_managers |= managers
+
+            created, updated, movements = [], [], []
+            for key, row in keys.items():
+                stock = stocks.get(key)
+                if stock is None:
+                    stock = model(**dict(zip(fields, key)), total_price=0, average_price_per_kg=0)
+                    setattr(stock, model.QUANTITY_FIELD, 0)
+                    stocks[key] = stock
+                quantity, value = stock.balance
+                change = changes.setdefault(key, [quantity, value, 0.0, Decimal("0"), stock.pk is None])
+                change[2] += row["kg"]
+                change[3] += row["value"]
+                if dry_run:
+                    continue
+
+                setattr(stock, model.QUANTITY_FIELD, quantity + row["kg"])
+                stock.total_price = value + row["value"]
+                if quantity + row["kg"] > 0:
+                    stock.average_price_per_kg = round(stock.total_price / Decimal(str(quantity + row["kg"])), 2)
+                stock._recorded_balance = stock.balance
+                stock.updated_at = timezone.now()
+                (updated if stock.pk else created).append(stock)
+                movements.append((stock, row))
+
+            if not dry_run:
+                model.objects.bulk_create(created)
+                model.objects.bulk_update(
+                    updated, [model.QUANTITY_FIELD, "total_price", "average_price_per_kg", "updated_at"],
+                    batch_size=1000,
+                )
+                StockMovement.record_many(
+                    StockMovement(
+                        manager_id=stock.manager_id, stock_type=model.STOCK_TYPE, stock_id=stock.pk,
+                        reason="receipt", quantity=row["kg"], value=row["value"],
+                        reference=f"Backfill of {row['count']} purchases",
+                    )
+                    for stock, row in movements
+                )
+                ProcessedEvent.mark_all(handler, batch)
+
+        if progress:
+            progress(batch_number, sum(row["count"] for row in grouped), len(keys))
+    return changes
@@ -1,3 +1,583 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from customer.models import CustomerProfile, Purchase_Rice
+from dealer.models import Marketplace
+from RSCMS_app.benchmark import seed_supply_chain
+from RSCMS_app.models import ProcessedEvent
+from RSCMS_app.queries import QueryBudgetChecks, QueryPlanAssertions
+from . import profit, receipts, search, stock_backfill, views
+from .models import (
+    ManagerProfile, Purchase_paddy, PurchaseRice, RicePost, RiceStock, StockMovement, StockSnapshot,
+)
+
+
+class ReceiptTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_supply_chain(orders=1)
+
+    def setUp(self):
+        media = tempfile.mkdtemp(prefix="rscms-test-media-")
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        storage = override_settings(MEDIA_ROOT=media)
+        storage.enable()
+        self.addCleanup(storage.disable)
+        self.order = Purchase_Rice.objects.get()
+
+    def succeed(self):
+        self.order.status = "Successful"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.save()
+
+    def test_prerender_failure_does_not_fail_the_status_change(self):
+        with mock.patch.object(receipts, "render_receipt", side_effect=ValueError("boom")), \
+                self.assertLogs("rscms.receipts", "ERROR"):
+            self.succeed()
+        self.assertEqual(Purchase_Rice.objects.get(pk=self.order.pk).status, "Successful")
+
+    def test_download_failure_is_a_clean_error(self):
+        self.succeed()
+        with mock.patch.object(receipts, "render_receipt", side_effect=ValueError("boom")), \
+                mock.patch.object(receipts.default_storage, "exists", return_value=False), \
+                self.assertLogs("rscms.receipts", "ERROR"):
+            response = receipts.receipt_response("rice_sale_to_customer", self.order)
+        self.assertEqual(response.status_code, 500)
+
+    def test_receipts_without_profiles_name_the_user(self):
+        CustomerProfile.objects.all().delete()
+        ManagerProfile.objects.all().delete()
+        orders = {
+            "rice_purchase": PurchaseRice.objects.get(),
+            "rice_sale_to_manager": PurchaseRice.objects.get(),
+            "rice_sale_to_customer": self.order,
+            "customer_rice_purchase": self.order,
+        }
+        users = {
+            "rice_purchase": orders["rice_purchase"].rice.manager,
+            "rice_sale_to_manager": orders["rice_sale_to_manager"].manager,
+            "rice_sale_to_customer": self.order.customer,
+            "customer_rice_purchase": self.order.rice.manager,
+        }
+        for kind, order in orders.items():
+            with self.subTest(kind=kind):
+                order = type(order).objects.get(pk=order.pk)
+                document = receipts.RECEIPTS[kind].layout(order, 10)
+                self.assertIn(users[kind].username, document.lines[0])
+                self.assertTrue(receipts.render_receipt(kind, order, renderer="reportlab").startswith(b"%PDF"))
+
+    def test_paddy_stock_report_without_profile(self):
+        manager = PurchaseRice.objects.get().manager
+        ManagerProfile.objects.filter(user=manager).delete()
+        manager.refresh_from_db()
+        content = views.paddy_stock_report_pdf(manager, [], renderer="reportlab")
+        self.assertTrue(content.startswith(b"%PDF"))
+
+
+class CustomerProfitReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.seller = cls.users["manager"][0]
+        stocked = RicePost.objects.get(manager=cls.seller)
+        unstocked = RicePost.objects.create(
+            manager=cls.seller, rice_name="Miniket", quality="Premium", quantity_kg=1000,
+            price_per_kg=Decimal("60.00"), description="No stock held",
+        )
+        cls.stock = RiceStock.objects.create(
+            manager=cls.seller, rice_name=stocked.rice_name, stock_quantity=1000,
+            total_price=35000, average_price_per_kg=Decimal("35.00"),
+        )
+        customer = cls.users["customer"][0]
+        for rice, quantity, total_price in [(stocked, 4, "200.00"), (unstocked, 3, "180.00"), (stocked, 2, "90.00")]:
+            Purchase_Rice.objects.create(
+                customer=customer, rice=rice, quantity_purchased=quantity,
+                total_price=Decimal(total_price), delivery_cost=Decimal("15.00"),
+            )
+
+    def setUp(self):
+        media = tempfile.mkdtemp(prefix="rscms-test-media-")
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        storage = override_settings(MEDIA_ROOT=media)
+        storage.enable()
+        self.addCleanup(storage.disable)
+        for sale in Purchase_Rice.objects.all():
+            sale.status = "Successful"
+            with self.captureOnCommitCallbacks(execute=True):
+                sale.save()
+
+    def rows(self):
+        """(rice, Kg, cost per Kg, total cost, profit) of every report row, oldest first."""
+        return [
+            (sale.rice.rice_name, sale.quantity_purchased, sale.cost_per_kg, sale.total_cost, sale.profit)
+            for sale in profit.customer_sales_report(self.seller).reverse()
+        ]
+
+    def varieties(self):
+        return {
+            variety["rice__rice_name"]: (variety["count"], variety["total_cost"], variety["profit"])
+            for variety in profit.customer_sales_by_variety(profit.customer_sales_report(self.seller))
+        }
+
+    def test_rows_are_priced_at_the_stock_cost_of_the_sale(self):
+        name = self.stock.rice_name
+        self.assertEqual(self.rows(), [
+            (name, 4.0, Decimal("35.00"), Decimal("140.00"), Decimal("45.00")),
+            ("Miniket", 3.0, Decimal("0.00"), Decimal("0.00"), Decimal("165.00")),
+            (name, 2.0, Decimal("35.00"), Decimal("70.00"), Decimal("5.00")),
+        ])
+        self.assertEqual(
+            list(Purchase_Rice.objects.order_by("id").values_list("stock_cost_per_kg", flat=True)),
+            [Decimal("35.00"), None, Decimal("35.00")],
+        )
+
+    def test_variety_totals_add_up_the_rows(self):
+        self.assertEqual(self.varieties(), {
+            self.stock.rice_name: (2, Decimal("210.00"), Decimal("50.00")),
+            "Miniket": (1, Decimal("0.00"), Decimal("165.00")),
+        })
+        totals = profit.report_totals(profit.customer_sales_by_variety(profit.customer_sales_report(self.seller)))
+        self.assertEqual((totals["count"], totals["total_cost"], totals["profit"]), (3, Decimal("210.00"), Decimal("215.00")))
+
+    def test_stock_bought_or_emptied_after_the_sale_does_not_change_it(self):
+        before = (self.rows(), self.varieties())
+        RiceStock.objects.create(
+            manager=self.seller, rice_name="Miniket", stock_quantity=100,
+            total_price=5000, average_price_per_kg=Decimal("50.00"),
+        )
+        RiceStock.objects.filter(pk=self.stock.pk).delete()
+
+        self.assertEqual((self.rows(), self.varieties()), before)
+
+    def test_recompute_reprices_against_current_stock(self):
+        RiceStock.objects.create(
+            manager=self.seller, rice_name="Miniket", stock_quantity=100,
+            total_price=5000, average_price_per_kg=Decimal("50.00"),
+        )
+        RiceStock.objects.filter(pk=self.stock.pk).update(average_price_per_kg=Decimal("40.00"))
+
+        self.assertEqual(profit.recompute_customer_margins(batch_size=1), 3)
+
+        name = self.stock.rice_name
+        self.assertEqual(self.rows(), [
+            (name, 4.0, Decimal("40.00"), Decimal("160.00"), Decimal("25.00")),
+            ("Miniket", 3.0, Decimal("50.00"), Decimal("150.00"), Decimal("15.00")),
+            (name, 2.0, Decimal("40.00"), Decimal("80.00"), Decimal("-5.00")),
+        ])
+        self.assertEqual(profit.recompute_customer_margins(), 0)
+
+    def test_recompute_prices_sales_without_a_cost_basis(self):
+        # as left by the migration for a sale sold at cost, or by a receiver that never ran
+        Purchase_Rice.objects.update(stock_cost_per_kg=None, profit_or_loss=0)
+
+        self.assertEqual(profit.recompute_customer_margins(), 2)
+
+        self.assertEqual(
+            list(Purchase_Rice.objects.order_by("id").values_list("profit_or_loss", "stock_cost_per_kg")),
+            [(Decimal("60.00"), Decimal("35.00")), (Decimal("0.00"), None), (Decimal("20.00"), Decimal("35.00"))],
+        )
+
+    def test_recompute_drops_the_cost_of_stock_that_is_gone(self):
+        RiceStock.objects.filter(pk=self.stock.pk).delete()
+
+        self.assertEqual(profit.recompute_customer_margins(), 2)
+
+        self.assertEqual(self.rows()[0][2:], (Decimal("0.00"), Decimal("0.00"), Decimal("185.00")))
+
+
+class ProfitSignalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.seller, cls.buyer = cls.users["manager"]
+        cls.post = RicePost.objects.get(manager=cls.seller)
+        # one rice name held in two qualities: sales are costed against the oldest row
+        for quality, cost in (("Premium", "35.00"), ("Standard", "30.00")):
+            RiceStock.objects.create(
+                manager=cls.seller, rice_name=cls.post.rice_name, quality=quality, stock_quantity=100,
+                total_price=Decimal(cost) * 100, average_price_per_kg=Decimal(cost),
+            )
+
+    def setUp(self):
+        media = tempfile.mkdtemp(prefix="rscms-test-media-")
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        storage = override_settings(MEDIA_ROOT=media)
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+    def succeed(self, order):
+        order.status = "Successful"
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+        order.refresh_from_db()
+        return order
+
+    def test_customer_sale_priced_against_the_oldest_stock(self):
+        sale = Purchase_Rice.objects.create(
+            customer=self.users["customer"][0], rice=self.post, quantity_purchased=4, total_price=Decimal("200.00"),
+        )
+        self.assertEqual(self.succeed(sale).profit_or_loss, Decimal("60.00"))
+
+    def test_manager_sale_priced_against_the_oldest_stock(self):
+        sale = PurchaseRice.objects.create(
+            manager=self.buyer, rice=self.post, quantity_purchased=10, total_price=Decimal("500.00"),
+        )
+        self.assertEqual(self.succeed(sale).profit_or_loss, 150.0)
+
+    def test_matches_the_reports(self):
+        self.assertEqual(
+            profit.costing_stock(self.seller, self.post.rice_name).average_price_per_kg,
+            profit.stock_costs([self.seller])[(self.seller.pk, self.post.rice_name)],
+        )
+
+
+class ProfitReportPaginationTests(TestCase):
+    PAGE_SIZE = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.seller, cls.buyer = cls.users["manager"]
+        post = RicePost.objects.get(manager=cls.seller)
+        RiceStock.objects.create(
+            manager=cls.seller, rice_name=post.rice_name, stock_quantity=100,
+            total_price=Decimal("4000.00"), average_price_per_kg=Decimal("40.00"),
+        )
+        PurchaseRice.objects.bulk_create(
+            [
+                PurchaseRice(manager=cls.buyer, rice=post, quantity_purchased=kg, total_price=Decimal(kg * 50),
+                             delivery_cost=Decimal("5.00"), status="Successful")
+                for kg in range(1, 11)
+            ] + [PurchaseRice(manager=cls.buyer, rice=post, quantity_purchased=99, total_price=1)]
+        )
+        cls.old_sale = PurchaseRice.objects.filter(status="Successful").order_by("id").first()
+        PurchaseRice.objects.filter(pk=cls.old_sale.pk).update(purchase_date=timezone.now() - timedelta(days=30))
+        Purchase_Rice.objects.bulk_create(
+            Purchase_Rice(customer=cls.users["customer"][0], rice=post, quantity_purchased=kg,
+                          total_price=Decimal(kg * 60), profit_or_loss=Decimal(kg * 20),
+                          stock_cost_per_kg=Decimal("40.00"), status="Successful")
+            for kg in range(1, 7)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.seller)
+        patch = mock.patch.object(views, "PROFIT_REPORT_PAGE_SIZE", self.PAGE_SIZE)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def pages(self, name, **params):
+        url = reverse(name)
+        first = self.client.get(url, params).context
+        contexts = [first] + [
+            self.client.get(url, {**params, "page": number}).context
+            for number in first["page"].paginator.page_range[1:]
+        ]
+        return first, contexts
+
+    def test_manager_report_pages_through_every_sale_once(self):
+        first, contexts = self.pages("profit_loss_report_for_rice_to_manager")
+
+        paginator = first["page"].paginator
+        self.assertEqual((paginator.count, paginator.num_pages), (10, 3))
+        rows = [sale for context in contexts for sale in context["page"].object_list]
+        self.assertEqual([len(context["page"].object_list) for context in contexts], [4, 4, 2])
+        self.assertEqual(
+            [sale.pk for sale in rows],
+            list(profit.manager_sales_report(self.seller).values_list("pk", flat=True)),
+        )
+        self.assertEqual(rows[-1].pk, self.old_sale.pk)
+
+        totals = first["totals"]
+        self.assertEqual(totals["count"], 10)
+        self.assertEqual(totals["quantity"], 55.0)
+        self.assertEqual(totals["profit"], sum(sale.profit for sale in rows))
+        self.assertEqual(totals["profit"], Decimal(55 * 10 - 10 * 5))
+
+    def test_manager_report_date_range_limits_the_count(self):
+        today = timezone.localdate().isoformat()
+        first, contexts = self.pages("profit_loss_report_for_rice_to_manager", **{"from": today})
+
+        self.assertEqual(first["page"].paginator.count, 9)
+        self.assertEqual(first["totals"]["count"], 9)
+        self.assertNotIn(self.old_sale.pk, [sale.pk for context in contexts for sale in context["page"].object_list])
+
+    def test_out_of_range_page_shows_the_last(self):
+        page = self.client.get(reverse("profit_loss_report_for_rice_to_manager"), {"page": 99}).context["page"]
+        self.assertEqual(page.number, 3)
+        self.assertEqual(len(page.object_list), 2)
+
+    def test_customer_report_page_totals(self):
+        first, contexts = self.pages("profit_loss_report_for_rice_to_customer")
+
+        self.assertEqual(first["page"].paginator.count, 6)
+        for context in contexts:
+            sales = list(context["page"].object_list)
+            with self.subTest(page=context["page"].number):
+                self.assertEqual(context["page_totals"]["count"], len(sales))
+                self.assertEqual(context["page_totals"]["profit"], sum(sale.profit for sale in sales))
+        self.assertEqual(first["totals"]["profit"], Decimal(21 * 20))
+
+
+class RicePostReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.post = RicePost.objects.get(manager=cls.users["manager"][0])
+        RicePost.objects.filter(pk=cls.post.pk).update(quantity_kg=100)
+
+    def reload(self):
+        return RicePost.objects.get(pk=self.post.pk)
+
+    def test_reservation_returns_what_is_left(self):
+        self.assertEqual(RicePost.reserve_quantity(self.post.pk, 30), 70)
+        self.assertEqual(RicePost.reserve_quantity(self.post.pk, 12.5), 57.5)
+        self.assertFalse(self.reload().is_sold)
+
+    def test_reserving_the_rest_marks_the_post_sold(self):
+        self.assertEqual(RicePost.reserve_quantity(self.post.pk, 100), 0)
+        self.assertTrue(self.reload().is_sold)
+        self.assertIsNone(RicePost.reserve_quantity(self.post.pk, 1))
+
+    def test_oversell_is_refused_and_changes_nothing(self):
+        self.assertIsNone(RicePost.reserve_quantity(self.post.pk, 100.5))
+        post = self.reload()
+        self.assertEqual((post.quantity_kg, post.is_sold), (100, False))
+
+    def test_manager_purchase_over_the_post_is_a_form_error(self):
+        self.client.force_login(self.users["manager"][1])
+        url = reverse("purchase_rice", args=[self.post.pk])
+
+        response = self.client.post(url, {"quantity_purchased": 101, "delivery_cost": 0})
+        self.assertIn("Not enough rice available.", response.context["form"].errors["quantity_purchased"])
+        self.assertFalse(PurchaseRice.objects.exists())
+
+        self.client.post(url, {"quantity_purchased": 100, "delivery_cost": 0})
+        self.assertEqual(PurchaseRice.objects.get().quantity_purchased, 100)
+        self.assertTrue(self.reload().is_sold)
+
+
+@skipUnless(search.fts_enabled(), "the FTS5 tables are SQLite only")
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.seller = cls.users["manager"][0]
+
+    def rice_names(self, query):
+        return [post.rice_name for post in search.search_rice_posts(query)[:50]]
+
+    def paddy_names(self, query):
+        return [listing.name for listing in search.search_paddy_listings(query)[:50]]
+
+    def post(self, rice_name, description="", quality="Premium"):
+        return RicePost.objects.create(
+            manager=self.seller, rice_name=rice_name, quality=quality, quantity_kg=100,
+            price_per_kg=Decimal("50.00"), description=description,
+        )
+
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(search.match_expression("sona  mas!"), '"sona"* "mas"*')
+        self.assertIsNone(search.match_expression(" -- "))
+        self.assertEqual(sorted(self.rice_names("sona mas")), ["Sona Masuri 0", "Sona Masuri 1"])
+        self.assertEqual(self.rice_names("sona basmati"), [])
+        self.assertEqual(search.search_rice_posts("?!"), [])
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.post("Kalijira", description="Aromatic, like a small basmati")
+        self.post("Basmati Gold", description="Long grain")
+        self.assertEqual(self.rice_names("basmati"), ["Basmati Gold", "Kalijira"])
+
+    def test_index_follows_saves_and_deletes(self):
+        post = self.post("Chinigura")
+        self.assertEqual(self.rice_names("chini"), ["Chinigura"])
+        post.rice_name = "Kataribhog"
+        post.save()
+        self.assertEqual(self.rice_names("chini"), [])
+        self.assertEqual(self.rice_names("katari"), ["Kataribhog"])
+        post.delete()
+        self.assertEqual(self.rice_names("katari"), [])
+
+    def test_listings_are_found_by_dealer_district(self):
+        self.assertEqual(len(self.paddy_names("guntur")), 2)
+        dealer = Marketplace.objects.order_by("id").first().dealer
+        dealer.district = "Krishna"
+        dealer.save()
+        self.assertEqual(self.paddy_names("krishna"), [Marketplace.objects.order_by("id").first().name])
+        self.assertEqual(len(self.paddy_names("guntur")), 1)
+
+    def test_rebuild_catches_up_with_writes_that_skip_signals(self):
+        RicePost.objects.filter(manager=self.seller).update(rice_name="Miniket")
+        self.assertEqual(self.rice_names("miniket"), [])
+        search.rebuild()
+        self.assertEqual(self.rice_names("miniket"), ["Miniket"])
+        self.assertEqual(len(self.paddy_names("swarna")), 2)
+
+    def test_results_follow_the_role_and_are_paginated(self):
+        for i in range(views.SEARCH_PAGE_SIZE + 5):
+            self.post(f"Swarna rice {i}")
+        expectations = {"customer": (True, False), "dealer": (False, True), "manager": (True, True)}
+        for role, (sees_rice, sees_paddy) in expectations.items():
+            with self.subTest(role):
+                self.client.force_login(self.users[role][0])
+                response = self.client.get(reverse("search"), {"query": "swarna"})
+                self.assertEqual(bool(response.context["rice_results"]), sees_rice)
+                self.assertEqual(bool(response.context["paddy_results"]), sees_paddy)
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse("search"), {"query": "swarna rice", "rice_page": 2})
+        page = response.context["rice_results"]
+        self.assertEqual(page.paginator.count, views.SEARCH_PAGE_SIZE + 5)
+        self.assertEqual(len(page.object_list), 5)
+
+
+class StockLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.manager = cls.users["manager"][0]
+
+    def setUp(self):
+        self.stock = RiceStock.objects.create(
+            manager=self.manager, rice_name="Ledger Rice", stock_quantity=100, total_price=Decimal("4000.00"),
+        )
+
+    def move(self, kg, value):
+        return StockMovement.record(self.manager.pk, "rice", self.stock.pk, "adjustment", kg, Decimal(value))
+
+    def test_saves_are_ledgered(self):
+        self.stock.stock_quantity = 60
+        self.stock.total_price = Decimal("2400.00")
+        self.stock.save(movement="milling", reference="batch 7")
+
+        self.assertEqual(
+            list(StockMovement.objects.filter(stock_id=self.stock.pk).values_list("reason", "quantity", "value")),
+            [("adjustment", 100.0, Decimal("4000.00")), ("milling", -40.0, Decimal("-1600.00"))],
+        )
+        self.assertEqual(StockMovement.balance("rice", self.stock.pk), self.stock.balance)
+        with self.assertRaises(ValueError):
+            StockMovement.objects.first().delete()
+
+    def test_balance_at_a_past_time(self):
+        week_ago, yesterday = timezone.now() - timedelta(days=7), timezone.now() - timedelta(days=1)
+        StockMovement.objects.filter(stock_id=self.stock.pk).update(created_at=week_ago)
+        later = self.move(-30, "-1200.00")
+        StockMovement.objects.filter(pk=later.pk).update(created_at=yesterday)
+        self.move(5, "200.00")
+
+        self.assertEqual(StockMovement.balance("rice", self.stock.pk, at=week_ago - timedelta(seconds=1)), (0, 0))
+        self.assertEqual(StockMovement.balance("rice", self.stock.pk, at=week_ago), (100.0, Decimal("4000.00")))
+        self.assertEqual(StockMovement.balance("rice", self.stock.pk, at=yesterday), (70.0, Decimal("2800.00")))
+        self.assertEqual(StockMovement.balance("rice", self.stock.pk), (75.0, Decimal("3000.00")))
+
+    def test_snapshot_every_so_many_movements(self):
+        for _ in range(StockMovement.SNAPSHOT_EVERY - 2):
+            self.move(1, "40.00")
+        self.assertFalse(StockSnapshot.objects.exists())
+
+        last = self.move(1, "40.00")
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual((snapshot.last_movement_id, snapshot.quantity, snapshot.value), (last.pk, 149.0, Decimal("5960.00")))
+
+        self.move(-9, "-360.00")
+        with self.assertNumQueries(2):
+            self.assertEqual(StockMovement.balance("rice", self.stock.pk), (140.0, Decimal("5600.00")))
+        # a time before the snapshot replays the ledger from the start
+        before = snapshot.taken_at - timedelta(microseconds=1)
+        self.assertEqual(StockMovement.balance("rice", self.stock.pk, at=before), (148.0, Decimal("5920.00")))
+
+    def test_record_many_snapshots_the_stocks_that_are_due(self):
+        other = RiceStock.objects.create(manager=self.manager, rice_name="Other Rice", stock_quantity=0)
+        movements = [
+            StockMovement(manager=self.manager, stock_type="rice", stock_id=stock.pk, reason="receipt",
+                          quantity=2, value=Decimal("80.00"))
+            for stock in [self.stock] * (2 * StockMovement.SNAPSHOT_EVERY) + [other] * 3
+        ]
+
+        # the INSERT and the grouped count, then the one snapshot
+        with self.assertNumQueries(7):
+            StockMovement.record_many(movements)
+
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual(snapshot.stock_id, self.stock.pk)
+        self.assertEqual((snapshot.quantity, snapshot.value), (300.0, Decimal("12000.00")))
+        self.assertEqual(StockMovement.balance("rice", other.pk), (6.0, Decimal("240.00")))
+
+
+class StockBackfillTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_supply_chain(orders=0)
+        cls.buyer, seller = cls.users["manager"]
+        cls.post = RicePost.objects.filter(manager=seller).first()
+
+    def unstocked_order(self, kg, price):
+        # Successful without the transition, like orders from before the stock receivers
+        order = PurchaseRice.objects.create(
+            manager=self.buyer, rice=self.post, quantity_purchased=kg, total_price=Decimal(price),
+        )
+        PurchaseRice.objects.filter(pk=order.pk).update(status="Successful")
+        return order
+
+    def test_adds_unstocked_orders_once(self):
+        stock = RiceStock.objects.create(
+            manager=self.buyer, rice_name=self.post.rice_name, quality=self.post.quality,
+            stock_quantity=10, total_price=Decimal("500.00"),
+        )
+        orders = [self.unstocked_order(20, "1000.00"), self.unstocked_order(30, "1500.00")]
+        PurchaseRice.objects.create(manager=self.buyer, rice=self.post, quantity_purchased=99, total_price=1)
+
+        changes = stock_backfill.backfill_receipts(RiceStock, batch_size=1)
+
+        key = (self.buyer.pk, self.post.rice_name, self.post.quality)
+        self.assertEqual(changes, {key: [10.0, Decimal("500.00"), 50.0, Decimal("2500.00"), False]})
+        stock.refresh_from_db()
+        self.assertEqual(
+            (stock.stock_quantity, stock.total_price, stock.average_price_per_kg),
+            (60.0, Decimal("3000.00"), Decimal("50.00")),
+        )
+        self.assertEqual(StockMovement.balance("rice", stock.pk), stock.balance)
+        self.assertEqual(ProcessedEvent.objects.filter(handler="rice_stock_receipt").count(), len(orders))
+        self.assertEqual(stock_backfill.backfill_receipts(RiceStock), {})
+
+    def test_dry_run_writes_nothing(self):
+        self.unstocked_order(20, "1000.00")
+
+        changes = stock_backfill.backfill_receipts(RiceStock, dry_run=True)
+
+        self.assertEqual(list(changes.values()), [[0.0, Decimal("0"), 20.0, Decimal("1000.00"), True]])
+        self.assertFalse(RiceStock.objects.filter(manager=self.buyer).exists())
+        self.assertEqual(stock_backfill.pending_receipts(RiceStock).count(), 1)
+
+
+@skipUnless(connection.vendor == "sqlite", "plans are read from SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(QueryPlanAssertions, TestCase):
+    def test_manager_order_lists_use_an_index(self):
+        for label, queryset in [
+            ("paddy orders", Purchase_paddy.objects.filter(manager=1).order_by("-purchase_date")),
+            ("successful paddy purchases",
+             Purchase_paddy.objects.filter(manager=1, status="Successful").order_by("-purchase_date")),
+            ("rice bought from managers",
+             PurchaseRice.objects.filter(manager=1, status="Successful").order_by("-purchase_date")),
+            ("rice sold to managers",
+             PurchaseRice.objects.filter(rice__manager=1, status="Successful").order_by("-purchase_date")),
+            ("rice sold to customers",
+             Purchase_Rice.objects.filter(rice__manager=1, status="Successful").order_by("-purchase_date")),
+        ]:
+            with self.subTest(label):
+                self.assertServedByIndex(queryset)
+
+    def test_stock_and_post_lookups_use_an_index(self):
+        self.assertServedByIndex(RiceStock.objects.filter(manager=1, rice_name="Sona Masuri"))
+        self.assertServedByIndex(RicePost.objects.filter(is_sold=False).order_by("-created_at"))
+        self.assertServedByIndex(RicePost.objects.filter(manager=1, is_sold=False).order_by("-created_at"))
+
+
+class QueryBudgetTests(QueryBudgetChecks, TestCase):
+    app_label = "manager"
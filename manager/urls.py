@@ -24,6 +24,7 @@ urlpatterns = [
     path('purchase_rice/<int:id>/', views.purchase_rice, name='purchase_rice'),
     path('purchase_history/', views.purchase_history, name='purchase_history'),
     path('purchase_history_seen_admin/<int:id>', views.purchase_history_seen_admin, name='purchase_history_seen_admin'),
+    path('purchase_history/export/<str:kind>/', views.export_purchase_history, name='export_purchase_history'),
     
     # path('Mock_Payment_UI/', views.Mock_Payment_UI, name='Mock_Payment_UI'),
     
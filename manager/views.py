@@ -2,24 +2,29 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import render,redirect,get_object_or_404,HttpResponse
 from .models import ManagerProfile, RicePost, Purchase_paddy,PurchaseRice,PaymentForPaddy,PaymentForRice, PaddyStockOfManager,RiceStock
 from dealer.models import Marketplace, PaddyStock,Marketplace
+from dealer.marketplace import marketplace_context
+from RSCMS_app.otp import OTPService, VERIFIED, INVALID, EXPIRED, LOCKED
+from RSCMS_app.queries import query_budget
+from RSCMS_app import exports
+from . import pdf, profit, receipts
+from . import search as search_index
 from .forms import ManagerProfileForm, RicePostForm, Purchase_paddyForm, PurchaseRiceForm,PaymentForPaddyForm, PaymentForRiceForm,RiceStockForm,PaddyStockForm
 from decimal import Decimal
 from django.db.models import Count, Sum, Avg
+from django.db.models.functions import Coalesce
 from customer.models import Purchase_Rice
 from django.contrib import messages
 
 import uuid
-import random
-from datetime import datetime, timedelta
-from django.core.mail import send_mail
+from RSCMS_app.models import OutboundEmail
 from django.conf import settings
-from django.db.models import Q
+from django.db import transaction
+from django.core.paginator import Paginator
 
 
 from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 #from weasyprint import HTML
-from reportlab.pdfgen import canvas
 
 from django.template.loader import get_template
 import tempfile
@@ -55,12 +60,13 @@ def create_rice_post(request,id):
             if rice_qty>0 and rice_qty<=rice_stock.stock_quantity:
                 rice_stock.stock_quantity -= rice_qty
                 rice_stock.total_price -= Decimal(rice_qty*float(rice_stock.average_price_per_kg))
-                rice_stock.save()
             else:
                 messages.error(request,"Invalid Quantity or insufficient stock")
                 return redirect('rice_stock_report')
             
-            rice_post.save()
+            with transaction.atomic():
+                rice_post.save()
+                rice_stock.save(movement="posting", reference=f"Rice post #{rice_post.pk}")
             return redirect("show_my_rice_post")
     else:
         form = RicePostForm()
@@ -90,9 +96,10 @@ def delete_rice_post(request,id):
 
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_customer_and_admin)
+@query_budget(8, role="manager")
 def explore_all_rice_post(request):
     if request.user.role in ['admin','manager','customer']:
-        rice_posts = RicePost.objects.filter( is_sold=False).order_by("-created_at")
+        rice_posts = RicePost.objects.filter( is_sold=False).select_related("manager__managerprofile").order_by("-created_at")
     else:
         #TODO have to add a html file for this response
         return HttpResponse("Only admin, manager and customer can see this post")
@@ -104,9 +111,10 @@ def explore_all_rice_post(request):
 
 @login_required(login_url="login")
 @user_passes_test(check_manager)
+@query_budget(8, role="manager")
 def show_my_rice_post(request):
     if request.user.role in ['manager']:
-        rice_posts = RicePost.objects.filter(manager=request.user, is_sold=False).order_by("-created_at")
+        rice_posts = RicePost.objects.filter(manager=request.user, is_sold=False).select_related("manager__managerprofile").order_by("-created_at")
     else:
         #TODO have to add a html file for this response
         return HttpResponse("Only manager can see this post")
@@ -159,31 +167,7 @@ def manager_profile(request):
 @login_required(login_url="login")
 @user_passes_test(check_manager)
 def explore_paddy_post(request):
-    
-    sort = request.GET.get('sort', 'recent')
-
-    posts = Marketplace.objects.filter(is_available=True)
-
-    if sort == 'price_asc':
-        posts = posts.order_by('price_per_kg')
-    elif sort == 'price_desc':
-        posts = posts.order_by('-price_per_kg')
-    elif sort == 'moisture':
-        posts = posts.order_by('moisture_content')
-    else:  # ' By Default
-        posts = posts.order_by('-stored_since')
-
-    avg_price = posts.aggregate(avg=Avg('price_per_kg'))['avg']
-    total_quantity = posts.aggregate(total=Sum('quantity'))['total'] or 0
-    top_dealer = posts.values('dealer__user__username').annotate(post_count=Count('id')).order_by('-post_count').first()
-
-    return render(request, 'dealer/paddy_posts.html', {
-        'posts': posts,
-        'avg_price': avg_price,
-        'total_quantity': total_quantity,
-        'top_dealer': top_dealer['dealer__user__username'] if top_dealer else None,
-        'current_sort': sort,
-    })
+    return render(request, 'dealer/paddy_posts.html', marketplace_context(request))
    
 
 @login_required(login_url="login")
@@ -195,19 +179,20 @@ def purchase_paddy(request,id):
         if form.is_valid():
             purchase = form.save(commit=False)
             
-            if purchase.quantity_purchased > paddy.quantity:
-                form.add_error('quantity_purchased', "Not enough stock available.")
+            if purchase.quantity_purchased <= 0 or not float(purchase.quantity_purchased).is_integer():
+                form.add_error('quantity_purchased', "Quantity must be a whole number of Kg.")
                 return render(request, "manager/purchase_paddy.html", {'form': form, 'paddy': paddy})
             
             purchase.manager = request.user
             purchase.paddy = paddy
             purchase.total_price = Decimal((purchase.quantity_purchased/40.0) * float(paddy.price_per_kg)) + purchase.transport_cost
-            purchase.save()
             
-            paddy.quantity=paddy.quantity -  (Decimal(purchase.quantity_purchased))
-            if paddy.quantity <= 0:
-                paddy.is_available = False
-            paddy.save()
+            # Reserve and record in one transaction so concurrent buyers can't oversell the lot
+            with transaction.atomic():
+                if not Marketplace.reserve_quantity(paddy.id, int(purchase.quantity_purchased)):
+                    form.add_error('quantity_purchased', "Not enough stock available.")
+                    return render(request, "manager/purchase_paddy.html", {'form': form, 'paddy': paddy})
+                purchase.save()
             return redirect("my_paddy_order")
     else:
         form = Purchase_paddyForm()
@@ -222,18 +207,18 @@ def purchase_rice(request, id):
         if form.is_valid():
             purchase = form.save(commit=False) 
             
-            if purchase.quantity_purchased > rice.quantity_kg:
-                form.add_error('quantity_purchased', "Not enough rice available.")
+            if purchase.quantity_purchased <= 0:
+                form.add_error('quantity_purchased', "Quantity must be greater than zero.")
                 return render(request, "manager/purchase_rice.html", {'form': form, 'rice': rice})
             
             purchase.manager = request.user
             purchase.rice  = rice 
             purchase.total_price = (Decimal(purchase.quantity_purchased)*rice.price_per_kg) + purchase.delivery_cost
-            purchase.save()
-            rice.quantity_kg = rice.quantity_kg - purchase.quantity_purchased  
-            if rice.quantity_kg <= 0:
-                rice.is_sold = True  
-            rice.save() 
+            with transaction.atomic():
+                if RicePost.reserve_quantity(rice.id, purchase.quantity_purchased) is None:
+                    form.add_error('quantity_purchased', "Not enough rice available.")
+                    return render(request, "manager/purchase_rice.html", {'form': form, 'rice': rice})
+                purchase.save()
             return redirect("my_rice_order")
     else:
         form = PurchaseRiceForm() 
@@ -242,12 +227,13 @@ def purchase_rice(request, id):
 
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
+@query_budget(10, role="manager")
 def purchase_history(request):
-    purchases_paddy = Purchase_paddy.objects.filter(manager=request.user,status="Successful").order_by("-purchase_date")
-    selling_rice = Purchase_Rice.objects.filter(rice__manager=request.user,status="Successful").order_by("-purchase_date")
+    purchases_paddy = Purchase_paddy.objects.filter(manager=request.user,status="Successful").select_related("paddy__dealer__user").order_by("-purchase_date")
+    selling_rice = Purchase_Rice.objects.filter(rice__manager=request.user,status="Successful").select_related("rice", "customer__customerprofile").order_by("-purchase_date")
     
-    purchases_rice_from_others_manager = PurchaseRice.objects.filter(manager=request.user,status="Successful").order_by("-purchase_date")
-    selling_rice_to_managers = PurchaseRice.objects.filter(rice__manager=request.user,status="Successful").order_by("-purchase_date")
+    purchases_rice_from_others_manager = PurchaseRice.objects.filter(manager=request.user,status="Successful").select_related("rice__manager__managerprofile").order_by("-purchase_date")
+    selling_rice_to_managers = PurchaseRice.objects.filter(rice__manager=request.user,status="Successful").select_related("rice", "manager__managerprofile").order_by("-purchase_date")
 
     context = {
         "purchases_paddy": purchases_paddy,
@@ -259,6 +245,60 @@ def purchase_history(request):
     return render(request, "manager/purchase_history.html", context)
 
 
+# Columns of the purchase history exports, as (header, lookup)
+def _rice_columns(party_header, party):
+    return [
+        ("Rice Name", "rice__rice_name"),
+        (party_header, party),
+        ("Quantity (kg)", "quantity_purchased"),
+        ("Price/kg", "rice__price_per_kg"),
+        ("Delivery Cost", "delivery_cost"),
+        ("Total Price", "total_price"),
+        ("Date", "purchase_date"),
+        ("Payment", "payment"),
+    ]
+
+
+PURCHASE_HISTORY_EXPORTS = {
+    "paddy_purchases": (
+        lambda user: Purchase_paddy.objects.filter(manager=user, status="Successful"),
+        [
+            ("Paddy Name", "paddy__name"),
+            ("Dealer", "paddy__dealer__user__username"),
+            ("Quantity (kg)", "quantity_purchased"),
+            ("Price/kg", "paddy__price_per_kg"),
+            ("Transport Cost", "transport_cost"),
+            ("Total Price", "total_price"),
+            ("Date", "purchase_date"),
+            ("Payment", "payment"),
+        ],
+    ),
+    "rice_purchases": (
+        lambda user: PurchaseRice.objects.filter(manager=user, status="Successful"),
+        _rice_columns("Manager", "rice__manager__managerprofile__full_name"),
+    ),
+    "rice_sales_to_customers": (
+        lambda user: Purchase_Rice.objects.filter(rice__manager=user, status="Successful"),
+        _rice_columns("Customer", Coalesce("customer__customerprofile__full_name", "customer__username")),
+    ),
+    "rice_sales_to_managers": (
+        lambda user: PurchaseRice.objects.filter(rice__manager=user, status="Successful"),
+        _rice_columns("Manager", "manager__managerprofile__full_name"),
+    ),
+}
+
+
+@login_required(login_url="login")
+@user_passes_test(check_manager_and_admin)
+def export_purchase_history(request, kind):
+    if kind not in PURCHASE_HISTORY_EXPORTS:
+        raise Http404("Unknown export")
+    orders, columns = PURCHASE_HISTORY_EXPORTS[kind]
+    return exports.export_response(
+        request, orders(request.user).order_by("purchase_date"), columns, kind, date_field="purchase_date",
+    )
+
+
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
 def purchase_history_seen_admin(request, id):
@@ -318,42 +358,33 @@ def insert_phone_number(request,purchase_id):
     return render(request,"manager/payment/insert_phone_number.html")
 
 
-otp_storage = {}
+paddy_payment_otp = OTPService("paddy_payment")
 @login_required
 def send_purchases_otp(request,email,purchase_id):
-    otp = random.randint(100000,999999)
-    otp_storage[email] = {
-        'otp' : otp,
-        'timestamp' : datetime.now()
-    }
+    otp = paddy_payment_otp.issue(email)
     subject = "Transaction OTP - RSCMS"
     message = f"Have a Good Day!\n\nYour OTP for transaction is: {otp}\n\nNever share your Code and PIN with anyone.\n\nRSCMS never ask for this.\n\nExpiry: within 300 seconds"
-    send_mail(subject,message,settings.EMAIL_HOST_USER, [email])
+    OutboundEmail.enqueue(subject, message, settings.EMAIL_HOST_USER, [email])
     
     return redirect("insert_otp",purchase_id=purchase_id,email=email)
     
     
 @login_required
 def verify_purchases_otp(request, email, purchase_id, otp):
-    data = otp_storage.get(email)
-    if data:
-        otp_valid = data['otp'] == otp
-        otp_expired = datetime.now() > data['timestamp'] + timedelta(minutes=5)
-
-        if otp_valid and not otp_expired:
-            del otp_storage[email]
-            messages.success(request, "OTP verified successfully.")
-            return redirect("insert_password", purchase_id=purchase_id,email=email)
-        elif otp_expired:
-            del otp_storage[email]
-            messages.error(request, "OTP has expired. Please request a new one.")
-            return redirect('insert_phone_number', purchase_id=purchase_id)
-        else:
-            messages.error(request, "Invalid OTP. Please try again.")
-            return redirect('insert_otp', purchase_id=purchase_id, email=email)
+    result = paddy_payment_otp.verify(email, otp)
+    if result == VERIFIED:
+        messages.success(request, "OTP verified successfully.")
+        return redirect("insert_password", purchase_id=purchase_id,email=email)
+    elif result == INVALID:
+        messages.error(request, "Invalid OTP. Please try again.")
+        return redirect('insert_otp', purchase_id=purchase_id, email=email)
+    elif result == EXPIRED:
+        messages.error(request, "OTP has expired. Please request a new one.")
+    elif result == LOCKED:
+        messages.error(request, "Too many wrong OTPs. Please request a new one.")
     else:
         messages.error(request, "No OTP found for this email.")
-        return redirect('insert_phone_number', purchase_id=purchase_id)
+    return redirect('insert_phone_number', purchase_id=purchase_id)
 
 
 @login_required
@@ -447,41 +478,32 @@ def insert_phone_number_for_rice(request,purchase_id):
             return redirect("insert_phone_number_for_rice",purchase_id=purchase_id)
     return render(request,"manager/payment/insert_phone_number.html")
 
-otp_storage_for_rice = {}
+rice_payment_otp = OTPService("rice_payment")
 @login_required
 def send_purchases_otp_for_rice(request,email,purchase_id):
-    otp = random.randint(100000,999999)
-    otp_storage_for_rice[email] = {
-        'otp' : otp,
-        'timestamp' : datetime.now()
-    }
+    otp = rice_payment_otp.issue(email)
     subject = "Transaction OTP - RSCMS"
     message = f"Have a Good Day!\n\nYour OTP for transaction is: {otp}\n\nNever share your Code and PIN with anyone.\n\nRSCMS never ask for this.\n\nExpiry: within 300 seconds"
-    send_mail(subject,message,settings.EMAIL_HOST_USER, [email])
+    OutboundEmail.enqueue(subject, message, settings.EMAIL_HOST_USER, [email])
     
     return redirect("insert_otp_for_rice",purchase_id=purchase_id,email=email)
     
 @login_required
 def verify_purchases_otp_for_rice(request, email, purchase_id, otp):
-    data = otp_storage_for_rice.get(email)
-    if data:
-        otp_valid = data['otp'] == otp
-        otp_expired = datetime.now() > data['timestamp'] + timedelta(minutes=5)
-
-        if otp_valid and not otp_expired:
-            del otp_storage_for_rice[email]
-            messages.success(request, "OTP verified successfully.")
-            return redirect("insert_password_for_rice", purchase_id=purchase_id,email=email)
-        elif otp_expired:
-            del otp_storage_for_rice[email]
-            messages.error(request, "OTP has expired. Please request a new one.")
-            return redirect('insert_phone_number_for_rice', purchase_id=purchase_id)
-        else:
-            messages.error(request, "Invalid OTP. Please try again.")
-            return redirect('insert_otp_for_rice', purchase_id=purchase_id, email=email)
+    result = rice_payment_otp.verify(email, otp)
+    if result == VERIFIED:
+        messages.success(request, "OTP verified successfully.")
+        return redirect("insert_password_for_rice", purchase_id=purchase_id,email=email)
+    elif result == INVALID:
+        messages.error(request, "Invalid OTP. Please try again.")
+        return redirect('insert_otp_for_rice', purchase_id=purchase_id, email=email)
+    elif result == EXPIRED:
+        messages.error(request, "OTP has expired. Please request a new one.")
+    elif result == LOCKED:
+        messages.error(request, "Too many wrong OTPs. Please request a new one.")
     else:
         messages.error(request, "No OTP found for this email.")
-        return redirect('insert_phone_number_for_rice', purchase_id=purchase_id)
+    return redirect('insert_phone_number_for_rice', purchase_id=purchase_id)
 
 
 @login_required
@@ -538,38 +560,21 @@ def mock_rice_payment_fail(request):
 
 
 # Search functionality
+SEARCH_PAGE_SIZE = 20
+
+
 @login_required
 def search(request):
-    query = request.GET.get('query')  
+    query = request.GET.get('query', '').strip()
     rice_results = []
     paddy_results = []
 
     user = request.user
-    print(query)
-    if user.is_authenticated:
-        if user.role in ["manager", "admin"]:
-            if query:
-                rice_results = RicePost.objects.filter(
-                    Q(rice_name__icontains=query) |
-                    Q(description__icontains=query)
-                )
-                paddy_results = Marketplace.objects.filter(
-                    Q(name__icontains=query)
-                )
-                all = Marketplace.objects.all()
-                print(all)
-
-        elif user.role == "dealer":
-            if query:
-                paddy_results = Marketplace.objects.filter(
-                    Q(name__icontains=query)
-                )
-
-        elif user.role == "customer":
-            if query:
-                rice_results = RicePost.objects.filter(
-                    Q(rice_name__icontains=query)
-                )
+    if query:
+        if user.role in ["manager", "admin", "customer"]:
+            rice_results = Paginator(search_index.search_rice_posts(query), SEARCH_PAGE_SIZE).get_page(request.GET.get('rice_page'))
+        if user.role in ["manager", "admin", "dealer"]:
+            paddy_results = Paginator(search_index.search_paddy_listings(query), SEARCH_PAGE_SIZE).get_page(request.GET.get('paddy_page'))
 
     context = {
         'query': query,
@@ -579,8 +584,9 @@ def search(request):
     return render(request, 'manager/search_results.html', context)
 
 # My rice order and track that i order to another manager
+@query_budget(8, role="manager")
 def my_rice_order(request):
-    orders = PurchaseRice.objects.filter(manager=request.user).order_by("-purchase_date")
+    orders = PurchaseRice.objects.filter(manager=request.user).select_related("rice__manager__managerprofile").order_by("-purchase_date")
     return render(request,"manager/my_rice_order.html",{"orders":orders})
 
 # after delivery rice order from another manager i have to update status as confirm
@@ -605,9 +611,10 @@ def confirm_rice_delivery_done_by_other_manager(request, id):
 # Oder track for rice that comes from customer and others manager
 @login_required
 @user_passes_test(lambda u: u.role == 'manager')
+@query_budget(10, role="manager")
 def incoming_order(request):
-    orders = Purchase_Rice.objects.filter(rice__manager=request.user).order_by("-purchase_date")
-    rice_orders = PurchaseRice.objects.filter(rice__manager=request.user).order_by("-purchase_date")
+    orders = Purchase_Rice.objects.filter(rice__manager=request.user).select_related("customer", "rice").order_by("-purchase_date")
+    rice_orders = PurchaseRice.objects.filter(rice__manager=request.user).select_related("manager__managerprofile", "rice").order_by("-purchase_date")
     return render(request, 'manager/incoming_order.html', {'orders': orders,'rice_orders':rice_orders})
 
 # rice order from customer that i have to accept
@@ -646,8 +653,9 @@ def update_order_status_for_customer(request, id):
 # Order and delivery track for paddy that i order to dealer
 @login_required
 @user_passes_test(lambda u: u.role == 'manager')
+@query_budget(8, role="manager")
 def my_paddy_order(request):
-    orders = Purchase_paddy.objects.filter(manager=request.user).order_by("-purchase_date")
+    orders = Purchase_paddy.objects.filter(manager=request.user).select_related("paddy__dealer__user").order_by("-purchase_date")
     return render(request, 'manager/my_paddy_order.html', {'orders': orders})
 
 # after receiving order from dealer i have to update status of delivery as confirm
@@ -750,7 +758,7 @@ def process_paddy_to_rice(request, stock_id):
             stock.total_quantity = 0
             stock.is_active = False
         stock.total_price -= Decimal(process_qty * float(stock.average_price_per_kg))
-        stock.save()
+        stock.save(movement="milling", reference=f"Milled into {process_rice_name}")
 
         # Update or create rice stock
         rice_stock, created = RiceStock.objects.get_or_create(
@@ -768,7 +776,7 @@ def process_paddy_to_rice(request, stock_id):
         rice_stock.average_price_per_kg = round(
             Decimal(rice_stock.total_price) / Decimal(total_rice_qty), 2
         )
-        rice_stock.save()
+        rice_stock.save(movement="milling", reference=f"Milled from paddy stock #{stock.pk}")
 
         messages.success(
             request,
@@ -823,30 +831,38 @@ def download_paddy_stock_report(request):
     manager = request.user
     paddy_stocks = PaddyStockOfManager.objects.filter(manager=manager)
 
-    # Calculate total stock
-    total_paddy_stock = sum(stock.total_quantity for stock in paddy_stocks)
-
-    # Render HTML template
-    html_content = render_to_string(
-        "manager/pdf_download/paddy_stock_report_pdf.html",
-        {
-            "manager": manager,
-            "paddy_stocks": paddy_stocks,
-            "total_paddy_stock": total_paddy_stock,
-        },
-    )
+    try:
+        content = paddy_stock_report_pdf(manager, paddy_stocks)
+    except pdf.RenderError:
+        return HttpResponse("Error generating PDF", status=500)
 
-    # Setup PDF response
-    response = HttpResponse(content_type="application/pdf")
+    response = HttpResponse(content, content_type="application/pdf")
     response["Content-Disposition"] = 'attachment; filename="paddy_stock_report.pdf"'
+    return response
 
-    # Generate PDF with pisa
-    pisa_status = pisa.CreatePDF(html_content, dest=response)
 
-    if pisa_status.err:
-        return HttpResponse("Error generating PDF", status=500)
+def paddy_stock_report_pdf(manager, paddy_stocks, renderer=None):
+    """The paddy stock report as PDF bytes, from the configured backend unless `renderer` is given."""
+    paddy_stocks = list(paddy_stocks)
+    total_paddy_stock = sum(stock.total_quantity for stock in paddy_stocks)
 
-    return response
+    if (renderer or pdf.renderer_for("paddy_stock_report")) == "reportlab":
+        return pdf.draw(pdf.Document(
+            "Paddy Stock Report",
+            [f"Manager: {pdf.display_name(manager, pdf.profile_of(manager, 'managerprofile'))}",
+             f"Total available paddy: {total_paddy_stock} Kg"],
+            ["Paddy Name", "Moisture Content", "Quantity (kg)", "Total Price/kg", "Avg price/kg", "Last Updated"],
+            [
+                [stock.paddy_name, stock.moisture_content, stock.total_quantity, stock.total_price,
+                 stock.average_price_per_kg, pdf.format_date(stock.updated_at)]
+                for stock in paddy_stocks
+            ],
+        ))
+    return pdf.render_html("manager/pdf_download/paddy_stock_report_pdf.html", {
+        "manager": manager,
+        "paddy_stocks": paddy_stocks,
+        "total_paddy_stock": total_paddy_stock,
+    })
 
 @login_required
 @user_passes_test(check_manager)    
@@ -945,162 +961,88 @@ def delete_paddy_stock(request,id):
         return redirect("paddy_stock_report")
     return redirect("paddy_stock_report")
 
+PROFIT_REPORT_PAGE_SIZE = 50
+
+
+def report_dates(request):
+    """The report's ?from=/&to= dates; both None, with an error message, when they don't parse."""
+    try:
+        return exports.date_range(request)
+    except exports.ExportError as e:
+        messages.error(request, f"{e}, showing every date instead.")
+        return None, None
+
+
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
+@query_budget(8, role="manager")
 def profit_loss_report_for_rice_to_manager(request):
-    report_data = []
-    # Find the manager who buy rice from another manager
-    selling_rice_to_manager = PurchaseRice.objects.filter(
-        rice__manager=request.user, status="Successful"
-    ).order_by("-purchase_date")
-    Owner_manager = PurchaseRice.objects.filter(
-        status="Successful"
-    ).order_by("-purchase_date")
-   
-    for selling in Owner_manager:
-        selling_rice = RiceStock.objects.get(manager=selling.manager,rice_name = selling.rice.rice_name)
-        for row in selling_rice_to_manager:     
-            if row.manager.managerprofile.full_name == selling_rice.manager.managerprofile.full_name:
-                buying_cost_per_kg = 0
-                try:
-                    stock = RiceStock.objects.get(manager=request.user, rice_name=row.rice.rice_name)
-                    buying_cost_per_kg = stock.average_price_per_kg
-                except RiceStock.DoesNotExist:
-                    buying_cost_per_kg = Decimal('0.00')
-
-                # print("buying_cost_per_kg= ",buying_cost_per_kg)
-                quantity = Decimal(str(row.quantity_purchased))
-                total_buying_cost = buying_cost_per_kg * quantity
-                
-                selling_price = Decimal(str(row.total_price)) -Decimal(str(row.delivery_cost))
-                buying_price_per_kg = selling_price//quantity
-                # print(buying_price_per_kg)
-                selling_price_per_kg = selling_price / quantity
-                profit_or_loss = selling_price - total_buying_cost
-                profit_or_loss_abs = abs(profit_or_loss)
-                report_data.append({
-                    "row": row,
-                    "cost_per_kg": buying_cost_per_kg,
-                    "selling_price":selling_price,
-                    "selling_price_per_kg":selling_price_per_kg,
-                    "total_cost": total_buying_cost,
-                    "profit_or_loss": profit_or_loss,
-                    "profit_or_loss_abs": profit_or_loss_abs
-                })
-            
+    start, end = report_dates(request)
+    sales = exports.filter_dates(profit.manager_sales_report(request.user), "purchase_date", start, end)
+    totals = profit.report_totals(profit.manager_sales_by_variety(sales))
+    paginator = Paginator(sales, PROFIT_REPORT_PAGE_SIZE)
+    # the totals query already counted the sales
+    paginator.count = totals["count"]
+    page = paginator.get_page(request.GET.get("page"))
+    # pick the page's sales first, then price only those: sorting priced rows would price every sale.
+    # The ids are read into a list because MySQL rejects a LIMIT inside IN (...)
+    page.object_list = sales.filter(pk__in=list(page.object_list.values_list("pk", flat=True)))
+
     context = {
-                    "check": 1,
-                    "report_data": report_data if report_data else '',
-                }
-    return render(request, "manager/stock/profit_loss_report.html", context)    
+        "check": 1,
+        "page": page,
+        "totals": totals,
+        "start": start,
+        "end": end,
+    }
+    return render(request, "manager/stock/profit_loss_report.html", context)
 
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
+@query_budget(10, role="manager")
 def profit_loss_report_for_rice_to_customer(request):
-    # ✅ Get all successful sales made by this manager to customers
-    selling_rice_to_customer = Purchase_Rice.objects.filter(
-        rice__manager=request.user, status="Successful"
-    ).order_by("-purchase_date")
-
-    report_data = []
-
-    for row in selling_rice_to_customer:
-        try:
-            # ✅ Get the stock record from which the manager sold this rice
-            stock = RiceStock.objects.get(manager=request.user, rice_name=row.rice.rice_name)
-            cost_per_kg = Decimal(str(stock.average_price_per_kg))
-        except RiceStock.DoesNotExist:
-            cost_per_kg = Decimal('0.00')
-        # print(cost_per_kg)
-
-        quantity = Decimal(str(row.quantity_purchased))
-
-        total_cost = cost_per_kg * quantity
-        selling_price = Decimal(str(row.total_price))-Decimal(str(row.delivery_cost))
-        selling_price_per_kg = selling_price/quantity
-        if row.rice.rice_name == "Amon":
-            print(row.total_price)
-        profit_or_loss = selling_price - total_cost
-        profit_or_loss_abs = abs(profit_or_loss)
-
-        report_data.append({
-            "row": row,
-            "cost_per_kg": cost_per_kg,
-            "selling_price":selling_price,
-            "selling_price_per_kg":selling_price_per_kg,
-            "total_cost": total_cost,
-            "profit_or_loss": profit_or_loss,
-            "profit_or_loss_abs": profit_or_loss_abs
-        })
+    # margins are stored on the sales (manager.signals, recompute_customer_margins), never priced here
+    start, end = report_dates(request)
+    sales = exports.filter_dates(profit.customer_sales_report(request.user), "purchase_date", start, end)
+    varieties = list(profit.customer_sales_by_variety(sales))
+    totals = profit.report_totals(varieties)
+    paginator = Paginator(sales, PROFIT_REPORT_PAGE_SIZE)
+    paginator.count = totals["count"]
+    page = paginator.get_page(request.GET.get("page"))
+    page.object_list = sales.filter(pk__in=list(page.object_list.values_list("pk", flat=True)))
 
     context = {
         "check": 2,
-        "report_data": report_data,
+        "page": page,
+        "page_totals": profit.report_totals(profit.customer_sales_by_variety(page.object_list)) if totals["count"] else None,
+        "totals": totals,
+        "varieties": varieties,
+        "start": start,
+        "end": end,
     }
-
     return render(request, "manager/stock/profit_loss_report.html", context)
 
-from django.template.loader import render_to_string
-from xhtml2pdf import pisa
-
-# helper to convert html -> pdf
-def render_to_pdf(template_src, context_dict={}):
-    html_string = render_to_string(template_src, context_dict)
-    response = HttpResponse(content_type='application/pdf')
-    pisa_status = pisa.CreatePDF(html_string, dest=response)
-    if pisa_status.err:
-        return HttpResponse("Error generating PDF", status=500)
-    return response
-
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
 def download_receipt_for_buying_paddy_for_manager(request, id):
-    paddy = get_object_or_404(Purchase_paddy, id=id, manager=request.user)
-    price_per_kg = float(paddy.total_price - paddy.transport_cost) // float(paddy.quantity_purchased)
-
-    context = {
-        "paddy": paddy,
-        "price_per_kg": price_per_kg,
-    }
-
-    return render_to_pdf("manager/pdf_download/receipt_for_buying_paddy_pdf.html", context)
+    order = get_object_or_404(Purchase_paddy.objects.select_related(*receipts.RECEIPTS["paddy_purchase"].related), id=id, manager=request.user)
+    return receipts.receipt_response("paddy_purchase", order)
 
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
 def download_receipt_for_buying_rice_for_manager(request, id):
-    rice = get_object_or_404(PurchaseRice, id=id, manager=request.user)
-    price_per_kg = float(rice.total_price - rice.delivery_cost) // float(rice.quantity_purchased)
-
-    context = {
-        "rice": rice,
-        "price_per_kg": price_per_kg,
-    }
-
-    return render_to_pdf("manager/pdf_download/receipt_for_buying_rice_pdf.html", context)
+    order = get_object_or_404(PurchaseRice.objects.select_related(*receipts.RECEIPTS["rice_purchase"].related), id=id, manager=request.user)
+    return receipts.receipt_response("rice_purchase", order)
 
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
 def download_receipt_for_selling_rice_to_customer_for_manager(request, id):
-    rice = get_object_or_404(Purchase_Rice, id=id, rice__manager=request.user)
-    price_per_kg = float(rice.total_price - rice.delivery_cost) // float(rice.quantity_purchased)
-
-    context = {
-        "rice": rice,
-        "price_per_kg": price_per_kg,
-    }
-
-    return render_to_pdf("manager/pdf_download/receipt_for_selling_to_cuatomer_rice_pdf.html", context)
+    order = get_object_or_404(Purchase_Rice.objects.select_related(*receipts.RECEIPTS["rice_sale_to_customer"].related), id=id, rice__manager=request.user)
+    return receipts.receipt_response("rice_sale_to_customer", order)
 
 @login_required(login_url="login")
 @user_passes_test(check_manager_and_admin)
 def download_receipt_for_selling_rice_to_others_manager_for_manager(request, id):
-    rice = get_object_or_404(PurchaseRice, id=id, rice__manager=request.user)
-    price_per_kg = float(rice.total_price - rice.delivery_cost) // float(rice.quantity_purchased)
-
-    context = {
-        "rice": rice,
-        "price_per_kg": price_per_kg,
-    }
-
-    return render_to_pdf("manager/pdf_download/receipt_for_selling_rice_to_manager_pdf.html", context)
+    order = get_object_or_404(PurchaseRice.objects.select_related(*receipts.RECEIPTS["rice_sale_to_manager"].related), id=id, rice__manager=request.user)
+    return receipts.receipt_response("rice_sale_to_manager", order)
 